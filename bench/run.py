@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import asyncio
+import importlib.util
+import platform
+import tempfile
+import argparse
+import threading
+import statistics
+import subprocess
+import contextlib
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKING_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(WORKING_DIR, 'scripts'))
+
+import logParser
+import statsRollup
+import sessions
+import threatIntel
+import blocklist
+from multiServer import MelissaeServer
+from generators import GeneratorConfig, GENERATORS, write_honeypot_logs, modbus_requests
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+MODBUS_SERVER = os.path.join(WORKING_DIR, 'modules/modbus/server/server.py')
+API_KEY = 'melissae-bench'
+
+PARSERS = {
+    'ssh_auth': logParser.process_ssh_auth,
+    'ssh_commands': logParser.process_ssh_commands,
+    'ftp': logParser.process_ftp,
+    'http': logParser.process_http,
+    'modbus': logParser.process_modbus,
+    'modbus_events': logParser.process_modbus_events
+}
+
+# Helpers
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=WORKING_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+@contextlib.contextmanager
+def sandbox(tmp_dir: str):
+    """Point logParser, the rollup, the sessions and the blocklist feeds at a scratch directory instead of the real tree"""
+    saved = (logParser.WORKING_DIR, logParser.FINAL_OUTPUT, logParser.NEW_LOGS_OUTPUT, logParser.update_rollup, logParser.update_sessions, threatIntel.update_feeds)
+    logParser.WORKING_DIR = tmp_dir
+    logParser.FINAL_OUTPUT = os.path.join(tmp_dir, 'dashboard/json/logs.json')
+    logParser.NEW_LOGS_OUTPUT = os.path.join(tmp_dir, 'dashboard/json/new-logs.ndjson')
+    logParser.update_rollup = lambda logs, sources: statsRollup.update_rollup(
+        logs,
+        sources,
+        os.path.join(tmp_dir, 'dashboard/json/stats.json'),
+        os.path.join(tmp_dir, 'dashboard/json/stats-state.json')
+    )
+    logParser.update_sessions = lambda logs, sources: sessions.update_sessions(
+        logs,
+        sources,
+        os.path.join(tmp_dir, 'dashboard/json/sessions.json'),
+        os.path.join(tmp_dir, 'dashboard/json/sessions-state.json')
+    )
+    threatIntel.update_feeds = lambda threats, source: blocklist.update_feeds(threats, source, os.path.join(tmp_dir, 'feeds'))
+    try:
+        yield
+    finally:
+        logParser.WORKING_DIR, logParser.FINAL_OUTPUT, logParser.NEW_LOGS_OUTPUT, logParser.update_rollup, logParser.update_sessions, threatIntel.update_feeds = saved
+
+def parse_all() -> List[Dict]:
+    logs = []
+    for process in PARSERS.values():
+        logs.extend(process())
+    return logs
+
+# Parser throughput, sources with a bytes path are measured with both readers
+def bench_parsers(config: GeneratorConfig, repeat: int) -> Dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir, sandbox(tmp_dir):
+        for name, generate in GENERATORS.items():
+            spec = logParser.PATTERNS[name]
+            path = os.path.join(tmp_dir, spec['source'])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(generate(config, config.volume)))
+                f.write('\n')
+
+            readers = ['text', 'mmap'] if 'bytes_pattern' in spec else [None]
+            for reader in readers:
+                logParser.READER = reader
+                timings = []
+                parsed = 0
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    parsed = len(PARSERS[name]())
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                key = name if reader in (None, spec.get('reader', 'text')) else f"{name}_{reader}"
+                results[key] = {
+                    "lines": config.volume,
+                    "parsed": parsed,
+                    "seconds": round(best, 4),
+                    "lines_per_sec": round(config.volume / best) if best else 0
+                }
+                print(f"[INFO] {key:<17} {results[key]['lines_per_sec']:>10} lines/s")
+        logParser.READER = None
+    return results
+
+# logParser -> threatIntel latency
+def bench_pipeline(config: GeneratorConfig) -> Dict:
+    sources = {name: spec['source'] for name, spec in logParser.PATTERNS.items()}
+    with tempfile.TemporaryDirectory() as tmp_dir, sandbox(tmp_dir):
+        counts = write_honeypot_logs(config, tmp_dir, sources)
+        logs_path = Path(logParser.FINAL_OUTPUT)
+        threats_path = Path(tmp_dir) / 'dashboard/json/threats.json'
+
+        start = time.perf_counter()
+        logs = parse_all()
+        parsed = time.perf_counter()
+        logParser.merge_and_save(logs)
+        merged = time.perf_counter()
+        threatIntel.process_logs(logs_path, threats_path)
+        done = time.perf_counter()
+
+        with threats_path.open('r', encoding='utf-8') as f:
+            threats = len(json.load(f))
+
+    result = {
+        "lines": sum(counts.values()),
+        "entries": len(logs),
+        "threats": threats,
+        "parse_seconds": round(parsed - start, 4),
+        "merge_seconds": round(merged - parsed, 4),
+        "threat_intel_seconds": round(done - merged, 4),
+        "total_seconds": round(done - start, 4)
+    }
+    print(f"[INFO] pipeline      {result['total_seconds']:>10}s for {result['lines']} lines")
+    return result
+
+# Multi-instance server
+def start_server(data_dir: str):
+    config_path = os.path.join(data_dir, 'bench-config.json')
+    with open(config_path, 'w') as f:
+        # The per-IP rate limit would cap every agent of the benchmark at 60 requests/min
+        json.dump({"server": {"api_key": API_KEY, "rate_limit": 10 ** 9}}, f)
+    server = MelissaeServer(config_path, os.path.join(data_dir, 'instances'))
+    http_server = server.create_http_server('127.0.0.1', 0)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    return server, http_server, f"http://127.0.0.1:{http_server.server_address[1]}"
+
+def instance_payload(instance_id: str, logs: List[Dict], threats: List[Dict]) -> Dict:
+    return {
+        "instance_id": instance_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "timezone": "UTC",
+        "hostname": f"bench-{instance_id[-4:]}",
+        "logs": logs,
+        "threats": threats,
+        "stats": {"log_count": len(logs), "threat_count": len(threats)}
+    }
+
+def generate_instance_data(config: GeneratorConfig) -> tuple:
+    sources = {name: spec['source'] for name, spec in logParser.PATTERNS.items()}
+    with tempfile.TemporaryDirectory() as tmp_dir, sandbox(tmp_dir):
+        write_honeypot_logs(config, tmp_dir, sources)
+        logParser.merge_and_save(parse_all())
+        logs_path = Path(logParser.FINAL_OUTPUT)
+        threats_path = Path(tmp_dir) / 'dashboard/json/threats.json'
+        threatIntel.process_logs(logs_path, threats_path)
+        with logs_path.open('r', encoding='utf-8') as f:
+            logs = json.load(f)
+        with threats_path.open('r', encoding='utf-8') as f:
+            threats = json.load(f)
+    return logs, threats
+
+def post(url: str, body: bytes, instance_id: str = '') -> float:
+    request = urllib.request.Request(f"{url}/api/data", data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {API_KEY}',
+        'X-Instance-ID': instance_id
+    })
+    start = time.perf_counter()
+    while True:
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+            return time.perf_counter() - start
+        except urllib.error.HTTPError as e:
+            # Ingest queue full, the wait counts in the upload latency
+            if e.code != 503:
+                raise
+            time.sleep(0.05)
+
+def bench_ingest(config: GeneratorConfig, agents: int, uploads: int) -> Dict:
+    logs, threats = generate_instance_data(config)
+    bodies = [
+        json.dumps(instance_payload(f"bench-agent-{i:04d}", logs, threats)).encode('utf-8')
+        for i in range(agents)
+    ]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def agent(instance_id: str, body: bytes):
+        for i in range(uploads):
+            try:
+                # Trailing whitespace keeps the JSON valid and makes each upload distinct, identical bodies are deduplicated
+                elapsed = post(url, body + b' ' * i, instance_id)
+                with lock:
+                    latencies.append(elapsed)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    with tempfile.TemporaryDirectory() as data_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        server, http_server, url = start_server(data_dir)
+        threads = [threading.Thread(target=agent, args=(f"bench-agent-{i:04d}", body)) for i, body in enumerate(bodies)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Uploads are answered once queued, throughput counts until they are all stored
+        server.ingest.drain()
+        elapsed = time.perf_counter() - start
+        http_server.shutdown()
+        http_server.server_close()
+
+    requests_done = len(latencies)
+    result = {
+        "agents": agents,
+        "uploads_per_agent": uploads,
+        "logs_per_upload": len(logs),
+        "payload_bytes": len(bodies[0]) if bodies else 0,
+        "errors": len(errors),
+        "seconds": round(elapsed, 4),
+        "requests_per_sec": round(requests_done / elapsed, 2) if elapsed else 0,
+        "logs_per_sec": round(requests_done * len(logs) / elapsed) if elapsed else 0,
+        "latency_p50": round(percentile(latencies, 50), 4),
+        "latency_p95": round(percentile(latencies, 95), 4)
+    }
+    print(f"[INFO] ingest        {result['requests_per_sec']:>10} req/s with {agents} agents ({result['errors']} errors)")
+    return result
+
+def bench_aggregated(config: GeneratorConfig, history_sizes: List[int], instances: int, repeat: int) -> Dict:
+    results = {}
+    for size in history_sizes:
+        per_instance = GeneratorConfig(size // instances, config.ips, config.attack_ratio, config.seed, config.mix)
+        logs, threats = generate_instance_data(per_instance)
+        latencies = []
+        response_bytes = 0
+        with tempfile.TemporaryDirectory() as data_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            server, http_server, url = start_server(data_dir)
+            for i in range(instances):
+                server.store_instance_data(instance_payload(f"bench-history-{i:04d}", logs, threats))
+            request = urllib.request.Request(f"{url}/api/aggregated", headers={'Authorization': f'Bearer {API_KEY}'})
+            for _ in range(repeat):
+                start = time.perf_counter()
+                with urllib.request.urlopen(request, timeout=300) as response:
+                    response_bytes = len(response.read())
+                latencies.append(time.perf_counter() - start)
+            http_server.shutdown()
+            http_server.server_close()
+        results[str(size)] = {
+            "instances": instances,
+            "logs": len(logs) * instances,
+            "response_bytes": response_bytes,
+            "latency_median": round(statistics.median(latencies), 4),
+            "latency_p95": round(percentile(latencies, 95), 4)
+        }
+        print(f"[INFO] aggregated    {results[str(size)]['latency_median']:>10}s median for {results[str(size)]['logs']} logs")
+    return results
+
+# Modbus honeypot
+def load_modbus_server():
+    spec = importlib.util.spec_from_file_location('modbus_server', MODBUS_SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def modbus_traffic(modbus, clients: int, requests: List[tuple], depth: int) -> tuple:
+    honeypot = modbus.ModbusHoneypot('siemens')
+    server = await asyncio.start_server(modbus.ModbusTCPServer(honeypot).handle_client, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        # Each client pipelines `depth` requests, then waits for all their responses
+        for start in range(0, len(requests), depth):
+            window = requests[start:start + depth]
+            sent = time.perf_counter()
+            writer.write(b''.join(frame for frame, _ in window))
+            await reader.readexactly(sum(size for _, size in window))
+            latencies.append(time.perf_counter() - sent)
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return elapsed, latencies
+
+def bench_modbus(config: GeneratorConfig, clients: int, count: int, write_ratio: float, depth: int) -> Dict:
+    modbus = load_modbus_server()
+    requests = modbus_requests(config.seed, count, write_ratio)
+    elapsed, latencies = asyncio.run(modbus_traffic(modbus, clients, requests, depth))
+    total = clients * count
+    result = {
+        "clients": clients,
+        "requests_per_client": count,
+        "write_ratio": write_ratio,
+        "pipeline_depth": depth,
+        "seconds": round(elapsed, 4),
+        "requests_per_sec": round(total / elapsed) if elapsed else 0,
+        "window_latency_p50": round(percentile(latencies, 50), 5),
+        "window_latency_p95": round(percentile(latencies, 95), 5)
+    }
+    print(f"[INFO] modbus        {result['requests_per_sec']:>10} req/s with {clients} clients")
+    return result
+
+# Regression comparison
+def flatten(data: Dict, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def compare(baseline_path: str, results: Dict) -> None:
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n[INFO] Compared with {baseline.get('meta', {}).get('commit', '?')} ({baseline_path})")
+    old = flatten(baseline.get('results', {}))
+    new = flatten(results.get('results', {}))
+    for key in sorted(old.keys() & new.keys()):
+        if old[key] == new[key] or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        print(f"  {key:<50} {old[key]:>12} -> {new[key]:<12} ({change:+.1f}%)")
+
+# Main
+def main():
+    parser = argparse.ArgumentParser(description='Melissae performance benchmarks')
+    parser.add_argument('--volume', type=int, default=20000, help='Lines generated per log format')
+    parser.add_argument('--ips', type=int, default=500, help='Distinct attacker IPs')
+    parser.add_argument('--attack-ratio', type=float, default=0.3, help='Share of hostile lines (0-1)')
+    parser.add_argument('--seed', type=int, default=1, help='Generator seed')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement')
+    parser.add_argument('--agents', type=int, default=4, help='Concurrent agents for the ingest benchmark')
+    parser.add_argument('--uploads', type=int, default=5, help='Uploads per agent for the ingest benchmark')
+    parser.add_argument('--history', default='1000,10000,50000', help='Comma separated history sizes for /api/aggregated')
+    parser.add_argument('--instances', type=int, default=2, help='Instances the history is spread over')
+    parser.add_argument('--modbus-clients', type=int, default=10, help='Concurrent clients for the Modbus benchmark')
+    parser.add_argument('--modbus-requests', type=int, default=5000, help='Requests per Modbus client')
+    parser.add_argument('--modbus-depth', type=int, default=16, help='Requests pipelined per Modbus round trip')
+    parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of Modbus write requests (0-1)')
+    parser.add_argument('--only', default='parsers,pipeline,ingest,aggregated,modbus', help='Comma separated benchmarks to run')
+    parser.add_argument('--output', help='Results file (default: bench/results/<timestamp>-<commit>.json)')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    config = GeneratorConfig(args.volume, args.ips, args.attack_ratio, args.seed)
+    selected = {name.strip() for name in args.only.split(',') if name.strip()}
+    results = {}
+
+    if 'parsers' in selected:
+        results['parsers'] = bench_parsers(config, args.repeat)
+    if 'pipeline' in selected:
+        results['pipeline'] = bench_pipeline(config)
+    if 'ingest' in selected:
+        results['ingest'] = bench_ingest(config, args.agents, args.uploads)
+    if 'aggregated' in selected:
+        sizes = [int(size) for size in args.history.split(',') if size.strip()]
+        results['aggregated'] = bench_aggregated(config, sizes, args.instances, args.repeat)
+    if 'modbus' in selected:
+        results['modbus'] = bench_modbus(config, args.modbus_clients, args.modbus_requests, args.write_ratio, args.modbus_depth)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "generator": config.to_dict(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Results saved to {output}")
+
+    if args.compare:
+        compare(args.compare, report)
+
+if __name__ == "__main__":
+    main()
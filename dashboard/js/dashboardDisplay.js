@@ -1,16 +1,30 @@
-let logs = [];
+let stats = null;
+let charts = {};
+let renderTimer = null;
+let reloadTimer = null;
+
+// stats.json is rewritten by the parser run that published the events, reloaded this long after a burst
+const STATS_RELOAD_DELAY = 2000;
+
+// Collector event stream (scripts/eventStream.py)
+const STREAM_PORT = 8889;
 
 window.redirectToSearch = function(searchTerm) {
     window.location.href = `search.html?search=${encodeURIComponent(searchTerm)}`;
 };
 
-async function loadLogs() {
+async function loadStats() {
     try {
-        const response = await fetch('json/logs.json');
-        if (!response.ok) throw new Error('File not found');
-        logs = await response.json();
+        // Pre-aggregated rollup written by logParser.py, constant size regardless of history
+        const response = await fetch('json/stats.json');
+        if (response.ok) {
+            stats = await response.json();
+        } else {
+            stats = await rollupFromLogs();
+        }
         generateStatistics();
         renderCharts();
+        connectStream();
     } catch (error) {
         console.error('Error:', error);
         document.getElementById('statsGrid').innerHTML = `
@@ -21,70 +35,177 @@ async function loadLogs() {
     }
 }
 
+// Live deltas, the page keeps working without the stream
+let stream = null;
+function connectStream() {
+    if (!window.EventSource || stream) return;
+
+    let opened = false;
+    stream = new EventSource(`http://${window.location.hostname}:${STREAM_PORT}/api/stream`);
+    stream.onopen = () => { opened = true; };
+    stream.onerror = () => {
+        if (!opened) {
+            stream.close();
+            stream = null;
+        }
+    };
+    stream.addEventListener('log', (e) => {
+        applyLog(JSON.parse(e.data));
+        scheduleRender();
+        scheduleReload();
+    });
+    stream.addEventListener('reset', reloadStats);
+}
+
+// Counters move at once, unique IPs and the top list come with the next reload of the server rollup
+function applyLog(log) {
+    const action = log.action || '';
+    stats.total = (stats.total || 0) + 1;
+    stats.protocols[log.protocol] = (stats.protocols[log.protocol] || 0) + 1;
+    if (log.protocol === 'ssh' || log.protocol === 'ftp') {
+        if (action === 'Login successful') stats.counters[`${log.protocol}_login_success`]++;
+        else if (action.includes('Login failed')) stats.counters[`${log.protocol}_login_failed`]++;
+    } else if (log.protocol === 'modbus') {
+        if (action.includes('Read request')) stats.counters.modbus_reads++;
+        if (action.includes('Write')) stats.counters.modbus_writes++;
+    }
+    const hour = parseInt((log.hour || '').split(':')[0]);
+    if (hour >= 0 && hour < 24) stats.hour_of_day[hour]++;
+}
+
+async function reloadStats() {
+    const response = await fetch('json/stats.json', { cache: 'no-store' });
+    if (response.ok) {
+        stats = await response.json();
+        scheduleRender();
+    }
+}
+
+function scheduleReload() {
+    if (reloadTimer) return;
+    reloadTimer = setTimeout(() => {
+        reloadTimer = null;
+        reloadStats().catch(error => console.error('Error:', error));
+    }, STATS_RELOAD_DELAY);
+}
+
+function scheduleRender() {
+    if (renderTimer) return;
+    renderTimer = setTimeout(() => {
+        renderTimer = null;
+        generateStatistics();
+        renderCharts();
+    }, 1000);
+}
+
+// Fallback when stats.json has not been generated yet
+async function rollupFromLogs() {
+    const response = await fetch('json/logs.json');
+    if (!response.ok) throw new Error('File not found');
+    const logs = await response.json();
+
+    const rollup = {
+        total: logs.length,
+        unique_ips: new Set(logs.map(log => log.ip)).size,
+        protocols: { ssh: 0, ftp: 0, http: 0, modbus: 0 },
+        counters: {
+            ssh_login_success: 0,
+            ssh_login_failed: 0,
+            ftp_login_success: 0,
+            ftp_login_failed: 0,
+            modbus_reads: 0,
+            modbus_writes: 0
+        },
+        hour_of_day: new Array(24).fill(0),
+        top: { ip: [] }
+    };
+    const ipCounts = {};
+
+    logs.forEach(log => {
+        rollup.protocols[log.protocol] = (rollup.protocols[log.protocol] || 0) + 1;
+        if (log.protocol === 'ssh' || log.protocol === 'ftp') {
+            if (log.action === 'Login successful') rollup.counters[`${log.protocol}_login_success`]++;
+            else if (log.action.includes('Login failed')) rollup.counters[`${log.protocol}_login_failed`]++;
+        } else if (log.protocol === 'modbus') {
+            if (log.action.includes('Read request')) rollup.counters.modbus_reads++;
+            if (log.action.includes('Write')) rollup.counters.modbus_writes++;
+        }
+        rollup.hour_of_day[parseInt(log.hour.split(':')[0])]++;
+        ipCounts[log.ip] = (ipCounts[log.ip] || 0) + 1;
+    });
+
+    rollup.top.ip = Object.entries(ipCounts)
+        .sort((a, b) => b[1] - a[1])
+        .slice(0, 10);
+    return rollup;
+}
+
 // Modules statistics
 function generateStatistics() {
-    const stats = {
-        totalLogs: logs.length,
-        sshLogs: logs.filter(log => log.protocol === 'ssh').length,
-        ftpLogs: logs.filter(log => log.protocol === 'ftp').length,
-        uniqueIPs: new Set(logs.map(log => log.ip)).size,
-        httpLogs: logs.filter(log => log.protocol === 'http').length,
-        modbusLogs: logs.filter(log => log.protocol === 'modbus').length,
-        successSSHLogins: logs.filter(log => log.action === 'Login successful' && log.protocol === 'ssh').length,
-        successFTPLogins: logs.filter(log => log.action === 'Login successful' && log.protocol === 'ftp').length,
-        failedSSHAttempts: logs.filter(log => log.action.includes('Login failed') && log.protocol === 'ssh').length,
-        failedFTPAttempts: logs.filter(log => log.action.includes('Login failed') && log.protocol === 'ftp').length,
-        modbusReads: logs.filter(log => log.protocol === 'modbus' && log.action.includes('Read request')).length,
-        modbusWrites: logs.filter(log => log.protocol === 'modbus' && log.action.includes('Write')).length
+    const counters = stats.counters || {};
+    const protocols = stats.protocols || {};
+    const summary = {
+        totalLogs: stats.total || 0,
+        sshLogs: protocols.ssh || 0,
+        ftpLogs: protocols.ftp || 0,
+        uniqueIPs: stats.unique_ips || 0,
+        httpLogs: protocols.http || 0,
+        modbusLogs: protocols.modbus || 0,
+        successSSHLogins: counters.ssh_login_success || 0,
+        successFTPLogins: counters.ftp_login_success || 0,
+        failedSSHAttempts: counters.ssh_login_failed || 0,
+        failedFTPAttempts: counters.ftp_login_failed || 0,
+        modbusReads: counters.modbus_reads || 0,
+        modbusWrites: counters.modbus_writes || 0
     };
 
     const statsHTML = `
         <div class="stat-card"">
-            <div class="stat-value">${stats.totalLogs}</div>
+            <div class="stat-value">${summary.totalLogs}</div>
             <div class="stat-label">Total Logs</div>
         </div>
         <div class="stat-card"">
-            <div class="stat-value">${stats.uniqueIPs}</div>
+            <div class="stat-value">${summary.uniqueIPs}</div>
             <div class="stat-label">Threat IPs</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('protocol:http')">
-            <div class="stat-value">${stats.httpLogs}</div>
+            <div class="stat-value">${summary.httpLogs}</div>
             <div class="stat-label">HTTP Logs</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('protocol:ssh')">
-            <div class="stat-value">${stats.sshLogs}</div>
+            <div class="stat-value">${summary.sshLogs}</div>
             <div class="stat-label">SSH Logs</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('protocol:ftp')">
-            <div class="stat-value">${stats.ftpLogs}</div>
+            <div class="stat-value">${summary.ftpLogs}</div>
             <div class="stat-label">FTP Logs</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('protocol:modbus')">
-            <div class="stat-value">${stats.modbusLogs}</div>
+            <div class="stat-value">${summary.modbusLogs}</div>
             <div class="stat-label">Modbus Logs</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('action:failed and protocol:ssh')">
-            <div class="stat-value">${stats.failedSSHAttempts}</div>
+            <div class="stat-value">${summary.failedSSHAttempts}</div>
             <div class="stat-label">Failed SSH Logins</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('action:failed and protocol:ftp')">
-            <div class="stat-value">${stats.failedFTPAttempts}</div>
+            <div class="stat-value">${summary.failedFTPAttempts}</div>
             <div class="stat-label">Failed FTP Logins</div>
         </div>
         <div class="stat-card" onclick="redirectToSearch('action:read and protocol:modbus')">
-            <div class="stat-value">${stats.modbusReads}</div>
+            <div class="stat-value">${summary.modbusReads}</div>
             <div class="stat-label">Modbus Reads</div>
         </div>
-        <div class="stat-card ${stats.successSSHLogins > 0 ? 'alert' : 'success'}" onclick="redirectToSearch('action:successful and protocol:ssh')">
-            <div class="stat-value">${stats.successSSHLogins}</div>
+        <div class="stat-card ${summary.successSSHLogins > 0 ? 'alert' : 'success'}" onclick="redirectToSearch('action:successful and protocol:ssh')">
+            <div class="stat-value">${summary.successSSHLogins}</div>
             <div class="stat-label">Successful SSH Logins</div>
         </div>
-        <div class="stat-card ${stats.successFTPLogins > 0 ? 'alert' : 'success'}" onclick="redirectToSearch('action:successful and protocol:ftp')">
-            <div class="stat-value">${stats.successFTPLogins}</div>
+        <div class="stat-card ${summary.successFTPLogins > 0 ? 'alert' : 'success'}" onclick="redirectToSearch('action:successful and protocol:ftp')">
+            <div class="stat-value">${summary.successFTPLogins}</div>
             <div class="stat-label">Successful FTP Logins</div>
         </div>
-        <div class="stat-card ${stats.modbusWrites > 0 ? 'alert' : 'success'}" onclick="redirectToSearch('action:write and protocol:modbus')">
-            <div class="stat-value">${stats.modbusWrites}</div>
+        <div class="stat-card ${summary.modbusWrites > 0 ? 'alert' : 'success'}" onclick="redirectToSearch('action:write and protocol:modbus')">
+            <div class="stat-value">${summary.modbusWrites}</div>
             <div class="stat-label">Modbus Writes</div>
         </div>
     `;
@@ -95,14 +216,11 @@ function generateStatistics() {
 // Charts 
 function renderCharts() {
     const hours = Array.from({length: 24}, (_, i) => `${i}h`);
-    const activityData = new Array(24).fill(0);
-    
-    logs.forEach(log => {
-        const hour = parseInt(log.hour.split(':')[0]);
-        activityData[hour]++;
-    });
+    const activityData = stats.hour_of_day || new Array(24).fill(0);
+
+    Object.values(charts).forEach(chart => chart.destroy());
 
-    new Chart(document.getElementById('activityChart'), {
+    charts.activity = new Chart(document.getElementById('activityChart'), {
         type: 'line',
         data: {
             labels: hours,
@@ -144,14 +262,15 @@ function renderCharts() {
         }
     });
 
+    const protocols = stats.protocols || {};
     const protocolData = {
-        ssh: logs.filter(log => log.protocol === 'ssh').length,
-        ftp: logs.filter(log => log.protocol === 'ftp').length,
-        http: logs.filter(log => log.protocol === 'http').length,
-        modbus: logs.filter(log => log.protocol === 'modbus').length
+        ssh: protocols.ssh || 0,
+        ftp: protocols.ftp || 0,
+        http: protocols.http || 0,
+        modbus: protocols.modbus || 0
     };
 
-    new Chart(document.getElementById('protocolChart'), {
+    charts.protocols = new Chart(document.getElementById('protocolChart'), {
         type: 'doughnut',
         data: {
             labels: ['SSH', 'FTP', 'HTTP', 'Modbus'],
@@ -169,21 +288,14 @@ function renderCharts() {
         }
     });
 
-    const ipCounts = logs.reduce((acc, log) => {
-        acc[log.ip] = (acc[log.ip] || 0) + 1;
-        return acc;
-    }, {});
-
-    const sortedIPs = Object.entries(ipCounts)
-        .sort((a, b) => b[1] - a[1])
-        .slice(0, 5);
+    const sortedIPs = (stats.top?.ip || []).slice(0, 5);
 
     const ipsData = {
         labels: sortedIPs.map(ip => ip[0]),
         counts: sortedIPs.map(ip => ip[1])
     };
 
-    new Chart(document.getElementById('ipsChart'), {
+    charts.ips = new Chart(document.getElementById('ipsChart'), {
         type: 'doughnut',
         data: {
             labels: ipsData.labels,
@@ -212,4 +324,4 @@ function renderCharts() {
     });
 }
 
-loadLogs();
+loadStats();
@@ -1,8 +1,10 @@
-import { loadLogs, setupSearch } from './searchEngine.js';
+import { loadLogs, setupSearch, exportResults } from './searchEngine.js';
 import { displayResults, setupExportButton } from './searchDisplay.js';
 
 loadLogs();
-setupSearch((filteredLogs, searchTerms) => {
-    displayResults(filteredLogs, searchTerms);
-    setupExportButton(filteredLogs);
+setupSearch({
+    onResults: (source, searchTerms) => {
+        displayResults(source, searchTerms);
+        setupExportButton(source.count(), exportResults);
+    }
 });
\ No newline at end of file
@@ -1,3 +1,5 @@
+import { VirtualTable, ArraySource } from './virtualTable.js';
+
 let aggregatedLogs = [];
 let aggregatedThreats = [];
 let instancesData = [];
@@ -11,6 +13,9 @@ class MultiInstanceDashboard {
     constructor() {
         this.serverURL = this.detectServerURL();
         this.apiKey = null;
+        this.threatsTable = null;
+        this.stream = null;
+        this.updateTimer = null;
         this.setupEventListeners();
         this.loadConfig();
     }
@@ -38,7 +43,75 @@ class MultiInstanceDashboard {
             console.warn('Could not load multi-instance config, using defaults');
         }
         
-        this.loadData();
+        await this.loadData();
+        this.connectStream();
+    }
+
+    // Live deltas from the multi-instance server instead of re-downloading /api/aggregated
+    async connectStream() {
+        if (!this.apiKey || !window.EventSource || this.stream) return;
+
+        // EventSource cannot send the API key in a header, the URL carries a short-lived stream token instead
+        let token;
+        try {
+            const response = await fetch(`${this.serverURL}/api/stream/token`, {
+                headers: { 'Authorization': `Bearer ${this.apiKey}` }
+            });
+            if (!response.ok) return;
+            token = (await response.json()).token;
+        } catch (error) {
+            return;
+        }
+        if (this.stream) return;
+
+        let opened = false;
+        this.stream = new EventSource(`${this.serverURL}/api/stream?token=${encodeURIComponent(token)}`);
+        this.stream.onopen = () => { opened = true; };
+        this.stream.onerror = () => {
+            if (this.stream.readyState !== EventSource.CLOSED && opened) return;
+            // Refused, or the token expired before a reconnect: start over with a new token and full data
+            this.stream.close();
+            this.stream = null;
+            if (opened) {
+                setTimeout(() => this.loadData().then(() => this.connectStream()), 5000);
+            }
+        };
+        this.stream.addEventListener('log', (e) => {
+            aggregatedLogs.push(JSON.parse(e.data));
+            this.scheduleUpdate();
+        });
+        this.stream.addEventListener('verdict', (e) => {
+            this.applyVerdictChange(JSON.parse(e.data));
+            this.scheduleUpdate();
+        });
+        this.stream.addEventListener('reset', () => this.loadData());
+    }
+
+    applyVerdictChange(change) {
+        const threat = aggregatedThreats.find(t =>
+            t.ip === change.ip && (t.instance_id || 'local') === change.instance_id
+        );
+        if (threat) {
+            threat.verdict = change.verdict;
+            threat['protocol-score'] = change['protocol-score'];
+            return;
+        }
+        aggregatedThreats.push({
+            type: 'ip',
+            ip: change.ip,
+            'protocol-score': change['protocol-score'],
+            verdict: change.verdict,
+            instance_id: change.instance_id,
+            hostname: change.hostname
+        });
+    }
+
+    scheduleUpdate() {
+        if (this.updateTimer) return;
+        this.updateTimer = setTimeout(() => {
+            this.updateTimer = null;
+            this.updateView();
+        }, 2000);
     }
 
     setupEventListeners() {
@@ -146,6 +219,7 @@ class MultiInstanceDashboard {
         this.generateMultiInstanceStatistics();
         this.renderInstancesStatus();
         this.renderCharts();
+        this.renderThreatsTable();
         
         const detailsContainer = document.getElementById('instancesDetails');
         if (currentViewMode === 'by-instance') {
@@ -515,6 +589,36 @@ class MultiInstanceDashboard {
         });
     }
 
+    renderThreatsTable() {
+        if (!this.threatsTable) {
+            this.threatsTable = new VirtualTable(document.getElementById('aggregatedThreatsTable'), {
+                columns: [
+                    {
+                        label: 'IP',
+                        key: 'ip',
+                        render: threat => `<a href="javascript:void(0);" onclick="redirectToSearch('ip:${threat.ip}')">${threat.ip}</a>`
+                    },
+                    {
+                        label: 'Verdict',
+                        key: 'verdict',
+                        sortValue: threat => threat['protocol-score'] || 0,
+                        render: threat => (threat.verdict || 'unknown').toUpperCase()
+                    },
+                    {
+                        label: 'Instances',
+                        key: 'instances',
+                        sortValue: threat => (threat.instances || [threat.instance_id]).length,
+                        render: threat => (threat.instances || [threat.instance_id || 'local']).map(id => String(id).substring(0, 8)).join(', ')
+                    },
+                    { label: 'Activity', key: 'activity_count', render: threat => threat.activity_count || 0 }
+                ],
+                height: 400,
+                emptyText: 'No threats found.'
+            });
+        }
+        this.threatsTable.setSource(new ArraySource(aggregatedThreats));
+    }
+
     formatTimestamp(date) {
         const now = new Date();
         const diff = now - date;
@@ -1,38 +1,31 @@
+import { VirtualTable } from './virtualTable.js';
+
+let highlightPattern = null;
+let resultsTable = null;
+
+const COLUMNS = [
+    { label: 'Protocol', key: 'protocol', render: log => formatProtocol(log.protocol) },
+    { label: 'Date', key: 'date', sortKey: 'time' },
+    { label: 'Hour', key: 'hour', sortKey: 'time' },
+    { label: 'IP', key: 'ip', render: log => highlightText(log.ip) },
+    { label: 'User', key: 'user', render: log => highlightText(log.user || '-') },
+    { label: 'Action', key: 'action', render: log => highlightText(log.action) },
+    { label: 'User-Agent', key: 'user-agent', render: log => highlightText(log["user-agent"] || '-') },
+    { label: 'Path', key: 'path', render: log => highlightText(log.path || '-') }
+];
+
 // Display table
-export function displayResults(filteredLogs, searchTerms) {
+export function displayResults(source, searchTerms) {
     const resultsDiv = document.getElementById('results');
-    const table = resultsDiv.querySelector('.log-table');
-    const tbody = table.querySelector('tbody');
     const noResults = resultsDiv.querySelector('.no-results');
 
-    tbody.innerHTML = '';
-    
-    if (filteredLogs.length === 0) {
-        table.style.display = 'none';
-        noResults.textContent = 'No results found.';
-        noResults.style.display = 'block';
-        return;
+    if (!resultsTable) {
+        resultsTable = new VirtualTable(document.getElementById('resultsTable'), { columns: COLUMNS });
     }
 
-    filteredLogs.forEach(log => {
-        const row = document.createElement('tr');
-        
-        row.innerHTML = `
-            <td>${formatProtocol(log.protocol)}</td>
-            <td>${log.date}</td>
-            <td>${log.hour}</td>
-            <td>${highlightText(log.ip, searchTerms)}</td>
-            <td>${highlightText(log.user || '-', searchTerms)}</td>
-            <td>${highlightText(log.action, searchTerms)}</td>
-            <td>${highlightText(log["user-agent"] || '-', searchTerms)}
-            <td>${highlightText(log.path || '-', searchTerms)}
-        `;
-        
-        tbody.appendChild(row);
-    });
-
-    table.style.display = 'table';
+    highlightPattern = buildHighlightPattern(searchTerms);
     noResults.style.display = 'none';
+    resultsTable.setSource(source);
 }
 
 // Format protocols
@@ -46,25 +39,27 @@ function formatProtocol(protocol) {
     return `<span class="protocol-tag ${colors[protocol] || ''}">${protocol.toUpperCase()}</span>`;
 }
 
-function highlightText(text, terms) {
-    if (!terms || terms.length === 0) return text;
-    
-    terms.forEach(term => {
-        const regex = new RegExp(`(${term})`, 'gi');
-        text = text.replace(regex, '<span class="highlight">$1</span>');
-    });
-    
-    return text;
+// One regex per query instead of one per term per cell
+function buildHighlightPattern(terms) {
+    if (!terms || terms.length === 0) return null;
+    const escaped = terms.map(term => term.replace(/[.*+?^${}()|[\]\\]/g, '\\$&'));
+    return new RegExp(`(${escaped.join('|')})`, 'gi');
+}
+
+function highlightText(text) {
+    if (!highlightPattern) return text;
+    return text.replace(highlightPattern, '<span class="highlight">$1</span>');
 }
 
 // Export button
-export function setupExportButton(filteredLogs) {
+export function setupExportButton(total, fetchResults) {
     const exportButton = document.getElementById('exportButton');
     const searchQuery = document.getElementById('searchInput').value.trim();
     
-    if (filteredLogs.length > 0) {
+    if (total > 0) {
         exportButton.style.display = 'inline-block';
-        exportButton.onclick = () => {
+        exportButton.onclick = async () => {
+            const filteredLogs = await fetchResults();
             const timestamp = new Date().toISOString().replace(/[:.]/g, '-');
             const sanitizedQuery = searchQuery.replace(/[^\w\s-]/g, '').replace(/\s+/g, '_');
             const fileName = `melissae-logs_${sanitizedQuery || 'all'}_${timestamp}.json`;
@@ -1,6 +1,29 @@
+import { ArraySource } from './virtualTable.js';
+
 export let logs = [];
 
+let worker = null;
+let queryCounter = 0;
+let activeQuery = 0;
+let requestCounter = 0;
+let pendingExport = null;
+let handlers = null;
+const pendingRequests = new Map();
+
 export async function loadLogs() {
+    // Load and index off the main thread when possible
+    if (window.Worker) {
+        try {
+            worker = new Worker(new URL('./searchWorker.js', import.meta.url), { type: 'module' });
+            worker.onmessage = handleWorkerMessage;
+            worker.postMessage({ type: 'load', url: new URL('../json/logs.json', import.meta.url).href });
+            return;
+        } catch (error) {
+            console.warn('Search worker unavailable, falling back to main thread', error);
+            worker = null;
+        }
+    }
+
     try {
         const response = await fetch('json/logs.json');
         if (!response.ok) throw new Error('File not found');
@@ -11,47 +34,62 @@ export async function loadLogs() {
     }
 }
 
-// Search logic
-function matchesTerm(log, term) {
-    let isNegation = false;
-    term = term.trim();
+function handleWorkerMessage(e) {
+    const msg = e.data;
+    switch (msg.type) {
+        case 'error':
+            console.error("Oh no !", msg.error);
+            alert('Error while loading log files');
+            break;
+        case 'results':
+            if (msg.id === activeQuery && handlers) {
+                handlers.onResults(new WorkerSource(msg.id, msg.total), msg.terms);
+            }
+            break;
+        case 'range':
+        case 'sort':
+            pendingRequests.get(msg.requestId)?.(msg.rows);
+            pendingRequests.delete(msg.requestId);
+            break;
+        case 'export':
+            if (pendingExport && pendingExport.id === msg.id) {
+                pendingExport.resolve(msg.rows);
+                pendingExport = null;
+            }
+            break;
+    }
+}
 
-    if (/^(NOT\s+|!)/i.test(term)) {
-        isNegation = true;
-        term = term.replace(/^(NOT\s+|!)/i, '').trim();
+function workerRequest(message) {
+    return new Promise(resolve => {
+        const requestId = ++requestCounter;
+        pendingRequests.set(requestId, resolve);
+        worker.postMessage({ ...message, requestId });
+    });
+}
+
+// Data source for the results table, rows stay in the worker until displayed
+class WorkerSource {
+    constructor(id, total) {
+        this.id = id;
+        this.total = total;
     }
 
-    let match = false;
-    if (term.includes(':')) {
-        const [field, value] = term.split(':');
-        switch(field.toLowerCase()) {
-            case 'protocol': match = log.protocol?.toLowerCase().includes(value.toLowerCase()); break;
-            case 'action': match = log.action?.toLowerCase().includes(value.toLowerCase()); break;
-            case 'ip': match = log.ip?.toLowerCase().includes(value.toLowerCase()); break;
-            case 'date': match = log.date?.toLowerCase().includes(value.toLowerCase()); break;
-            case 'hour': match = checkHourMatch(log.hour, value); break;
-            case 'user': match = (log.user || '').toLowerCase().includes(value.toLowerCase()); break;
-            case 'user-agent': match = log["user-agent"]?.toLowerCase().includes(value.toLowerCase()); break;
-            case 'path': match = log.path?.toLowerCase().includes(value.toLowerCase()); break;
-            default: match = false;
-        }
-    } else {
-        match = Object.values(log).some(val => 
-            String(val).toLowerCase().includes(term.toLowerCase())
-        );
+    count() {
+        return this.total;
     }
 
-    return isNegation ? !match : match;
-}
+    fetch(start, limit) {
+        return workerRequest({ type: 'range', id: this.id, start, limit });
+    }
 
-function checkHourMatch(logHour, searchValue) {
-    if (!logHour) return false;
-    const logHourPart = logHour.toLowerCase().split(':')[0];
-    const searchHour = searchValue.toLowerCase().split(':')[0];
-    return logHourPart === searchHour;
+    sort(column, direction) {
+        return workerRequest({ type: 'sort', id: this.id, key: column.sortKey || column.key, direction });
+    }
 }
 
-export function searchLogs(query) {
+// Query parsing (shared with searchWorker.js)
+export function parseQuery(query) {
     const termsWithOperators = query.split(/(\bAND\b|\bOR\b)/i);
     const searchGroups = [];
     let currentGroup = [];
@@ -74,7 +112,7 @@ export function searchLogs(query) {
             lastOperator = 'OR';
         } else {
             if (term.length >= 2) {
-                if (term.includes(':') && term.split(':')[1].trim() === '') return;
+                if (term.includes(':') && term.slice(term.indexOf(':') + 1).trim() === '') return;
                 currentGroup.push(term);
             }
         }
@@ -82,38 +120,113 @@ export function searchLogs(query) {
     if (currentGroup.length > 0) {
         searchGroups.push({ terms: currentGroup, operator: lastOperator });
     }
+    return searchGroups;
+}
 
+// Lowercase each term once instead of once per log
+export function compileTerm(term) {
+    let negate = false;
+    term = term.trim();
+
+    if (/^(NOT\s+|!)/i.test(term)) {
+        negate = true;
+        term = term.replace(/^(NOT\s+|!)/i, '').trim();
+    }
+
+    const separator = term.indexOf(':');
+    if (separator === -1) {
+        return { field: null, value: term.toLowerCase(), negate };
+    }
+    return {
+        field: term.slice(0, separator).toLowerCase(),
+        value: term.slice(separator + 1).trim().toLowerCase(),
+        negate
+    };
+}
+
+// Search logic (main thread fallback)
+function matchesTerm(log, compiled) {
+    const { field, value } = compiled;
+    let match = false;
+    if (field !== null) {
+        switch (field) {
+            case 'protocol': match = log.protocol?.toLowerCase().includes(value); break;
+            case 'action': match = log.action?.toLowerCase().includes(value); break;
+            case 'ip': match = log.ip?.toLowerCase().includes(value); break;
+            case 'date': match = log.date?.toLowerCase().includes(value); break;
+            case 'hour': match = checkHourMatch(log.hour, value); break;
+            case 'user': match = (log.user || '').toLowerCase().includes(value); break;
+            case 'user-agent': match = log["user-agent"]?.toLowerCase().includes(value); break;
+            case 'path': match = log.path?.toLowerCase().includes(value); break;
+            case 'after': match = `${log.date} ${log.hour}` >= value; break;
+            case 'before': match = `${log.date} ${log.hour}` < value; break;
+            default: match = false;
+        }
+    } else {
+        match = Object.values(log).some(val =>
+            String(val).toLowerCase().includes(value)
+        );
+    }
+
+    return compiled.negate ? !match : match;
+}
+
+function checkHourMatch(logHour, searchValue) {
+    if (!logHour) return false;
+    const logHourPart = logHour.toLowerCase().split(':')[0];
+    const searchHour = searchValue.split(':')[0];
+    return logHourPart === searchHour;
+}
+
+export function searchLogs(query) {
+    const searchGroups = parseQuery(query);
     if (searchGroups.length === 0) return { results: [], terms: [] };
 
     let filteredLogs = [];
     searchGroups.forEach((group, index) => {
-        const groupResults = logs.filter(log => 
-            group.terms.every(term => matchesTerm(log, term))
-        );
+        const compiled = group.terms.map(compileTerm);
+        const groupResults = new Set(logs.filter(log =>
+            compiled.every(term => matchesTerm(log, term))
+        ));
         if (index === 0) {
-            filteredLogs = groupResults;
+            filteredLogs = logs.filter(log => groupResults.has(log));
+        } else if (group.operator === 'AND') {
+            filteredLogs = filteredLogs.filter(log => groupResults.has(log));
         } else {
-            if (group.operator === 'AND') {
-                filteredLogs = filteredLogs.filter(log => 
-                    groupResults.some(r => r === log)
-                );
-            } else { 
-                const newLogs = groupResults.filter(log => 
-                    !filteredLogs.some(f => f === log)
-                );
-                filteredLogs = [...filteredLogs, ...newLogs];
-            }
+            const current = new Set(filteredLogs);
+            filteredLogs = logs.filter(log => current.has(log) || groupResults.has(log));
         }
     });
     return { results: filteredLogs, terms: searchGroups.flatMap(g => g.terms) };
 }
 
+// Full result set of the last query, used by the export button
+export function exportResults() {
+    if (!worker) {
+        const query = document.getElementById('searchInput').value.trim();
+        return Promise.resolve(searchLogs(query).results);
+    }
+    return new Promise(resolve => {
+        pendingExport = { id: activeQuery, resolve };
+        worker.postMessage({ type: 'export', id: activeQuery });
+    });
+}
+
 // Search Init
-export function setupSearch(onResults) {
+export function setupSearch(searchHandlers) {
+    handlers = searchHandlers;
+
     function handleSearch() {
         const query = document.getElementById('searchInput').value.trim();
+        activeQuery = ++queryCounter;
+
+        if (worker) {
+            worker.postMessage({ type: 'search', id: activeQuery, query });
+            return;
+        }
+
         const { results, terms } = searchLogs(query);
-        onResults(results, terms);
+        handlers.onResults(new ArraySource(results), terms);
     }
 
     function handleURLSearchParams() {
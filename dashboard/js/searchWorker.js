@@ -0,0 +1,204 @@
+import { parseQuery, compileTerm } from './searchEngine.js';
+
+// Indexed search, runs in a Web Worker so the search page stays responsive
+const FIELD_TERMS = ['protocol', 'action', 'ip', 'date', 'user', 'user-agent', 'path'];
+
+let logs = [];
+// field -> Map(lowercased value -> Int32Array of log ids)
+let dictionaries = {};
+// hour part ("HH") -> Int32Array of log ids
+let hourIndex = new Map();
+// Log ids ordered by "date hour", with their keys, for after:/before: range queries
+let timeOrder = new Int32Array(0);
+let timeKeys = [];
+let timeRank = new Int32Array(0);
+
+let ready = null;
+let lastResult = { id: 0, ids: new Int32Array(0) };
+
+self.onmessage = async (e) => {
+    const msg = e.data;
+    switch (msg.type) {
+        case 'load':
+            ready = load(msg.url);
+            break;
+        case 'search':
+            await ready;
+            runSearch(msg.id, msg.query);
+            break;
+        case 'range':
+            await ready;
+            self.postMessage({ type: 'range', requestId: msg.requestId, rows: resultRange(msg.id, msg.start, msg.limit) });
+            break;
+        case 'sort':
+            await ready;
+            sortResult(msg.id, msg.key, msg.direction);
+            self.postMessage({ type: 'sort', requestId: msg.requestId });
+            break;
+        case 'export':
+            await ready;
+            self.postMessage({
+                type: 'export',
+                id: msg.id,
+                rows: lastResult.id === msg.id ? Array.from(lastResult.ids, i => logs[i]) : []
+            });
+            break;
+    }
+};
+
+async function load(url) {
+    try {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('File not found');
+        logs = await response.json();
+        buildIndexes();
+    } catch (error) {
+        logs = [];
+        self.postMessage({ type: 'error', error: String(error) });
+    }
+}
+
+// Index construction
+function buildIndexes() {
+    const postings = {};
+    const hours = new Map();
+
+    logs.forEach((log, id) => {
+        for (const [field, raw] of Object.entries(log)) {
+            if (raw === undefined || raw === null) continue;
+            const value = String(raw).toLowerCase();
+            let dictionary = postings[field];
+            if (!dictionary) dictionary = postings[field] = new Map();
+            let list = dictionary.get(value);
+            if (!list) dictionary.set(value, list = []);
+            list.push(id);
+        }
+        if (log.hour) {
+            const hourPart = String(log.hour).toLowerCase().split(':')[0];
+            let list = hours.get(hourPart);
+            if (!list) hours.set(hourPart, list = []);
+            list.push(id);
+        }
+    });
+
+    dictionaries = {};
+    for (const [field, dictionary] of Object.entries(postings)) {
+        const packed = new Map();
+        dictionary.forEach((list, value) => packed.set(value, Int32Array.from(list)));
+        dictionaries[field] = packed;
+    }
+    hourIndex = new Map();
+    hours.forEach((list, hour) => hourIndex.set(hour, Int32Array.from(list)));
+
+    const keys = logs.map(log => `${log.date} ${log.hour}`);
+    const order = Array.from(logs.keys()).sort((a, b) => (keys[a] < keys[b] ? -1 : keys[a] > keys[b] ? 1 : a - b));
+    timeOrder = Int32Array.from(order);
+    timeKeys = order.map(id => keys[id]);
+    timeRank = new Int32Array(logs.length);
+    timeOrder.forEach((id, rank) => { timeRank[id] = rank; });
+}
+
+// Term evaluation, each term yields a membership bitmap over log ids
+function markPostings(bitmap, list) {
+    for (let i = 0; i < list.length; i++) bitmap[list[i]] = 1;
+}
+
+function markMatchingValues(bitmap, dictionary, value) {
+    if (!dictionary) return;
+    // Substring semantics are resolved against distinct values, not against every log
+    dictionary.forEach((list, candidate) => {
+        if (candidate.includes(value)) markPostings(bitmap, list);
+    });
+}
+
+function lowerBound(key) {
+    let lo = 0;
+    let hi = timeKeys.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >>> 1;
+        if (timeKeys[mid] < key) lo = mid + 1;
+        else hi = mid;
+    }
+    return lo;
+}
+
+function evaluateTerm(term) {
+    const { field, value, negate } = compileTerm(term);
+    const bitmap = new Uint8Array(logs.length);
+
+    if (field === null) {
+        for (const dictionary of Object.values(dictionaries)) {
+            markMatchingValues(bitmap, dictionary, value);
+        }
+    } else if (FIELD_TERMS.includes(field)) {
+        markMatchingValues(bitmap, dictionaries[field], value);
+    } else if (field === 'hour') {
+        const list = hourIndex.get(value.split(':')[0]);
+        if (list) markPostings(bitmap, list);
+    } else if (field === 'after' || field === 'before') {
+        const boundary = lowerBound(value);
+        const [start, end] = field === 'after' ? [boundary, timeOrder.length] : [0, boundary];
+        for (let i = start; i < end; i++) bitmap[timeOrder[i]] = 1;
+    }
+
+    if (negate) {
+        for (let i = 0; i < bitmap.length; i++) bitmap[i] ^= 1;
+    }
+    return bitmap;
+}
+
+function runSearch(id, query) {
+    const searchGroups = parseQuery(query);
+    const terms = searchGroups.flatMap(g => g.terms);
+    let result = null;
+
+    searchGroups.forEach((group, index) => {
+        const groupBitmap = new Uint8Array(logs.length).fill(1);
+        for (const term of group.terms) {
+            const termBitmap = evaluateTerm(term);
+            for (let i = 0; i < groupBitmap.length; i++) groupBitmap[i] &= termBitmap[i];
+        }
+        if (index === 0) {
+            result = groupBitmap;
+        } else if (group.operator === 'AND') {
+            for (let i = 0; i < result.length; i++) result[i] &= groupBitmap[i];
+        } else {
+            for (let i = 0; i < result.length; i++) result[i] |= groupBitmap[i];
+        }
+    });
+
+    let count = 0;
+    if (result) {
+        for (let i = 0; i < result.length; i++) count += result[i];
+    }
+    const ids = new Int32Array(count);
+    if (result) {
+        for (let i = 0, j = 0; i < result.length; i++) {
+            if (result[i]) ids[j++] = i;
+        }
+    }
+
+    lastResult = { id, ids };
+    self.postMessage({ type: 'results', id, total: ids.length, terms });
+}
+
+// Pages are addressed by position in the (sorted) id list of the last query
+function resultRange(id, start, limit) {
+    if (lastResult.id !== id) return [];
+    return Array.from(lastResult.ids.subarray(start, start + limit), i => logs[i]);
+}
+
+function sortResult(id, key, direction) {
+    if (lastResult.id !== id) return;
+    const ids = lastResult.ids;
+    const positions = Int32Array.from(ids.keys());
+    if (key === 'time') {
+        positions.sort((a, b) => timeRank[ids[a]] - timeRank[ids[b]]);
+    } else {
+        // Sort keys are computed once per row, ties keep chronological order
+        const values = Array.from(ids, i => String(logs[i][key] ?? '').toLowerCase());
+        positions.sort((a, b) => (values[a] < values[b] ? -1 : values[a] > values[b] ? 1 : timeRank[ids[a]] - timeRank[ids[b]]));
+    }
+    if (direction === 'desc') positions.reverse();
+    lastResult = { id, ids: positions.map(p => ids[p]) };
+}
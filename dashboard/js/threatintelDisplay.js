@@ -1,4 +1,7 @@
+import { VirtualTable, ArraySource } from './virtualTable.js';
+
 let threats = [];
+let threatTable = null;
 
 window.redirectToSearch = function(searchTerm) {
     window.location.href = `search.html?search=${encodeURIComponent(searchTerm)}`;
@@ -100,35 +103,33 @@ function renderThreatChart() {
 
 // Threats list
 function renderMaliciousList(threatsToRender) {
-    const listContainer = document.getElementById('maliciousList');
-    listContainer.innerHTML = `
-        <table class="log-table">
-            <thead>
-                <tr>
-                    <th>Type</th>
-                    <th>IP</th>
-                    <th>Verdict</th>
-                </tr>
-            </thead>
-            <tbody>
-                ${threatsToRender.map(threat => `
-                    <tr>
-                        <td>${threat.type.toUpperCase()}</td>
-                        <td>
-                            <a href="javascript:void(0);" class="ip-link" onclick="redirectToSearch('ip:${threat.ip}')">
-                                ${threat.ip}
-                            </a>
-                        </td>
-                        <td>
-                            <span class="verdict-tag ${getVerdictClass(threat.verdict)}">
-                                ${threat.verdict.toUpperCase()}
-                            </span>
-                        </td>
-                    </tr>
-                `).join('')}
-            </tbody>
-        </table>
-    `;
+    if (!threatTable) {
+        threatTable = new VirtualTable(document.getElementById('maliciousList'), {
+            columns: [
+                { label: 'Type', key: 'type', render: threat => threat.type.toUpperCase() },
+                {
+                    label: 'IP',
+                    key: 'ip',
+                    render: threat => `
+                        <a href="javascript:void(0);" class="ip-link" onclick="redirectToSearch('ip:${threat.ip}')">
+                            ${threat.ip}
+                        </a>`
+                },
+                {
+                    label: 'Verdict',
+                    key: 'verdict',
+                    sortValue: threat => threat['protocol-score'],
+                    render: threat => `
+                        <span class="verdict-tag ${getVerdictClass(threat.verdict)}">
+                            ${threat.verdict.toUpperCase()}
+                        </span>`
+                }
+            ],
+            rowHeight: 60,
+            emptyText: 'No threats found.'
+        });
+    }
+    threatTable.setSource(new ArraySource(threatsToRender));
 }
 
 // Export button
@@ -0,0 +1,226 @@
+// Virtual scrolling table shared by the search, threat-intel and multi-instance pages.
+// Only the visible window of rows lives in the DOM, rows are pulled from a data source:
+//   source.count()              -> number of rows
+//   source.fetch(start, limit)  -> Promise of rows in the current sort order
+//   source.sort(column, dir)    -> Promise, reorders the source ('asc' or 'desc')
+
+const BLOCK_SIZE = 200;
+const MAX_CACHED_BLOCKS = 20;
+// Browsers cap element heights (~16M px in Firefox), larger tables are scaled
+const MAX_SCROLL_HEIGHT = 8000000;
+
+// In-memory data source, sorting works on a permutation so rows are never copied
+export class ArraySource {
+    constructor(rows = []) {
+        this.rows = rows;
+        this.order = null;
+    }
+
+    count() {
+        return this.rows.length;
+    }
+
+    async fetch(start, limit) {
+        const end = Math.min(start + limit, this.rows.length);
+        const page = [];
+        for (let i = start; i < end; i++) {
+            page.push(this.rows[this.order ? this.order[i] : i]);
+        }
+        return page;
+    }
+
+    async sort(column, direction) {
+        const valueOf = column.sortValue || (row => row[column.key]);
+        const keys = this.rows.map(row => {
+            const value = valueOf(row);
+            return typeof value === 'string' ? value.toLowerCase() : (value ?? '');
+        });
+        const order = Int32Array.from(this.rows.keys());
+        const sign = direction === 'desc' ? -1 : 1;
+        order.sort((a, b) => {
+            if (keys[a] < keys[b]) return -sign;
+            if (keys[a] > keys[b]) return sign;
+            return a - b;
+        });
+        this.order = order;
+    }
+}
+
+export class VirtualTable {
+    constructor(container, { columns, rowHeight = 50, height = 600, emptyText = 'No results found.' }) {
+        this.container = container;
+        this.columns = columns;
+        this.rowHeight = rowHeight;
+        this.height = height;
+        this.emptyText = emptyText;
+        this.source = null;
+        this.total = 0;
+        this.generation = 0;
+        this.blocks = new Map();
+        this.pending = new Set();
+        this.sortState = null;
+        this.frame = null;
+        this.build();
+    }
+
+    build() {
+        this.container.innerHTML = '';
+
+        this.viewport = document.createElement('div');
+        this.viewport.className = 'virtual-table';
+        this.viewport.style.height = `${this.height}px`;
+
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'virtual-table-spacer';
+
+        this.table = document.createElement('table');
+        this.table.className = 'log-table virtual-table-body';
+
+        const thead = document.createElement('thead');
+        const headerRow = document.createElement('tr');
+        this.headers = this.columns.map(column => {
+            const th = document.createElement('th');
+            th.textContent = column.label;
+            if (column.width) th.style.width = column.width;
+            if (column.sortable !== false) {
+                th.classList.add('sortable');
+                th.addEventListener('click', () => this.sortBy(column));
+            }
+            headerRow.appendChild(th);
+            return th;
+        });
+        thead.appendChild(headerRow);
+
+        this.tbody = document.createElement('tbody');
+        this.table.appendChild(thead);
+        this.table.appendChild(this.tbody);
+        this.spacer.appendChild(this.table);
+        this.viewport.appendChild(this.spacer);
+
+        this.empty = document.createElement('div');
+        this.empty.className = 'no-results';
+        this.empty.textContent = this.emptyText;
+
+        this.container.appendChild(this.viewport);
+        this.container.appendChild(this.empty);
+
+        // Fixed pool of rows, reused while scrolling
+        const poolSize = Math.ceil(this.height / this.rowHeight) + 2;
+        this.pool = Array.from({ length: poolSize }, () => {
+            const tr = document.createElement('tr');
+            tr.style.height = `${this.rowHeight}px`;
+            this.columns.forEach(() => tr.appendChild(document.createElement('td')));
+            this.tbody.appendChild(tr);
+            return tr;
+        });
+
+        this.viewport.addEventListener('scroll', () => this.scheduleRender());
+    }
+
+    setSource(source) {
+        this.source = source;
+        this.total = source ? source.count() : 0;
+        this.sortState = null;
+        this.updateSortIndicators();
+        this.reset();
+    }
+
+    reset() {
+        this.generation++;
+        this.blocks.clear();
+        this.pending.clear();
+        this.pool.forEach(tr => { tr.rowIndex_ = -1; });
+
+        const show = this.total > 0;
+        this.viewport.style.display = show ? 'block' : 'none';
+        this.empty.style.display = show ? 'none' : 'block';
+
+        this.scrollHeight = Math.min(this.total * this.rowHeight, MAX_SCROLL_HEIGHT);
+        this.spacer.style.height = `${this.scrollHeight + this.rowHeight}px`;
+        this.viewport.scrollTop = 0;
+        this.render();
+    }
+
+    async sortBy(column) {
+        if (!this.source) return;
+        const direction = this.sortState?.column === column && this.sortState.direction === 'asc' ? 'desc' : 'asc';
+        await this.source.sort(column, direction);
+        this.sortState = { column, direction };
+        this.updateSortIndicators();
+        this.reset();
+    }
+
+    updateSortIndicators() {
+        this.headers.forEach((th, i) => {
+            const column = this.columns[i];
+            const active = this.sortState?.column === column;
+            th.textContent = column.label + (active ? (this.sortState.direction === 'asc' ? ' ▲' : ' ▼') : '');
+        });
+    }
+
+    scheduleRender() {
+        if (this.frame) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.render();
+        });
+    }
+
+    firstVisibleRow() {
+        const viewportHeight = this.viewport.clientHeight || this.height;
+        // The spacer holds one extra row for the header
+        const fullRange = (this.total + 1) * this.rowHeight - viewportHeight;
+        const scrollRange = this.scrollHeight + this.rowHeight - viewportHeight;
+        const scale = scrollRange > 0 ? fullRange / scrollRange : 1;
+        const virtualTop = this.viewport.scrollTop * scale;
+        const first = Math.floor(virtualTop / this.rowHeight);
+        return { first, offset: virtualTop - first * this.rowHeight };
+    }
+
+    render() {
+        if (!this.source || this.total === 0) return;
+
+        const { first, offset } = this.firstVisibleRow();
+        this.table.style.top = `${this.viewport.scrollTop - offset}px`;
+
+        this.pool.forEach((tr, i) => {
+            const index = first + i;
+            if (index >= this.total) {
+                tr.style.display = 'none';
+                return;
+            }
+            tr.style.display = '';
+            if (tr.rowIndex_ === index) return;
+            const row = this.rowAt(index);
+            // Rows still loading are redrawn once their block arrives
+            tr.rowIndex_ = row ? index : -1;
+            this.columns.forEach((column, c) => {
+                tr.cells[c].innerHTML = row ? (column.render ? column.render(row) : (row[column.key] ?? '-')) : '';
+            });
+        });
+    }
+
+    rowAt(index) {
+        const blockIndex = Math.floor(index / BLOCK_SIZE);
+        const block = this.blocks.get(blockIndex);
+        if (block) return block[index - blockIndex * BLOCK_SIZE];
+        this.loadBlock(blockIndex);
+        return null;
+    }
+
+    async loadBlock(blockIndex) {
+        if (this.pending.has(blockIndex)) return;
+        this.pending.add(blockIndex);
+        const generation = this.generation;
+        const rows = await this.source.fetch(blockIndex * BLOCK_SIZE, BLOCK_SIZE);
+        if (generation !== this.generation) return;
+        this.pending.delete(blockIndex);
+
+        this.blocks.set(blockIndex, rows);
+        if (this.blocks.size > MAX_CACHED_BLOCKS) {
+            this.blocks.delete(this.blocks.keys().next().value);
+        }
+        this.pool.forEach(tr => { tr.rowIndex_ = -1; });
+        this.scheduleRender();
+    }
+}
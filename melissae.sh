@@ -78,6 +78,9 @@ install() {
     
     # For any missing packages, use pip in user space
     python3 -m pip install --user pytz requests 2>/dev/null || true
+    
+    # Optional faster JSON backend, the scripts fall back to the json module without it
+    sudo apt-get install python3-orjson -y > /dev/null 2>&1 || python3 -m pip install --user orjson 2>/dev/null || true
 
     print_message "Modifying permissions for directories and files"
     chmod -R 777 modules/web/logs
@@ -91,20 +94,13 @@ print_message "Adding cleaning scripts to crontabs"
 
 CRONTAB_CONTENT=$(crontab -l 2>/dev/null || echo "")
 
-if ! echo "$CRONTAB_CONTENT" | grep -q "$WORKING_DIRECTORY/scripts/logParser.py"; then
-    (echo "$CRONTAB_CONTENT"; echo "* * * * * /usr/bin/python3 $WORKING_DIRECTORY/scripts/logParser.py") | crontab -
-    print_message "Added logParser.py to crontab."
-else
-    print_message "logParser.py is already in crontab. Skipping."
-fi
-
-CRONTAB_CONTENT=$(crontab -l 2>/dev/null)
-
-if ! echo "$CRONTAB_CONTENT" | grep -q "$WORKING_DIRECTORY/scripts/threatIntel.py"; then
-    (echo "$CRONTAB_CONTENT"; echo "* * * * * /usr/bin/python3 $WORKING_DIRECTORY/scripts/threatIntel.py") | crontab -
-    print_message "Added threatIntel.py to crontab."
+if ! echo "$CRONTAB_CONTENT" | grep -q "$WORKING_DIRECTORY/scripts/melissae.py cycle"; then
+    # Parsing and scoring now run in one process, remove the separate entries of older installs
+    CRONTAB_CONTENT=$(echo "$CRONTAB_CONTENT" | grep -v "$WORKING_DIRECTORY/scripts/logParser.py" | grep -v "$WORKING_DIRECTORY/scripts/threatIntel.py")
+    (echo "$CRONTAB_CONTENT"; echo "* * * * * /usr/bin/python3 $WORKING_DIRECTORY/scripts/melissae.py cycle") | crontab -
+    print_message "Added melissae.py cycle (logParser then threatIntel) to crontab."
 else
-    print_message "threatIntel.py is already in crontab. Skipping."
+    print_message "melissae.py cycle is already in crontab. Skipping."
 fi
 
     print_message "Generating a random port for SSH"
@@ -1,26 +1,284 @@
 #!/usr/bin/env python3
 import asyncio
+import os
+import json
 import logging
+import logging.handlers
+import queue
 import random
 import string
 import socket
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List, Tuple
 # Basic Modbus TCP honeypot - no external dependencies needed
 
-LOG_FILE = '/host-logs/modbus/modbus.log'
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# Versioned NDJSON event stream read by logParser.py (one JSON object per line)
+EVENT_FILE = '/host-logs/modbus/modbus.ndjson'
+EVENT_VERSION = 1
+REGISTER_STATE = '/host-logs/modbus/registers-{profile}.bin'
+REGISTER_SAVE_INTERVAL = 30
+
+# Admission control: concurrency caps, accept rate per IP (token bucket) and session timeouts
+MAX_CONNECTIONS = 1000
+MAX_CONNECTIONS_PER_IP = 20
+ACCEPT_RATE = 10  # new connections per second and per IP
+ACCEPT_BURST = 50
+MAX_TRACKED_IPS = 50000
+IDLE_TIMEOUT = 60
+SESSION_TIMEOUT = 600
+ADMISSION_REPORT_INTERVAL = 60
+
+# Log pipeline limits: the event loop only enqueues, a writer thread does the I/O
+LOG_QUEUE_SIZE = 50000
+LOG_BATCH_SIZE = 1024
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 1.0
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records without blocking, count what does not fit"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def format_event(created: float, event: Dict) -> str:
+    record = {"v": EVENT_VERSION, "ts": round(created, 6), "src": "modbus"}
+    record.update(event)
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+class BatchLogWriter(threading.Thread):
+    """Drain the log queue in batches, flush on size or time thresholds.
+    Event records go to the NDJSON file, every record is echoed as text on stderr."""
+    def __init__(self, handler: DroppingQueueHandler, path: str, formatter: logging.Formatter):
+        super().__init__(name='log-writer', daemon=True)
+        self.handler = handler
+        self.queue = handler.queue
+        self.formatter = formatter
+        self.file = open(path, 'a', encoding='utf-8', buffering=LOG_FLUSH_BYTES)
+        self.stream = sys.stderr
+        self.reported_drops = 0
+        self.stopping = threading.Event()
+
+    def _next_batch(self) -> List[logging.LogRecord]:
+        try:
+            batch = [self.queue.get(timeout=LOG_FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _drop_notice(self) -> List[logging.LogRecord]:
+        dropped = self.handler.dropped
+        if dropped == self.reported_drops:
+            return []
+        count = dropped - self.reported_drops
+        record = logging.LogRecord(logger.name, logging.WARNING, __file__, 0,
+                                   f"Log queue full, {count} records dropped ({dropped} total)", None, None)
+        record.event = {"event": "dropped", "count": count}
+        self.reported_drops = dropped
+        return [record]
+
+    def run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            batch = self._next_batch() + self._drop_notice()
+            if batch:
+                events = ''.join(format_event(record.created, record.event) for record in batch if hasattr(record, 'event'))
+                self.file.write(events)
+                self.stream.write(''.join(self.formatter.format(record) + '\n' for record in batch))
+                pending += len(events)
+
+            now = time.monotonic()
+            if pending and (pending >= LOG_FLUSH_BYTES or now - last_flush >= LOG_FLUSH_INTERVAL):
+                self.flush()
+                pending = 0
+                last_flush = now
+            if self.stopping.is_set() and self.queue.empty():
+                self.flush()
+                return
+
+    def flush(self):
+        self.file.flush()
+        self.stream.flush()
+
+    def stop(self):
+        self.stopping.set()
+        self.join(timeout=5)
+
+log_formatter = logging.Formatter('%(asctime)s | %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+log_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+logging.basicConfig(level=logging.INFO, handlers=[log_handler])
 logger = logging.getLogger(__name__)
 
+# Modbus TCP framing (MBAP header: transaction id, protocol id, length, unit id)
+MBAP_HEADER_SIZE = 7
+MAX_MBAP_LENGTH = 254  # unit id + 253 bytes of PDU
+READ_SIZE = 65536
+
+FUNCTION_NAMES = {
+    1: "Read Coils",
+    2: "Read Discrete Inputs",
+    3: "Read Holding Registers",
+    4: "Read Input Registers",
+    5: "Write Single Coil",
+    6: "Write Single Register",
+    15: "Write Multiple Coils",
+    16: "Write Multiple Registers"
+}
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+class ModbusError(Exception):
+    def __init__(self, code: int):
+        super().__init__(code)
+        self.code = code
+
+# Register banks shared by every connection.
+# Registers are array('H') kept in network byte order, so reads and writes are plain slice copies.
+# Coils and discrete inputs are packed 8 per byte, LSB first, like Modbus PDUs.
+BIG_ENDIAN_HOST = sys.byteorder == 'big'
+STATE_MAGIC = b'MLSR'
+STATE_VERSION = 1
+
+def network_words(values: List[int]) -> array:
+    words = array('H', values)
+    if not BIG_ENDIAN_HOST:
+        words.byteswap()
+    return words
+
+def pack_bits(values: List[int]) -> bytearray:
+    packed = bytearray((len(values) + 7) // 8)
+    for index, value in enumerate(values):
+        if value:
+            packed[index >> 3] |= 1 << (index & 7)
+    return packed
+
+def words_from(data: memoryview) -> array:
+    words = array('H')
+    words.frombytes(data)
+    return words
+
+class RegisterBank:
+    def __init__(self, size: int, hr: array, ir: array, co: bytearray, di: bytearray):
+        self.size = size
+        self.hr = hr
+        self.ir = ir
+        self.co = co
+        self.di = di
+        self.dirty = False
+
+    def _check_range(self, address: int, quantity: int, max_quantity: int) -> None:
+        if not 1 <= quantity <= max_quantity:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        if address + quantity > self.size:
+            raise ModbusError(ILLEGAL_DATA_ADDRESS)
+
+    # Reads
+    def read_bits(self, bits: bytearray, address: int, quantity: int) -> bytes:
+        self._check_range(address, quantity, 2000)
+        byte_count = (quantity + 7) // 8
+        shift = address & 7
+        start = address >> 3
+        if shift == 0:
+            packed = bytearray(bits[start:start + byte_count])
+        else:
+            window = int.from_bytes(bits[start:start + byte_count + 1], 'little') >> shift
+            packed = bytearray(window.to_bytes(byte_count + 1, 'little')[:byte_count])
+        if quantity & 7:
+            packed[-1] &= (1 << (quantity & 7)) - 1
+        return bytes((byte_count,)) + packed
+
+    def read_words(self, words: array, address: int, quantity: int) -> bytes:
+        self._check_range(address, quantity, 125)
+        return bytes((quantity * 2,)) + words[address:address + quantity].tobytes()
+
+    # Writes
+    def write_coil(self, address: int, value: int) -> None:
+        if value not in (0x0000, 0xFF00):
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        self._check_range(address, 1, 1)
+        if value:
+            self.co[address >> 3] |= 1 << (address & 7)
+        else:
+            self.co[address >> 3] &= ~(1 << (address & 7)) & 0xFF
+        self.dirty = True
+
+    def write_register(self, address: int, value: memoryview) -> None:
+        self._check_range(address, 1, 1)
+        self.hr[address:address + 1] = words_from(value)
+        self.dirty = True
+
+    def write_coils(self, address: int, quantity: int, values: memoryview) -> None:
+        self._check_range(address, quantity, 1968)
+        if len(values) != (quantity + 7) // 8:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        shift = address & 7
+        start = address >> 3
+        end = (address + quantity + 7) >> 3
+        mask = ((1 << quantity) - 1) << shift
+        window = int.from_bytes(self.co[start:end], 'little')
+        incoming = (int.from_bytes(values, 'little') << shift) & mask
+        self.co[start:end] = ((window & ~mask) | incoming).to_bytes(end - start, 'little')
+        self.dirty = True
+
+    def write_registers(self, address: int, quantity: int, values: memoryview) -> None:
+        self._check_range(address, quantity, 123)
+        if len(values) != quantity * 2:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        self.hr[address:address + quantity] = words_from(values)
+        self.dirty = True
+
+    # Persistence
+    def to_bytes(self) -> bytes:
+        header = STATE_MAGIC + bytes((STATE_VERSION,)) + self.size.to_bytes(4, 'big')
+        return header + self.hr.tobytes() + self.ir.tobytes() + bytes(self.co) + bytes(self.di)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'RegisterBank':
+        if data[:4] != STATE_MAGIC or data[4] != STATE_VERSION:
+            raise ValueError("Unknown register state format")
+        size = int.from_bytes(data[5:9], 'big')
+        words = size * 2
+        bits = (size + 7) // 8
+        if len(data) != 9 + 2 * words + 2 * bits:
+            raise ValueError("Truncated register state")
+        offset = 9
+        hr = array('H', data[offset:offset + words])
+        ir = array('H', data[offset + words:offset + 2 * words])
+        offset += 2 * words
+        co = bytearray(data[offset:offset + bits])
+        di = bytearray(data[offset + bits:offset + 2 * bits])
+        return cls(size, hr, ir, co, di)
+
+    def save(self, path: str) -> None:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(temp_path, path)
+        self.dirty = False
+
 class DeviceProfile:
     def __init__(self, profile_type: str):
         self.profile_type = profile_type
@@ -67,26 +325,43 @@ class DeviceProfile:
                 "DeviceName": f"M340-{self.serial[-5:]}"
             }
     
-    def get_registers(self) -> Dict:
+    def get_registers(self) -> RegisterBank:
         if self.profile_type == "siemens":
-            return {
-                'hr': [0] * 1000,  # Holding registers
-                'ir': [random.randint(0, 100) for _ in range(1000)],  # Input registers
-                'co': [0] * 1000,  # Coils
-                'di': [random.randint(0, 1) for _ in range(1000)]  # Discrete inputs
-            }
+            size, max_input = 1000, 100
         else:  # schneider
-            return {
-                'hr': [0] * 2000,  # Holding registers
-                'ir': [random.randint(0, 255) for _ in range(2000)],  # Input registers
-                'co': [0] * 2000,  # Coils
-                'di': [random.randint(0, 1) for _ in range(2000)]  # Discrete inputs
-            }
+            size, max_input = 2000, 255
+        return RegisterBank(
+            size,
+            network_words([0] * size),  # Holding registers
+            network_words([random.randint(0, max_input) for _ in range(size)]),  # Input registers
+            pack_bits([0] * size),  # Coils
+            pack_bits([random.randint(0, 1) for _ in range(size)])  # Discrete inputs
+        )
 
 class ModbusHoneypot:
-    def __init__(self, device_profile: str = "siemens"):
+    def __init__(self, device_profile: str = "siemens", state_path: str = None):
         self.device = DeviceProfile(device_profile)
+        self.state_path = state_path
+        self.registers = self._load_registers()
         logger.info(f"Initialized {device_profile.upper()} device profile - Serial: {self.device.serial}, Firmware: {self.device.firmware}")
+    
+    def _load_registers(self) -> RegisterBank:
+        # Keep register values (and attacker writes) across restarts of the same profile
+        if self.state_path and os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'rb') as f:
+                    return RegisterBank.from_bytes(f.read())
+            except (IOError, ValueError) as e:
+                logger.warning(f"Ignoring register state {self.state_path}: {e}")
+        return self.device.get_registers()
+    
+    def save_registers(self):
+        if not self.state_path or not self.registers.dirty:
+            return
+        try:
+            self.registers.save(self.state_path)
+        except IOError as e:
+            logger.error(f"Failed to save register state: {e}")
         
 # Device registers for simulation
     def get_device_info_string(self) -> str:
@@ -95,17 +370,20 @@ class ModbusHoneypot:
 
 class ConnectionLogger:
     def __init__(self):
-        self.active_connections = set()
+        # Several sessions from one IP must not collide
+        self.active_connections = Counter()
         
-    def log_connection(self, client_ip: str, action: str):
-        logger.info(f"{client_ip} | {action}")
+    def log_connection(self, client_ip: str, action: str, event: str = 'connection', **fields):
+        record = {"event": event, "ip": client_ip, "action": action}
+        record.update(fields)
+        logger.info(f"{client_ip} | {action}", extra={'event': record})
         
     def connection_made(self, transport):
         if hasattr(transport, 'get_extra_info'):
             peer = transport.get_extra_info('peername')
             if peer:
                 client_ip = peer[0]
-                self.active_connections.add(client_ip)
+                self.active_connections[client_ip] += 1
                 self.log_connection(client_ip, "Connection established")
                 
     def connection_lost(self, transport, exc):
@@ -113,72 +391,299 @@ class ConnectionLogger:
             peer = transport.get_extra_info('peername')
             if peer:
                 client_ip = peer[0]
-                self.active_connections.discard(client_ip)
+                self.active_connections[client_ip] -= 1
+                if self.active_connections[client_ip] <= 0:
+                    del self.active_connections[client_ip]
                 if exc:
                     self.log_connection(client_ip, "Connection failed")
                 else:
                     self.log_connection(client_ip, "Connection closed")
 
+# Decides which connections get served, so floods cannot exhaust sockets or memory
+class AdmissionController:
+    def __init__(self):
+        self.active = Counter()
+        self.total = 0
+        self.buckets = {}  # ip -> [tokens, last refill]
+        self.counters = Counter()
+
+    def _take_token(self, client_ip: str, now: float) -> bool:
+        bucket = self.buckets.get(client_ip)
+        if bucket is None:
+            if len(self.buckets) >= MAX_TRACKED_IPS:
+                self._prune_buckets(now)
+            bucket = self.buckets[client_ip] = [ACCEPT_BURST, now]
+        else:
+            bucket[0] = min(ACCEPT_BURST, bucket[0] + (now - bucket[1]) * ACCEPT_RATE)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _prune_buckets(self, now: float) -> None:
+        # Buckets that refilled completely carry no state
+        refill_time = ACCEPT_BURST / ACCEPT_RATE
+        self.buckets = {ip: bucket for ip, bucket in self.buckets.items() if now - bucket[1] < refill_time}
+        if len(self.buckets) >= MAX_TRACKED_IPS:
+            self.buckets.clear()
+
+    def admit(self, client_ip: str) -> str:
+        """Empty string if the connection is admitted, otherwise the reason it is shed"""
+        if self.total >= MAX_CONNECTIONS:
+            reason = 'global_limit'
+        elif self.active[client_ip] >= MAX_CONNECTIONS_PER_IP:
+            reason = 'ip_limit'
+        elif not self._take_token(client_ip, time.monotonic()):
+            reason = 'accept_rate'
+        else:
+            self.active[client_ip] += 1
+            self.total += 1
+            self.counters['admitted'] += 1
+            return ''
+        self.counters[f'shed_{reason}'] += 1
+        return reason
+
+    def release(self, client_ip: str) -> None:
+        self.total -= 1
+        self.active[client_ip] -= 1
+        if self.active[client_ip] <= 0:
+            del self.active[client_ip]
+
+    def record(self, counter: str) -> None:
+        self.counters[counter] += 1
+
+    def snapshot(self) -> Dict:
+        return dict(self.counters, active=self.total, active_ips=len(self.active))
+
 # Global connection logger
 connection_logger = ConnectionLogger()
 
+class MBAPFramingError(Exception):
+    pass
+
+class MBAPFramer:
+    """Splits a Modbus TCP stream into frames, several pipelined frames per read"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.view = None
+        self.frames = []
+        self.consumed = 0
+
+    def _frame_length(self, offset: int) -> int:
+        buffer = self.buffer
+        protocol_id = (buffer[offset + 2] << 8) | buffer[offset + 3]
+        length = (buffer[offset + 4] << 8) | buffer[offset + 5]
+        if protocol_id != 0 or not 2 <= length <= MAX_MBAP_LENGTH:
+            raise MBAPFramingError(f"protocol {protocol_id}, length {length}")
+        return length
+
+    async def fill(self, reader) -> bool:
+        """Read what the client sent, return False on end of stream"""
+        chunk = await reader.read(READ_SIZE)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        # A split header or PDU is completed with exact reads rather than re-parsed chunk by chunk
+        if len(self.buffer) < MBAP_HEADER_SIZE:
+            self.buffer += await reader.readexactly(MBAP_HEADER_SIZE - len(self.buffer))
+        missing = 6 + self._frame_length(0) - len(self.buffer)
+        if missing > 0:
+            self.buffer += await reader.readexactly(missing)
+        return True
+
+    def parse(self) -> List[Tuple[int, int, memoryview]]:
+        """Complete frames as (transaction id, unit id, PDU view), views stay valid until release()"""
+        self.view = memoryview(self.buffer)
+        size = len(self.buffer)
+        offset = 0
+        while size - offset >= MBAP_HEADER_SIZE:
+            end = offset + 6 + self._frame_length(offset)
+            if end > size:
+                break
+            transaction_id = (self.buffer[offset] << 8) | self.buffer[offset + 1]
+            self.frames.append((transaction_id, self.buffer[offset + 6], self.view[offset + 7:end]))
+            offset = end
+        self.consumed = offset
+        return self.frames
+
+    def release(self) -> None:
+        # Views must be released before the buffer can shrink
+        for _, _, pdu in self.frames:
+            pdu.release()
+        self.frames = []
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        del self.buffer[:self.consumed]
+        self.consumed = 0
+
+def modbus_response(transaction_id: int, unit_id: int, function_code: int, body: bytes) -> bytes:
+    length = len(body) + 2
+    return bytes((
+        transaction_id >> 8, transaction_id & 0xFF,
+        0, 0,
+        length >> 8, length & 0xFF,
+        unit_id,
+        function_code
+    )) + body
+
+def exception_response(transaction_id: int, unit_id: int, function_code: int, exception_code: int) -> bytes:
+    return bytes((
+        transaction_id >> 8, transaction_id & 0xFF,
+        0, 0,
+        0, 3,
+        unit_id,
+        (function_code | 0x80) & 0xFF,
+        exception_code
+    ))
+
 # Simple TCP server to log connections
 class ModbusTCPServer:
-    def __init__(self, honeypot: ModbusHoneypot):
+    def __init__(self, honeypot: ModbusHoneypot, admission: AdmissionController = None):
         self.honeypot = honeypot
+        self.admission = admission or AdmissionController()
+    
+    def handle_frame(self, client_ip: str, transaction_id: int, unit_id: int, pdu: memoryview) -> bytes:
+        function_code = pdu[0]
+        function_name = FUNCTION_NAMES.get(function_code, f"Function {function_code}")
+        
+        # Typed request fields for the event stream
+        fields = {"fc": function_code, "unit": unit_id, "tid": transaction_id}
+        if len(pdu) >= 5:
+            fields["addr"] = (pdu[1] << 8) | pdu[2]
+            fields["value" if function_code in [5, 6] else "qty"] = (pdu[3] << 8) | pdu[4]
+        
+        try:
+            response = modbus_response(transaction_id, unit_id, function_code, self.execute(function_code, pdu))
+            applied = True
+        except ModbusError as e:
+            response = exception_response(transaction_id, unit_id, function_code, e.code)
+            fields["exc"] = e.code
+            applied = False
+        
+        if function_code in [1, 2, 3, 4]:
+            connection_logger.log_connection(client_ip, f"Read request - {function_name}", 'read', **fields)
+        elif function_code in [5, 6, 15, 16]:
+            connection_logger.log_connection(client_ip, f"Write attempt - {function_name}", 'write_attempt', **fields)
+            if applied:
+                connection_logger.log_connection(client_ip, f"Write successful - {function_name}", 'write', **fields)
+        else:
+            connection_logger.log_connection(client_ip, f"Unknown request - Function {function_code}", 'unknown', **fields)
+        
+        return response
+    
+    def execute(self, function_code: int, pdu: memoryview) -> bytes:
+        """Apply a request to the register banks, return the response body after the function code"""
+        if function_code not in FUNCTION_NAMES:
+            raise ModbusError(ILLEGAL_FUNCTION)
+        if len(pdu) < 5:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        
+        registers = self.honeypot.registers
+        address = (pdu[1] << 8) | pdu[2]
+        quantity = (pdu[3] << 8) | pdu[4]  # Output value for single writes
+        
+        if function_code == 1:
+            return registers.read_bits(registers.co, address, quantity)
+        if function_code == 2:
+            return registers.read_bits(registers.di, address, quantity)
+        if function_code == 3:
+            return registers.read_words(registers.hr, address, quantity)
+        if function_code == 4:
+            return registers.read_words(registers.ir, address, quantity)
+        if function_code == 5:
+            registers.write_coil(address, quantity)
+            return bytes(pdu[1:5])
+        if function_code == 6:
+            registers.write_register(address, pdu[3:5])
+            return bytes(pdu[1:5])
+        
+        # Multiple writes carry a byte count followed by the values
+        if len(pdu) < 6 or len(pdu) != 6 + pdu[5]:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        if function_code == 15:
+            registers.write_coils(address, quantity, pdu[6:])
+        else:
+            registers.write_registers(address, quantity, pdu[6:])
+        return bytes(pdu[1:5])
         
     async def handle_client(self, reader, writer):
         addr = writer.get_extra_info('peername')
         client_ip = addr[0] if addr else "unknown"
+        client_port = addr[1] if addr else 0
         
-        connection_logger.log_connection(client_ip, "Connection established")
+        # Shed connections are dropped before anything is read or logged, only counted
+        if self.admission.admit(client_ip):
+            writer.transport.abort()
+            return
+        
+        framer = MBAPFramer()
+        loop = asyncio.get_running_loop()
+        session_deadline = loop.time() + SESSION_TIMEOUT
+        aborted = False
+        
+        connection_logger.log_connection(client_ip, "Connection established", 'connect', port=client_port)
         
         try:
-            # Simple Modbus TCP response simulation
             while True:
-                data = await reader.read(1024)
-                if not data:
-                    break
-                    
-                # Log the request
-                if len(data) >= 8:  # Minimum Modbus TCP frame
-                    function_code = data[7] if len(data) > 7 else 0
-                    
-                    function_names = {
-                        1: "Read Coils",
-                        2: "Read Discrete Inputs", 
-                        3: "Read Holding Registers",
-                        4: "Read Input Registers",
-                        5: "Write Single Coil",
-                        6: "Write Single Register",
-                        15: "Write Multiple Coils",
-                        16: "Write Multiple Registers"
-                    }
-                    
-                    function_name = function_names.get(function_code, f"Function {function_code}")
+                # Idle timeout covers slow partial frames and clients that stop reading responses
+                async with asyncio.timeout(min(IDLE_TIMEOUT, session_deadline - loop.time())):
+                    if not await framer.fill(reader):
+                        break
+                    try:
+                        responses = [
+                            self.handle_frame(client_ip, transaction_id, unit_id, pdu)
+                            for transaction_id, unit_id, pdu in framer.parse()
+                        ]
+                    finally:
+                        framer.release()
                     
-                    if function_code in [1, 2, 3, 4]:
-                        connection_logger.log_connection(client_ip, f"Read request - {function_name}")
-                    elif function_code in [5, 6, 15, 16]:
-                        connection_logger.log_connection(client_ip, f"Write attempt - {function_name}")
-                        connection_logger.log_connection(client_ip, f"Write successful - {function_name}")
-                    else:
-                        connection_logger.log_connection(client_ip, f"Unknown request - Function {function_code}")
-                
-                # Send simple response (error response)
-                response = data[:6] + bytes([0x02, 0x83, 0x02])  # Exception response
-                writer.write(response)
-                await writer.drain()
+                    # Pipelined requests are answered with a single write
+                    writer.write(b''.join(responses))
+                    await writer.drain()
                 
+        except TimeoutError:
+            kind = 'session' if loop.time() >= session_deadline else 'idle'
+            self.admission.record(f'{kind}_timeouts')
+            connection_logger.log_connection(client_ip, f"Connection timeout ({kind})", 'timeout', port=client_port)
+            writer.transport.abort()
+            aborted = True
+        except asyncio.IncompleteReadError:
+            pass
+        except MBAPFramingError as e:
+            connection_logger.log_connection(client_ip, f"Malformed frame - {e}", 'malformed', port=client_port)
         except Exception as e:
-            connection_logger.log_connection(client_ip, f"Connection error: {str(e)}")
+            connection_logger.log_connection(client_ip, f"Connection error: {str(e)}", 'error', port=client_port)
         finally:
-            connection_logger.log_connection(client_ip, "Connection closed")
-            writer.close()
-            await writer.wait_closed()
+            self.admission.release(client_ip)
+            connection_logger.log_connection(client_ip, "Connection closed", 'disconnect', port=client_port)
+            if not aborted:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (ConnectionError, OSError):
+                    pass
+
+async def save_registers_periodically(honeypot: ModbusHoneypot):
+    while True:
+        await asyncio.sleep(REGISTER_SAVE_INTERVAL)
+        honeypot.save_registers()
+
+async def report_admission(admission: AdmissionController):
+    last = None
+    while True:
+        await asyncio.sleep(ADMISSION_REPORT_INTERVAL)
+        snapshot = admission.snapshot()
+        if snapshot != last:
+            summary = ', '.join(f"{key}={value}" for key, value in sorted(snapshot.items()))
+            logger.info(f"Admission: {summary}", extra={'event': dict(snapshot, event='admission')})
+            last = snapshot
 
 async def run_server(honeypot: ModbusHoneypot):
     server_instance = ModbusTCPServer(honeypot)
+    save_task = asyncio.create_task(save_registers_periodically(honeypot))
+    report_task = asyncio.create_task(report_admission(server_instance.admission))
     
     server = await asyncio.start_server(
         server_instance.handle_client,
@@ -191,17 +696,22 @@ async def run_server(honeypot: ModbusHoneypot):
     logger.info(f"Serial: {honeypot.device.serial}")
     logger.info(f"Firmware: {honeypot.device.firmware}")
     
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        save_task.cancel()
+        report_task.cancel()
 
 if __name__ == "__main__":
-    import sys
+    log_writer = BatchLogWriter(log_handler, EVENT_FILE, log_formatter)
+    log_writer.start()
     
     device_profile = sys.argv[1] if len(sys.argv) > 1 else "siemens"
     if device_profile not in ["siemens", "schneider"]:
         device_profile = "siemens"
     
-    honeypot = ModbusHoneypot(device_profile)
+    honeypot = ModbusHoneypot(device_profile, REGISTER_STATE.format(profile=device_profile))
     
     try:
         asyncio.run(run_server(honeypot))
@@ -209,3 +719,6 @@ if __name__ == "__main__":
         logger.info("Server stopped by user")
     except Exception as e:
         logger.error(f"Server error: {e}")
+    finally:
+        honeypot.save_registers()
+        log_writer.stop()
@@ -0,0 +1,22 @@
+# Melissae SSH session capture, sourced at the end of ~/.bashrc
+# The client is resolved once per session, then the history builtin appends each new command to the session log at every prompt (no fork per command)
+MELISSAE_SESSIONS=/host-logs/ssh/sessions
+
+if [ -n "$SSH_CLIENT" ] && [ -d "$MELISSAE_SESSIONS" ]; then
+    # Nested shells keep the session of the login shell
+    if [ -z "$MELISSAE_SESSION" ]; then
+        printf -v MELISSAE_SESSION '%x-%x' "$EPOCHSECONDS" "$$"
+        export MELISSAE_SESSION
+        melissae_port="${SSH_CLIENT#* }"
+        # Header: format version, session id, client ip, client port, start time
+        printf '#melissae 1 %s %s %s %s\n' "$MELISSAE_SESSION" "${SSH_CLIENT%% *}" "${melissae_port%% *}" "$EPOCHSECONDS" >> "$MELISSAE_SESSIONS/$MELISSAE_SESSION.log"
+        unset melissae_port
+    fi
+
+    # An empty HISTTIMEFORMAT still writes "#<epoch>" before each command, without changing what `history` shows
+    HISTTIMEFORMAT="${HISTTIMEFORMAT-}"
+    HISTCONTROL=
+    PROMPT_COMMAND="history -a $MELISSAE_SESSIONS/$MELISSAE_SESSION.log"
+    # Last command of the session (exit, logout...) has no prompt after it
+    trap "history -a $MELISSAE_SESSIONS/$MELISSAE_SESSION.log" EXIT
+fi
@@ -0,0 +1,286 @@
+import os
+import csv
+import io
+import json
+import time
+import uuid
+import threading
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Tuple
+from jsonIO import load_file, dump_file, dumps
+
+# Paths
+WORKING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEEDS_DIR = os.path.join(WORKING_DIR, 'feeds')
+
+# Written by threatIntel.py (this honeypot) and multiAggregator.py (every instance)
+SOURCES = ('local', 'aggregated')
+
+STATE_VERSION = 1
+STATE_FILE = 'state.json'
+
+# An IP is listed in every feed whose threshold its current (decayed) score reaches, so it ages out of the feeds
+THRESHOLDS = {'suspicious': 2, 'malicious': 4, 'nefarious': 5}
+CIDR_SUFFIX = '-cidr'
+
+# Fields of a listed IP, a change of any of them is reported as an update
+FIELDS = ('verdict', 'protocol-score', 'current-verdict', 'asn', 'as_org', 'country', 'hosting')
+
+# Versions kept per feed, a client further behind gets the whole list
+MAX_HISTORY = 1000
+
+# Formats of the IP feeds, CIDR feeds are plain text only
+FORMATS = {
+    'txt': ('txt', 'text/plain; charset=utf-8'),
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'stix': ('stix.json', 'application/stix+json;version=2.1')
+}
+
+# STIX ids are derived from the IP, an indicator keeps its id across versions
+STIX_NAMESPACE = uuid.UUID('6f1c7a52-4d3e-5b8a-9c21-7e0d4a6b3f18')
+
+def feed_formats(name: str) -> Tuple[str, ...]:
+    return ('txt',) if name.endswith(CIDR_SUFFIX) else tuple(FORMATS)
+
+def _now() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+# Feed contents
+def build_entries(threats: Iterable[Dict]) -> Dict[str, Dict[str, List]]:
+    """Feed name -> {key: fields}, keys are IPs or collapsed networks"""
+    listed = {threshold: {} for threshold in THRESHOLDS}
+    for threat in threats:
+        ip = threat.get('ip')
+        score = threat.get('current-score', threat.get('protocol-score'))
+        if not ip or not isinstance(score, int):
+            continue
+        try:
+            ip = str(ipaddress.ip_address(ip))
+        except ValueError:
+            continue
+        fields = [threat.get(field) for field in FIELDS]
+        for threshold, level in THRESHOLDS.items():
+            if score >= level:
+                listed[threshold][ip] = fields
+
+    feeds = {}
+    for threshold, entries in listed.items():
+        feeds[threshold] = entries
+        feeds[threshold + CIDR_SUFFIX] = {network: [] for network in collapse(entries)}
+    return feeds
+
+def collapse(ips: Iterable[str]) -> List[str]:
+    """Smallest list of networks covering exactly these IPs, IPv4 first"""
+    v4, v6 = [], []
+    for ip in ips:
+        address = ipaddress.ip_address(ip)
+        (v4 if address.version == 4 else v6).append(ipaddress.ip_network(address))
+    return [str(network) for networks in (v4, v6) for network in ipaddress.collapse_addresses(networks)]
+
+def render(name: str, fmt: str, feed: Dict) -> bytes:
+    """Full feed body in one of feed_formats(name)"""
+    keys = sorted(feed['entries'], key=sort_key)
+    if fmt == 'txt':
+        return ''.join(f"{key}\n" for key in keys).encode('utf-8')
+    if fmt == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(('ip',) + FIELDS + ('first_listed', 'last_updated'))
+        for key in keys:
+            fields = ['' if value is None else value for value in feed['entries'][key]]
+            writer.writerow([key] + fields + feed['times'].get(key, ['', '']))
+        return out.getvalue().encode('utf-8')
+    if fmt == 'stix':
+        return dumps(stix_bundle(name, feed, keys))
+    raise ValueError(f"Unknown format: {fmt}")
+
+def stix_bundle(name: str, feed: Dict, keys: List[str]) -> Dict:
+    objects = []
+    for key in keys:
+        fields = dict(zip(FIELDS, feed['entries'][key]))
+        created, modified = feed['times'].get(key, [feed['updated'], feed['updated']])
+        kind = 'ipv6-addr' if ':' in key else 'ipv4-addr'
+        indicator = {
+            "type": "indicator",
+            "spec_version": "2.1",
+            "id": f"indicator--{uuid.uuid5(STIX_NAMESPACE, key)}",
+            "created": created,
+            "modified": modified,
+            "name": f"{key} ({fields['current-verdict'] or fields['verdict']})",
+            "indicator_types": ["malicious-activity"],
+            "pattern": f"[{kind}:value = '{key}']",
+            "pattern_type": "stix",
+            "valid_from": created,
+            "labels": [fields['current-verdict'] or fields['verdict']]
+        }
+        objects.append(indicator)
+    return {
+        "type": "bundle",
+        "id": f"bundle--{uuid.uuid5(STIX_NAMESPACE, '/'.join((feed['id'], name, str(feed['version']))))}",
+        "objects": objects
+    }
+
+def sort_key(key: str) -> Tuple[int, int]:
+    network = ipaddress.ip_network(key)
+    return network.version, int(network.network_address)
+
+# Written by the scoring stage: each feed is compared with its last version, only changed feeds get a new one
+class FeedWriter:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.state_path = os.path.join(directory, STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        state = {}
+        if os.path.exists(self.state_path):
+            try:
+                state = load_file(self.state_path)
+            except (json.JSONDecodeError, IOError):
+                state = {}
+        if state.get('version') != STATE_VERSION:
+            # A new id tells the clients that versions start over
+            state = {"version": STATE_VERSION, "id": uuid.uuid4().hex, "feeds": {}}
+        return state
+
+    def update(self, threats: Iterable[Dict]) -> Dict[str, int]:
+        """Fold a scoring run into the feeds, return the new version of each feed that changed"""
+        now = _now()
+        changed = {}
+        for name, entries in build_entries(threats).items():
+            feed = self.state['feeds'].get(name)
+            if feed is None:
+                feed = self.state['feeds'][name] = {"version": 0, "updated": now, "entries": {}, "times": {}, "history": []}
+            old = feed['entries']
+            added = sorted(key for key in entries if key not in old)
+            removed = sorted(key for key in old if key not in entries)
+            updated = sorted(key for key, fields in entries.items() if key in old and old[key] != fields)
+            if not (added or removed or updated) and feed['version']:
+                continue
+
+            feed['version'] += 1
+            feed['updated'] = now
+            feed['entries'] = entries
+            times = feed['times']
+            for key in removed:
+                times.pop(key, None)
+            for key in added:
+                times[key] = [now, now]
+            for key in updated:
+                times.setdefault(key, [now, now])[1] = now
+            feed['history'].append([feed['version'], added, removed, updated])
+            del feed['history'][:-MAX_HISTORY]
+            changed[name] = feed['version']
+
+        if changed:
+            dump_file(self.state, self.state_path)
+            for name in changed:
+                self._write_files(name)
+        return changed
+
+    def _write_files(self, name: str) -> None:
+        # Static copies for enforcement points that pull files rather than the server API
+        feed = dict(self.state['feeds'][name], id=self.state['id'])
+        for fmt in feed_formats(name):
+            path = os.path.join(self.directory, f"{name}.{FORMATS[fmt][0]}")
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(render(name, fmt, feed))
+            os.replace(temp_path, path)
+
+def update_feeds(threats: List[Dict], source: str, feeds_dir: str = FEEDS_DIR) -> Dict[str, int]:
+    try:
+        changed = FeedWriter(os.path.join(feeds_dir, source)).update(threats)
+    except IOError as e:
+        print(f"[WARN] Failed to update the {source} blocklist feeds: {e}")
+        return {}
+    if changed:
+        print(f"[INFO] Blocklist feeds updated: {', '.join(f'{name} v{version}' for name, version in changed.items())}")
+    return changed
+
+# Served side: the state is reloaded when the scoring stage rewrote it, bodies are rendered once per version
+class FeedReader:
+    def __init__(self, directory: str):
+        self.state_path = os.path.join(directory, STATE_FILE)
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.state = {"id": '', "feeds": {}}
+        self.bodies = {}
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.state_path)
+            stamp = stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self.stamp:
+            return
+        try:
+            state = load_file(self.state_path) if stamp else {}
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"[WARN] Failed to read feeds {self.state_path}: {e}")
+            return
+        self.stamp = stamp
+        self.state = state if state.get('version') == STATE_VERSION else {"id": '', "feeds": {}}
+        self.bodies = {}
+
+    def feed(self, name: str) -> Optional[Dict]:
+        with self.lock:
+            self._refresh()
+            feed = self.state['feeds'].get(name)
+            return dict(feed, id=self.state['id']) if feed else None
+
+    def index(self) -> Dict:
+        with self.lock:
+            self._refresh()
+            return {
+                "id": self.state['id'],
+                "feeds": [
+                    {"name": name, "version": feed['version'], "updated": feed['updated'], "count": len(feed['entries']), "formats": list(feed_formats(name))}
+                    for name, feed in self.state['feeds'].items()
+                ]
+            }
+
+    def body(self, name: str, fmt: str) -> Optional[Tuple[Dict, bytes]]:
+        """(feed, rendered body) of the current version"""
+        with self.lock:
+            self._refresh()
+            feed = self.state['feeds'].get(name)
+            if feed is None:
+                return None
+            feed = dict(feed, id=self.state['id'])
+            cached = self.bodies.get((name, fmt))
+            if cached is None or cached[0] != feed['version']:
+                cached = self.bodies[(name, fmt)] = (feed['version'], render(name, fmt, feed))
+            return feed, cached[1]
+
+def diff(feed: Dict, since: int, feed_id: str = '') -> Dict:
+    """Keys added, removed and updated between version since (of the feed with that id, when given) and the current one"""
+    history = feed['history']
+    result = {"id": feed['id'], "version": feed['version'], "since": since, "full": False}
+    # Further behind than the history goes, or a version from before the state was reset (versions start over with a new id)
+    if (feed_id and feed_id != feed['id']) or since > feed['version'] or (history and since < history[0][0] - 1):
+        result.update(full=True, added=sorted(feed['entries'], key=sort_key), removed=[], updated=[])
+        return result
+    added, removed, updated = set(), set(), set()
+    for version, version_added, version_removed, version_updated in history:
+        if version <= since:
+            continue
+        for key in version_added:
+            if key in removed:
+                # Listed again: the client still has it, its fields may have changed
+                removed.discard(key)
+                updated.add(key)
+            else:
+                added.add(key)
+        for key in version_removed:
+            if key in added:
+                added.discard(key)
+            else:
+                removed.add(key)
+            updated.discard(key)
+        for key in version_updated:
+            if key not in added:
+                updated.add(key)
+    result.update(added=sorted(added, key=sort_key), removed=sorted(removed, key=sort_key), updated=sorted(updated, key=sort_key))
+    return result
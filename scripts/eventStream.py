@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import threading
+import itertools
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, List, Optional, Tuple
+from metrics import MetricsRegistry, render_directory, CONTENT_TYPE
+from jsonIO import dumps, loads, load_file
+from sourceCursors import LogWindow
+
+VERDICT_RANKS = {"benign": 1, "suspicious": 2, "malicious": 4, "nefarious": 5}
+HISTORY_SIZE = 10000
+KEEPALIVE_INTERVAL = 15
+RETRY_MS = 5000
+
+# Collector metrics, served on /metrics with the snapshots left by the cron scripts
+METRICS = MetricsRegistry()
+STREAM_EVENTS = METRICS.counter('melissae_stream_events_total', 'New logs and verdict changes published by the collector')
+POLL_LATENCY = METRICS.histogram('melissae_stream_poll_seconds', 'Time to read and publish the parser output after it changed')
+
+class StreamEvent:
+    __slots__ = ('seq', 'protocol', 'instance', 'rank', 'frame')
+
+    def __init__(self, seq: int, protocol: str, instance: str, rank: int, frame: bytes):
+        self.seq = seq
+        self.protocol = protocol
+        self.instance = instance
+        self.rank = rank
+        self.frame = frame
+
+class StreamFilter:
+    def __init__(self, protocols: Optional[List[str]] = None, instance: str = '', min_rank: int = 0):
+        self.protocols = set(protocols) if protocols else None
+        self.instance = instance
+        self.min_rank = min_rank
+
+    @classmethod
+    def from_query(cls, query: Dict[str, List[str]]) -> 'StreamFilter':
+        protocols = [p.strip().lower() for value in query.get('protocol', []) for p in value.split(',') if p.strip()]
+        instance = query.get('instance', [''])[0]
+        min_rank = VERDICT_RANKS.get(query.get('min_verdict', [''])[0].lower(), 0)
+        return cls(protocols, instance, min_rank)
+
+    def accepts(self, event: StreamEvent) -> bool:
+        if self.protocols is not None and event.protocol and event.protocol not in self.protocols:
+            return False
+        if self.instance and event.instance != self.instance:
+            return False
+        return event.rank >= self.min_rank
+
+# Fan-out of server-sent events, each event is serialized once and shared by every viewer
+class EventBroadcaster:
+    def __init__(self, history: int = HISTORY_SIZE, epoch: str = ''):
+        # Event ids are "<epoch>-<seq>", a restarted server never resumes an old cursor
+        self.epoch = epoch or format(int(time.time()), 'x')
+        self.seq = 0
+        self.events = deque(maxlen=history)
+        self.condition = threading.Condition()
+
+    def publish(self, event_type: str, data: Dict, protocol: str = '', instance: str = '', verdict: str = '') -> None:
+        self.publish_many([(event_type, data, protocol, instance, verdict)])
+
+    def publish_many(self, batch: List[Tuple[str, Dict, str, str, str]]) -> None:
+        if not batch:
+            return
+        payloads = [dumps(data) for _, data, _, _, _ in batch]
+        with self.condition:
+            self._append([
+                (self.seq + i, event_type, payload, protocol, instance, verdict)
+                for i, ((event_type, _, protocol, instance, verdict), payload) in enumerate(zip(batch, payloads), 1)
+            ])
+
+    def append_frames(self, events: List[Tuple[int, str, bytes, str, str, str]]) -> None:
+        """Add events numbered elsewhere (seq, type, JSON payload, protocol, instance, verdict), older sequences are ignored"""
+        with self.condition:
+            self._append(events)
+
+    def _append(self, events: List[Tuple[int, str, bytes, str, str, str]]) -> None:
+        for seq, event_type, payload, protocol, instance, verdict in events:
+            if seq <= self.seq:
+                continue
+            # History must stay contiguous, cursors from before a gap get a reset
+            if seq != self.seq + 1:
+                self.events.clear()
+            self.seq = seq
+            frame = f"id: {self.epoch}-{seq}\nevent: {event_type}\ndata: ".encode('utf-8') + payload + b"\n\n"
+            self.events.append(StreamEvent(seq, protocol, instance, VERDICT_RANKS.get(verdict, 0), frame))
+        self.condition.notify_all()
+
+    def resolve_cursor(self, last_event_id: str) -> Tuple[int, bool]:
+        """Sequence to resume after, and whether the client missed events it can no longer get"""
+        with self.condition:
+            if not last_event_id:
+                return self.seq, False
+            epoch, _, seq = last_event_id.partition('-')
+            if epoch != self.epoch or not seq.isdigit():
+                return self.seq, True
+            seq = int(seq)
+            oldest = self.events[0].seq if self.events else self.seq + 1
+            if seq + 1 < oldest or seq > self.seq:
+                return self.seq, True
+            return seq, False
+
+    def wait_for(self, after_seq: int, timeout: float) -> Tuple[List[StreamEvent], Optional[int]]:
+        """Events after after_seq, or none and the sequence to resume after when some of them already left the history"""
+        with self.condition:
+            if self.seq <= after_seq:
+                self.condition.wait(timeout)
+            if self.seq <= after_seq or not self.events:
+                return [], None
+            start = after_seq + 1 - self.events[0].seq
+            if start < 0:
+                # The client fell more than the history behind (large upload, slow reader), it has to reload
+                return [], self.seq
+            return list(itertools.islice(self.events, start, None)), None
+
+    def reset_frame(self, seq: int) -> bytes:
+        """Tells the client to reload full data before applying deltas again"""
+        return f"id: {self.epoch}-{seq}\nevent: reset\ndata: {{}}\n\n".encode('ascii')
+
+    def stream_to(self, wfile, stream_filter: StreamFilter, last_event_id: str = '') -> None:
+        """Write events to a client until it disconnects"""
+        after, missed = self.resolve_cursor(last_event_id)
+        try:
+            wfile.write(f"retry: {RETRY_MS}\n\n".encode('ascii'))
+            if missed:
+                wfile.write(self.reset_frame(after))
+            wfile.flush()
+            while True:
+                events, reset_at = self.wait_for(after, KEEPALIVE_INTERVAL)
+                if reset_at is not None:
+                    after = reset_at
+                    chunk = self.reset_frame(after)
+                elif events:
+                    after = events[-1].seq
+                    chunk = b''.join(event.frame for event in events if stream_filter.accepts(event))
+                else:
+                    chunk = b': keepalive\n\n'
+                if chunk:
+                    wfile.write(chunk)
+                    wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            return
+
+# Turns full uploads (logs + threats) into new-log and verdict-change events
+class IngestTracker:
+    def __init__(self):
+        self.windows = {}   # instance -> LogWindow over the logs of its uploads
+        self.verdicts = {}  # instance -> {ip: verdict}
+        self.lock = threading.Lock()
+
+    def is_tracked(self, instance_id: str) -> bool:
+        return instance_id in self.windows
+
+    def seed(self, instance_id: str, logs: List[Dict], threats: List[Dict]) -> None:
+        """Start over from what is stored for an instance"""
+        with self.lock:
+            self.windows.pop(instance_id, None)
+            self.verdicts.pop(instance_id, None)
+        self.diff(instance_id, logs, threats)
+
+    def diff(self, instance_id: str, logs: List[Dict], threats: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        with self.lock:
+            # A log that reaches the instance late, with an older timestamp, is still new
+            window = self.windows.setdefault(instance_id, LogWindow())
+            return list(window.unseen(logs)), self._verdict_changes(instance_id, threats)
+
+    def verdict_of(self, instance_id: str, ip: str) -> str:
+        return self.verdicts.get(instance_id, {}).get(ip, '')
+
+    def _verdict_changes(self, instance_id: str, threats: List[Dict]) -> List[Dict]:
+        known = self.verdicts.setdefault(instance_id, {})
+        changes = []
+        for threat in threats:
+            ip = threat.get('ip')
+            verdict = threat.get('verdict')
+            if ip and verdict and known.get(ip) != verdict:
+                changes.append({"ip": ip, "previous": known.get(ip), "verdict": verdict, "protocol-score": threat.get('protocol-score')})
+                known[ip] = verdict
+        return changes
+
+    def publish(self, broadcaster: EventBroadcaster, instance_id: str, hostname: str, logs: List[Dict], threats: List[Dict], fresh: bool = False) -> int:
+        """Publish what a full upload added, or every log of a spooled batch (fresh), which only holds new logs"""
+        if fresh:
+            with self.lock:
+                new_logs, changes = logs, self._verdict_changes(instance_id, threats)
+        else:
+            new_logs, changes = self.diff(instance_id, logs, threats)
+        batch = []
+        for log in new_logs:
+            event = dict(log, instance_id=instance_id, hostname=hostname)
+            verdict = self.verdict_of(instance_id, log.get('ip', ''))
+            batch.append(('log', event, log.get('protocol', ''), instance_id, verdict))
+        for change in changes:
+            event = dict(change, instance_id=instance_id, hostname=hostname)
+            batch.append(('verdict', event, '', instance_id, change['verdict']))
+        broadcaster.publish_many(batch)
+        return len(batch)
+
+# Collector stream: tails the new entries of each parser run and publishes them with the verdict changes
+class CollectorWatcher:
+    def __init__(self, broadcaster: EventBroadcaster, new_logs_path: str, threats_path: str, instance_id: str = 'local', interval: float = 5):
+        self.broadcaster = broadcaster
+        self.new_logs_path = new_logs_path
+        self.threats_path = threats_path
+        self.instance_id = instance_id
+        self.interval = interval
+        self.tracker = IngestTracker()
+        # (inode, offset) read up to in new_logs_path, None until the first poll
+        self.tail = None
+        self.threats_mtime = None
+
+    def _read_json(self, path: str) -> List[Dict]:
+        try:
+            data = load_file(path)
+            return data if isinstance(data, list) else []
+        except (json.JSONDecodeError, IOError):
+            return []
+
+    def _mtime(self, path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _read_lines(self, path: str, offset: int, inode: Optional[int] = None) -> Tuple[Optional[int], int, List[Dict]]:
+        """(inode, offset after the last complete line, logs) of path read from offset, nothing if it is not that inode"""
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if inode is not None and stat.st_ino != inode:
+                    return None, 0, []
+                # Truncated by hand: start over
+                if stat.st_size < offset:
+                    offset = 0
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return None, 0, []
+        # A line still being written is read on the next poll
+        end = data.rfind(b'\n') + 1
+        logs = []
+        for line in data[:end].splitlines():
+            try:
+                logs.append(loads(line))
+            except ValueError:
+                continue
+        return stat.st_ino, offset + end, logs
+
+    def _new_logs(self) -> List[Dict]:
+        try:
+            stat = os.stat(self.new_logs_path)
+        except FileNotFoundError:
+            if self.tail is None:
+                # Created by the next parser run, all of it is new
+                self.tail = (None, 0)
+            return []
+        if self.tail is None:
+            # What the parser wrote before the stream started is not new
+            self.tail = (stat.st_ino, stat.st_size)
+            return []
+        inode, offset = self.tail
+        logs = []
+        if stat.st_ino != inode:
+            # Moved to .1 by the parser: the end of the previous file first
+            if inode is not None:
+                logs = self._read_lines(f"{self.new_logs_path}.1", offset, inode)[2]
+            offset = 0
+        inode, offset, new_logs = self._read_lines(self.new_logs_path, offset)
+        if inode is not None:
+            self.tail = (inode, offset)
+        return logs + new_logs
+
+    def poll(self) -> None:
+        start = time.perf_counter()
+        seeded = self.tracker.is_tracked(self.instance_id)
+        logs = self._new_logs()
+        threats = []
+        mtime = self._mtime(self.threats_path)
+        if mtime != self.threats_mtime:
+            self.threats_mtime = mtime
+            threats = self._read_json(self.threats_path)
+        if not seeded:
+            self.tracker.seed(self.instance_id, [], threats)
+            return
+        if not logs and not threats:
+            return
+        # The parser already left out the entries earlier runs saw
+        published = self.tracker.publish(self.broadcaster, self.instance_id, 'localhost', logs, threats, fresh=True)
+        STREAM_EVENTS.inc(amount=published)
+        POLL_LATENCY.observe(time.perf_counter() - start)
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[ERROR] Collector stream poll failed: {e}")
+            time.sleep(self.interval)
+
+class CollectorStreamHandler(BaseHTTPRequestHandler):
+    broadcaster = None
+    allowed_origins = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_metrics(self):
+        body = (METRICS.render() + render_directory()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed_path = urlparse(self.path)
+        if parsed_path.path == '/metrics':
+            self._send_metrics()
+            return
+        if parsed_path.path != '/api/stream':
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        origin = self.headers.get('Origin', '')
+        if origin in self.allowed_origins:
+            self.send_header('Access-Control-Allow-Origin', origin)
+        self.end_headers()
+        stream_filter = StreamFilter.from_query(parse_qs(parsed_path.query))
+        self.broadcaster.stream_to(self.wfile, stream_filter, self.headers.get('Last-Event-ID', ''))
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Melissae collector event stream')
+    parser.add_argument('--host', default='127.0.0.1', help='Listen address')
+    parser.add_argument('--port', type=int, default=8889, help='Listen port')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between checks of the parser output')
+    args = parser.parse_args()
+
+    working_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    broadcaster = EventBroadcaster()
+    watcher = CollectorWatcher(
+        broadcaster,
+        os.path.join(working_dir, 'dashboard/json/new-logs.ndjson'),
+        os.path.join(working_dir, 'dashboard/json/threats.json'),
+        interval=args.interval
+    )
+    threading.Thread(target=watcher.run, daemon=True).start()
+
+    CollectorStreamHandler.broadcaster = broadcaster
+    CollectorStreamHandler.allowed_origins = ['http://localhost:9999', 'http://127.0.0.1:9999']
+    server = ThreadingHTTPServer((args.host, args.port), CollectorStreamHandler)
+    server.daemon_threads = True
+    print(f"[INFO] Collector event stream on {args.host}:{args.port}/api/stream, metrics on /metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Stream stopped by user")
+
+if __name__ == "__main__":
+    main()
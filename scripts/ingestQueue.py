@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import zlib
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from jsonIO import load_file, dump_file
+
+# Defaults, overridden by server.ingest_workers and server.ingest_queue
+INGEST_WORKERS = 4
+INGEST_QUEUE = 256
+
+# Finished uploads whose status can still be queried
+MAX_STATUSES = 10000
+
+# Seconds an agent is told to wait when the queue is full
+RETRY_AFTER = 5
+
+# Shared status files (pre-forked workers) older than this are removed
+STATUS_TTL = 3600
+
+# An upload rejected by the worker (bad JSON, missing fields), reported as its status error
+class IngestError(ValueError):
+    pass
+
+# One accepted upload, the body is dropped once processed
+class IngestJob:
+    __slots__ = ('id', 'checksum', 'size', 'body', 'status', 'received', 'started', 'finished', 'error')
+
+    def __init__(self, body: bytes, checksum: str):
+        self.id = uuid.uuid4().hex
+        self.checksum = checksum
+        self.size = len(body)
+        self.body = body
+        self.status = 'queued'
+        self.received = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def to_dict(self) -> Dict:
+        record = {
+            "ingest_id": self.id,
+            "status": self.status,
+            "checksum": self.checksum,
+            "size": self.size,
+            "received": self.received
+        }
+        if self.finished is not None:
+            record["finished"] = self.finished
+            record["duration"] = round(self.finished - self.received, 6)
+        if self.error:
+            record["error"] = self.error
+        return record
+
+# Bounded queues drained by a pool of worker threads, one queue per worker so uploads sharing a key stay in order
+class IngestQueue:
+    def __init__(self, process: Callable[[IngestJob], None], workers: int = INGEST_WORKERS, capacity: int = INGEST_QUEUE, status_dir: str = ''):
+        self.process = process
+        workers = max(1, workers)
+        self.queues = [queue.Queue(maxsize=max(1, capacity // workers)) for _ in range(workers)]
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        # Checksum -> job, a body sent again while its first copy is queued or stored is not processed twice
+        self.checksums = {}
+        self.counts = {"accepted": 0, "duplicates": 0, "rejected": 0, "stored": 0, "failed": 0}
+        # Statuses are also written there when several server processes answer status requests
+        self.status_dir = status_dir
+        if status_dir:
+            os.makedirs(status_dir, exist_ok=True)
+        # Threads start with the first upload, a supervisor never forks while they run
+        self.started = False
+
+    def _start(self) -> None:
+        self.started = True
+        for jobs in self.queues:
+            threading.Thread(target=self._work, args=(jobs,), daemon=True).start()
+
+    def _share(self, job: IngestJob) -> None:
+        if not self.status_dir:
+            return
+        try:
+            dump_file(job.to_dict(), os.path.join(self.status_dir, f"{job.id}.json"))
+        except IOError as e:
+            print(f"[WARN] Failed to write ingest status {job.id}: {e}")
+
+    def _unshare(self, job: IngestJob) -> None:
+        if self.status_dir:
+            try:
+                os.remove(os.path.join(self.status_dir, f"{job.id}.json"))
+            except OSError:
+                pass
+
+    def _expire_shared(self) -> None:
+        cutoff = time.time() - STATUS_TTL
+        for entry in os.scandir(self.status_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+    def submit(self, body: bytes, key: str = '') -> Tuple[Optional[IngestJob], bool]:
+        """Queue a raw upload, return (job, duplicate), or (None, False) when the queue is full"""
+        checksum = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            if not self.started:
+                self._start()
+            existing = self.checksums.get(checksum)
+            if existing is not None and existing.status != 'failed':
+                self.counts["duplicates"] += 1
+                return existing, True
+            job = IngestJob(body, checksum)
+            # Written before a worker can pick the job, so it never overwrites the final status
+            self._share(job)
+            try:
+                self.queues[zlib.crc32(key.encode('utf-8')) % len(self.queues)].put_nowait(job)
+            except queue.Full:
+                self.counts["rejected"] += 1
+                self._unshare(job)
+                return None, False
+            self.counts["accepted"] += 1
+            self.jobs[job.id] = job
+            self.checksums[checksum] = job
+            while len(self.jobs) > MAX_STATUSES:
+                _, oldest = self.jobs.popitem(last=False)
+                if self.checksums.get(oldest.checksum) is oldest:
+                    del self.checksums[oldest.checksum]
+            return job, False
+
+    def _work(self, jobs: queue.Queue) -> None:
+        while True:
+            job = jobs.get()
+            job.status = 'processing'
+            job.started = time.time()
+            try:
+                self.process(job)
+                job.status = 'stored'
+            except IngestError as e:
+                job.status = 'failed'
+                job.error = str(e)
+            except Exception as e:
+                print(f"[ERROR] Processing upload {job.id}: {e}")
+                job.status = 'failed'
+                job.error = 'Internal server error'
+            job.body = None
+            job.finished = time.time()
+            with self.lock:
+                self.counts[job.status] += 1
+                finished = self.counts["stored"] + self.counts["failed"]
+            self._share(job)
+            if self.status_dir and finished % 1000 == 0:
+                self._expire_shared()
+            jobs.task_done()
+
+    def status(self, ingest_id: str) -> Optional[Dict]:
+        with self.lock:
+            job = self.jobs.get(ingest_id)
+            if job:
+                return job.to_dict()
+        # Accepted by another worker process
+        if self.status_dir and ingest_id.isalnum():
+            path = os.path.join(self.status_dir, f"{ingest_id}.json")
+            try:
+                return load_file(path)
+            except (IOError, ValueError):
+                return None
+        return None
+
+    def depth(self) -> int:
+        return sum(jobs.qsize() for jobs in self.queues)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            counts = dict(self.counts)
+        return {
+            "workers": len(self.queues),
+            "capacity": sum(jobs.maxsize for jobs in self.queues),
+            "queued": self.depth(),
+            **counts
+        }
+
+    def drain(self) -> None:
+        """Wait until every accepted upload was processed"""
+        for jobs in self.queues:
+            jobs.join()
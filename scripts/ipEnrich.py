@@ -0,0 +1,330 @@
+import os
+import csv
+import json
+import glob
+import bisect
+import socket
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from jsonIO import load_file, dump_file
+
+# MaxMind .mmdb files are read when maxminddb is installed, CSV/TSV datasets need nothing
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+# Paths
+WORKING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENRICHMENT_DIR = os.path.join(WORKING_DIR, 'enrichment')
+INDEX_FILE = '.index.json'
+
+INDEX_VERSION = 1
+CACHE_SIZE = 65536
+
+# Fields attached to threats
+FIELDS = ('asn', 'as_org', 'country', 'hosting')
+EMPTY = [None] * len(FIELDS)
+
+# Dataset columns, GeoLite2 CSV names included
+COLUMNS = {
+    'network': ('network', 'cidr', 'prefix'),
+    'start': ('start', 'range_start', 'ip_start', 'first_ip'),
+    'end': ('end', 'range_end', 'ip_end', 'last_ip'),
+    'asn': ('asn', 'as_number', 'autonomous_system_number'),
+    'as_org': ('as_org', 'org', 'organization', 'as_description', 'autonomous_system_organization'),
+    'country': ('country', 'country_code', 'country_iso_code'),
+    'hosting': ('hosting', 'provider', 'hosting_provider'),
+    'geoname_id': ('geoname_id', 'registered_country_geoname_id')
+}
+
+# Headerless TSV layout of the iptoasn.com dumps
+IPTOASN_COLUMNS = ('start', 'end', 'asn', 'country', 'as_org')
+
+def _column_map(header: List[str]) -> Dict[str, int]:
+    names = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    return columns
+
+def _clean(field: str, value: str):
+    value = value.strip()
+    if not value or value in ('-', 'None', 'Not routed'):
+        return None
+    if field == 'asn':
+        value = value.upper()
+        value = value[2:] if value.startswith('AS') else value
+        return int(value) if value.isdigit() and value != '0' else None
+    if field == 'country':
+        return value.upper()
+    return value
+
+# Addresses as (version, integer), inet_pton is much faster than the ipaddress module
+def _parse_address(text: str) -> Tuple[int, int]:
+    try:
+        if ':' in text:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), 'big')
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big')
+    except OSError:
+        raise ValueError(f"Invalid IP address {text!r}")
+
+def parse_ip(text: str) -> Tuple[int, int]:
+    version, value = _parse_address(text)
+    # IPv4-mapped IPv6 addresses are looked up as IPv4
+    if version == 6 and value >> 32 == 0xffff:
+        return 4, value & 0xffffffff
+    return version, value
+
+def parse_network(text: str) -> Tuple[int, int, int]:
+    """(version, first, last) of a CIDR network, host bits are ignored"""
+    address, _, prefix = text.partition('/')
+    version, value = _parse_address(address)
+    bits = 32 if version == 4 else 128
+    length = int(prefix) if prefix else bits
+    if not 0 <= length <= bits:
+        raise ValueError(f"Invalid prefix length in {text!r}")
+    host = (1 << (bits - length)) - 1
+    return version, value & ~host, (value & ~host) | host
+
+# GeoLite2 Country/City blocks only carry geoname ids, the matching Locations file has the ISO codes
+def _load_geonames(directory: str) -> Dict[str, str]:
+    geonames = {}
+    for path in glob.glob(os.path.join(directory, '*-Locations-en.csv')):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get('country_iso_code'):
+                    geonames[row['geoname_id']] = row['country_iso_code']
+    return geonames
+
+def read_dataset(path: str, geonames: Dict[str, str]) -> List[Tuple[int, int, int, Tuple]]:
+    """(version, start, end, fields) per row, fields follow FIELDS"""
+    rows = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='\t' if path.endswith('.tsv') else ',')
+        first = next(reader, None)
+        if not first:
+            return rows
+        columns = _column_map(first)
+        if 'network' not in columns and 'start' not in columns:
+            # No header: only the iptoasn layout is known
+            columns = {field: i for i, field in enumerate(IPTOASN_COLUMNS)}
+            reader = [first] + list(reader) if path.endswith('.tsv') else []
+        field_columns = [(field, columns.get(field)) for field in FIELDS]
+        geoname_column = columns.get('geoname_id')
+        for row in reader:
+            try:
+                if 'network' in columns:
+                    version, start, end = parse_network(row[columns['network']].strip())
+                else:
+                    version, start = parse_ip(row[columns['start']].strip())
+                    end = parse_ip(row[columns['end']].strip())[1]
+                fields = [_clean(field, row[i]) if i is not None and i < len(row) else None for field, i in field_columns]
+            except (ValueError, IndexError):
+                continue
+            if geoname_column is not None and fields[2] is None and geoname_column < len(row):
+                fields[2] = geonames.get(row[geoname_column].strip())
+            if fields != EMPTY:
+                rows.append((version, start, end, tuple(fields)))
+    return rows
+
+# Sorted disjoint intervals per IP version, one lookup is a bisect on the starts
+class IntervalTable:
+    def __init__(self, typecode: Optional[str]):
+        self.starts = array(typecode) if typecode else []
+        self.ends = array(typecode) if typecode else []
+        self.values = array('I')
+
+    def build(self, ranges: List[Tuple[int, int, int]]) -> None:
+        """Append sorted disjoint (start, end, value) ranges"""
+        for start, end, value in ranges:
+            # Merge adjacent ranges carrying the same fields
+            if self.values and self.values[-1] == value and self.ends[-1] + 1 == start:
+                self.ends[-1] = end
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            self.values.append(value)
+
+    def find(self, ip: int) -> Optional[int]:
+        i = bisect.bisect_right(self.starts, ip) - 1
+        if i >= 0 and ip <= self.ends[i]:
+            return self.values[i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+class IPEnricher:
+    def __init__(self, directory: str = ENRICHMENT_DIR, cache_size: int = CACHE_SIZE):
+        self.directory = directory
+        self.tables = {4: IntervalTable('I'), 6: IntervalTable(None)}
+        self.records = []
+        self.readers = []
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _sources(self) -> Dict[str, List[int]]:
+        paths = []
+        for pattern in ('*.csv', '*.tsv'):
+            paths.extend(glob.glob(os.path.join(self.directory, pattern)))
+        # Locations files are listed too, so that updating one recompiles the index
+        sources = {}
+        for path in sorted(paths):
+            stat = os.stat(path)
+            sources[os.path.basename(path)] = [int(stat.st_mtime), stat.st_size]
+        return sources
+
+    def load(self) -> 'IPEnricher':
+        """Load every dataset of the directory, through the compiled index while the datasets are unchanged"""
+        if not os.path.isdir(self.directory):
+            return self
+        if maxminddb:
+            for path in sorted(glob.glob(os.path.join(self.directory, '*.mmdb'))):
+                try:
+                    self.readers.append(maxminddb.open_database(path, maxminddb.MODE_MMAP))
+                except (ValueError, IOError) as e:
+                    print(f"[WARN] Failed to open {path}: {e}")
+
+        sources = self._sources()
+        if not sources:
+            return self
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            index = load_file(index_path)
+            if index.get('version') == INDEX_VERSION and index.get('sources') == sources:
+                self._from_index(index)
+                return self
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, IOError):
+            pass
+
+        self._compile(sources)
+        try:
+            dump_file(self._to_index(sources), index_path)
+        except IOError as e:
+            print(f"[WARN] Failed to write {index_path}: {e}")
+        return self
+
+    def _compile(self, sources: Dict[str, List[int]]) -> None:
+        geonames = _load_geonames(self.directory)
+        record_ids = {}
+        ranges = {4: [], 6: []}
+        for name in sources:
+            if '-Locations-' in name:
+                continue
+            for version, start, end, fields in read_dataset(os.path.join(self.directory, name), geonames):
+                ranges[version].append((start, end, self._record(fields, record_ids)))
+        for version, version_ranges in ranges.items():
+            self._layer(version, version_ranges, record_ids)
+
+    def _record(self, fields: Tuple, record_ids: Dict[Tuple, int]) -> int:
+        # Identical field tuples are stored once
+        record = record_ids.get(fields)
+        if record is None:
+            record = record_ids[fields] = len(self.records)
+            self.records.append(fields)
+        return record
+
+    def _layer(self, version: int, ranges: List[Tuple[int, int, int]], record_ids: Dict[Tuple, int]) -> None:
+        # Nested networks or overlapping datasets (ASN file + country file) only need splitting where they overlap
+        ranges.sort()
+        flat = []
+        cluster = []
+        cluster_end = -1
+        for r in ranges:
+            if cluster and r[0] > cluster_end:
+                flat.extend(self._split(cluster, record_ids) if len(cluster) > 1 else cluster)
+                cluster = []
+            cluster.append(r)
+            cluster_end = max(cluster_end, r[1]) if len(cluster) > 1 else r[1]
+        flat.extend(self._split(cluster, record_ids) if len(cluster) > 1 else cluster)
+        self.tables[version].build(flat)
+
+    def _split(self, ranges: List[Tuple[int, int, int]], record_ids: Dict[Tuple, int]) -> List[Tuple[int, int, int]]:
+        """Cut overlapping ranges at every boundary, each piece takes every field from the narrowest range that has it"""
+        bounds = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+        pieces = []
+        active = []
+        position = 0
+        for lower, upper in zip(bounds, bounds[1:]):
+            while position < len(ranges) and ranges[position][0] <= lower:
+                active.append(ranges[position])
+                position += 1
+            active = [r for r in active if r[1] >= lower]
+            if not active:
+                continue
+            fields = [None] * len(FIELDS)
+            for _, _, record in sorted(active, key=lambda r: r[1] - r[0]):
+                for i, value in enumerate(self.records[record]):
+                    if fields[i] is None:
+                        fields[i] = value
+            pieces.append((lower, upper - 1, self._record(tuple(fields), record_ids)))
+        return pieces
+
+    def _to_index(self, sources: Dict[str, List[int]]) -> Dict:
+        v4, v6 = self.tables[4], self.tables[6]
+        return {
+            "version": INDEX_VERSION,
+            "sources": sources,
+            "records": [list(record) for record in self.records],
+            "v4": [list(v4.starts), list(v4.ends), list(v4.values)],
+            # IPv6 bounds do not fit JSON integers, hex keeps them short
+            "v6": [[f"{n:x}" for n in v6.starts], [f"{n:x}" for n in v6.ends], list(v6.values)]
+        }
+
+    def _from_index(self, index: Dict) -> None:
+        self.records = [tuple(record) for record in index['records']]
+        v4, v6 = self.tables[4], self.tables[6]
+        v4.starts.extend(index['v4'][0])
+        v4.ends.extend(index['v4'][1])
+        v4.values.extend(index['v4'][2])
+        v6.starts = [int(n, 16) for n in index['v6'][0]]
+        v6.ends = [int(n, 16) for n in index['v6'][1]]
+        v6.values.extend(index['v6'][2])
+
+    def _lookup(self, ip: str) -> Optional[Dict]:
+        try:
+            version, value = parse_ip(ip)
+        except ValueError:
+            return None
+        fields = [None] * len(FIELDS)
+        record = self.tables[version].find(value)
+        if record is not None:
+            fields = list(self.records[record])
+        for reader in self.readers:
+            if all(value is not None for value in fields):
+                break
+            self._fill_from_mmdb(reader.get(ip), fields)
+        result = {field: value for field, value in zip(FIELDS, fields) if value is not None}
+        return result or None
+
+    @staticmethod
+    def _fill_from_mmdb(data: Optional[Dict], fields: List) -> None:
+        if not data:
+            return
+        country = (data.get('country') or data.get('registered_country') or {}).get('iso_code')
+        found = {
+            'asn': data.get('autonomous_system_number'),
+            'as_org': data.get('autonomous_system_organization'),
+            'country': country,
+            'hosting': data.get('isp') if (data.get('traits') or {}).get('is_hosting_provider') else None
+        }
+        for i, field in enumerate(FIELDS):
+            if fields[i] is None and found[field] is not None:
+                fields[i] = found[field]
+
+    def enrich(self, threat: Dict) -> Dict:
+        """Add the known fields of threat['ip'] to the threat, in place"""
+        fields = self.lookup(threat.get('ip', ''))
+        if fields:
+            threat.update(fields)
+        return threat
+
+    def __len__(self) -> int:
+        return len(self.tables[4]) + len(self.tables[6]) + len(self.readers)
+
+def load_enricher(directory: str = ENRICHMENT_DIR) -> IPEnricher:
+    return IPEnricher(directory).load()
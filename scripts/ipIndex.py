@@ -0,0 +1,164 @@
+import bisect
+import heapq
+from array import array
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+from ipEnrich import parse_ip, parse_network
+from threatIntel import get_verdict
+from sessions import utc_event_time
+
+# Results returned by a query by default and at most, rollups always cover the whole prefix
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+def parse_query(text: str) -> Tuple[int, int, int]:
+    """(version, first, last) of "10.0.0.0/16", "10.0.0.1-10.0.3.255" or a single IP"""
+    text = text.strip()
+    if '-' in text:
+        first, _, last = text.partition('-')
+        version, start = parse_ip(first.strip())
+        last_version, end = parse_ip(last.strip())
+        if version != last_version or end < start:
+            raise ValueError(f"Invalid range {text!r}")
+        return version, start, end
+    return parse_network(text)
+
+# Iterative segment tree over per-IP values, combine must be associative
+class SegmentTree:
+    def __init__(self, values: List[int], combine, empty: int = 0):
+        self.n = len(values)
+        self.combine = combine
+        self.empty = empty
+        self.tree = [empty] * self.n + list(values)
+        for i in range(self.n - 1, 0, -1):
+            self.tree[i] = combine(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def query(self, lo: int, hi: int) -> int:
+        """Combined value of positions [lo, hi)"""
+        result = self.empty
+        lo += self.n
+        hi += self.n
+        tree, combine = self.tree, self.combine
+        while lo < hi:
+            if lo & 1:
+                result = combine(result, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                result = combine(result, tree[hi])
+            lo >>= 1
+            hi >>= 1
+        return result
+
+# Distinct IPs of one version in integer order, with their logs, threats and per-IP rollups
+class IPTable:
+    def __init__(self, version: int, entries: List[Tuple[int, List[Dict], List[Dict], int, int, array]]):
+        entries.sort(key=lambda entry: entry[0])
+        self.version = version
+        self.keys = array('I', [entry[0] for entry in entries]) if version == 4 else [entry[0] for entry in entries]
+        self.logs = [entry[1] for entry in entries]
+        self.threats = [entry[2] for entry in entries]
+        # UTC epoch of each log, in the same order
+        self.times = [entry[5] for entry in entries]
+        # Log counts as prefix sums, so a prefix count is two lookups
+        self.log_counts = [0]
+        self.threat_counts = [0]
+        for _, logs, threats, _, _, _ in entries:
+            self.log_counts.append(self.log_counts[-1] + len(logs))
+            self.threat_counts.append(self.threat_counts[-1] + len(threats))
+        self.worst = SegmentTree([entry[3] for entry in entries], max)
+        self.instances = SegmentTree([entry[4] for entry in entries], int.__or__)
+
+    def span(self, first: int, last: int) -> Tuple[int, int]:
+        return bisect.bisect_left(self.keys, first), bisect.bisect_right(self.keys, last)
+
+# Read-only index of the aggregated logs and threats, rebuilt when instances upload new data
+class IPIndex:
+    def __init__(self, logs: List[Dict], threats: List[Dict], version: int = 0, timezones: Optional[Dict[str, str]] = None):
+        self.version = version
+        timezones = timezones or {}
+        self.instance_ids = []
+        bits = {}
+        ips = {}
+
+        def entry_for(record: Dict) -> Optional[List]:
+            try:
+                key = parse_ip(record.get('ip', ''))
+            except (ValueError, TypeError, AttributeError):
+                return None
+            entry = ips.get(key)
+            if entry is None:
+                entry = ips[key] = [key[1], [], [], 0, 0, None]
+            instance_id = record.get('instance_id', 'unknown')
+            bit = bits.get(instance_id)
+            if bit is None:
+                bit = bits[instance_id] = 1 << len(self.instance_ids)
+                self.instance_ids.append(instance_id)
+            entry[4] |= bit
+            return entry
+
+        for log in logs:
+            entry = entry_for(log)
+            if entry is not None:
+                entry[1].append(log)
+        for threat in threats:
+            entry = entry_for(threat)
+            if entry is not None:
+                entry[2].append(threat)
+                score = threat.get('protocol-score', 0)
+                if isinstance(score, int) and score > entry[3]:
+                    entry[3] = score
+
+        def log_time(log: Dict) -> int:
+            try:
+                return utc_event_time(log.get('date', ''), log.get('hour', ''), timezones.get(log.get('instance_id'), 'UTC'))
+            except ValueError:
+                return 0
+
+        # Logs of one IP may come from several instances, one after the other, some logging in local time
+        # Each IP's logs are sorted on UTC time, so queries can merge them lazily
+        for entry in ips.values():
+            timed = sorted(((log_time(log), log) for log in entry[1]), key=itemgetter(0))
+            entry[1] = [log for _, log in timed]
+            entry[5] = array('q', [second for second, _ in timed])
+
+        self.tables = {
+            version: IPTable(version, [tuple(entry) for key, entry in ips.items() if key[0] == version])
+            for version in (4, 6)
+        }
+
+    def _instances(self, mask: int) -> List[str]:
+        return [instance_id for i, instance_id in enumerate(self.instance_ids) if mask >> i & 1]
+
+    def summary(self, table: IPTable, lo: int, hi: int) -> Dict:
+        """Rollup of positions [lo, hi), O(log n) whatever the prefix size"""
+        worst = table.worst.query(lo, hi)
+        return {
+            "ips": hi - lo,
+            "logs": table.log_counts[hi] - table.log_counts[lo],
+            "threats": table.threat_counts[hi] - table.threat_counts[lo],
+            "worst_score": worst,
+            "worst_verdict": get_verdict(worst) if worst else None,
+            "instances": self._instances(table.instances.query(lo, hi))
+        }
+
+    def query(self, text: str, kind: str, limit: int = DEFAULT_LIMIT) -> Dict:
+        """Logs or threats of the IPs in a CIDR/range, in IP order for threats and time order for logs"""
+        version, first, last = parse_query(text)
+        table = self.tables[version]
+        lo, hi = table.span(first, last)
+        limit = max(0, min(limit, MAX_LIMIT))
+        if kind == 'threats':
+            items = list(islice((threat for threats in table.threats[lo:hi] for threat in threats), limit))
+        else:
+            # Each IP's logs are already sorted, merging is lazy so only the returned logs are compared
+            merged = heapq.merge(*map(zip, table.times[lo:hi], table.logs[lo:hi]), key=itemgetter(0))
+            items = [log for _, log in islice(merged, limit)]
+        summary = self.summary(table, lo, hi)
+        return {
+            "query": text,
+            "summary": summary,
+            kind: items,
+            "truncated": len(items) < summary[kind]
+        }
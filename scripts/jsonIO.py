@@ -0,0 +1,118 @@
+import os
+import json
+import codecs
+from typing import Any, Iterable, Iterator
+
+# orjson is optional, the stdlib module is used when it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+CHUNK_SIZE = 64 * 1024
+LINE_LIMIT = 1024 * 1024
+
+# Decoding/encoding, errors are json.JSONDecodeError with both backends
+def loads(data) -> Any:
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+# Files
+def load_file(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+def dump_file(obj: Any, path: str) -> None:
+    """Write compact JSON atomically, arrays get one element per line so iter_records can stream them back"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        if isinstance(obj, list):
+            write_array(f, obj)
+        else:
+            f.write(dumps(obj))
+    os.replace(temp_path, path)
+
+def write_array(f, items: Iterable[Any]) -> None:
+    f.write(b'[')
+    separator = b'\n'
+    for item in items:
+        f.write(separator)
+        f.write(dumps(item))
+        separator = b',\n'
+    f.write(b'\n]\n')
+
+def iter_records(path: str) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array, or the lines of an NDJSON file, one at a time"""
+    with open(path, 'rb') as f:
+        first = f.read(1)
+        while first in (b' ', b'\t', b'\r', b'\n'):
+            first = f.read(1)
+        if not first:
+            return
+        if first != b'[':
+            f.seek(-1, os.SEEK_CUR)
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield loads(line)
+            return
+
+        # One element per line (dump_file layout) is decoded line by line
+        while True:
+            offset = f.tell()
+            line = f.readline(LINE_LIMIT)
+            if not line:
+                return
+            if not line.endswith(b'\n') and len(line) == LINE_LIMIT:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            if line == b']':
+                return
+            try:
+                item = loads(line[:-1] if line.endswith(b',') else line)
+            except ValueError:
+                break
+            yield item
+
+        # Any other layout (indented, single line...) is decoded incrementally from the same element
+        f.seek(offset)
+        yield from _iter_array_items(f)
+
+def _iter_array_items(f) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof = '', 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        item, end = None, -1
+        if pos < len(buf):
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+        # Element cut by the chunk boundary (a number may also end right there): read more and retry
+        if end == -1 or (end == len(buf) and not eof):
+            if eof:
+                return
+            chunk = f.read(max(CHUNK_SIZE, len(buf) - pos))
+            eof = not chunk
+            buf = buf[pos:] + text.decode(chunk, final=eof)
+            pos = 0
+            continue
+        pos = end
+        yield item
@@ -1,52 +1,118 @@
 import os
 import re
 import json
+import time
+import mmap
 from datetime import datetime
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import Callable, List, Dict, Optional
+from statsRollup import update_rollup
+from sessions import update_sessions
+from metrics import MetricsRegistry, flush_to_file
+from jsonIO import loads, dumps, dump_file
+from sourceCursors import file_stamp
+from profiling import StageProfiler, add_profile_argument, profile_mode
 
 # Paths
 WORKING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FINAL_OUTPUT = os.path.join(WORKING_DIR, 'dashboard/json/logs.json')
+# Entries no earlier run saw, appended on each run and tailed by the collector stream (eventStream.py)
+NEW_LOGS_OUTPUT = os.path.join(WORKING_DIR, 'dashboard/json/new-logs.ndjson')
+# Past this size the file is moved to .1 and a new one started
+NEW_LOGS_MAX_BYTES = 8 * 1024 * 1024
+
+# Reader for sources with a bytes_pattern: None keeps each source's 'reader', 'text' or 'mmap' forces one
+READER = None
+MMAP_COUNT_CHUNK = 16 * 1024 * 1024
+
+# Entries parsed from each source file in this run with the file's stamp, the rollup and the sessions fold the ones past their cursors
+SOURCE_READS = {}
+
+# Metrics, recorded once per source and added to metrics/logParser.json at the end of a run
+METRICS = MetricsRegistry()
+LINES_READ = METRICS.counter('melissae_parser_lines_total', 'Lines read per source', ('source',))
+LINES_MISSED = METRICS.counter('melissae_parser_misses_total', 'Lines that did not match the source patterns', ('source',))
+PARSE_LATENCY = METRICS.histogram('melissae_parser_source_seconds', 'Time to parse one source file', ('source',))
+MERGED_LOGS = METRICS.counter('melissae_parser_merged_logs_total', 'Entries passed to merge_and_save')
+MERGED_DUPLICATES = METRICS.counter('melissae_parser_duplicates_total', 'Entries dropped as duplicates by merge_and_save')
+
+# Stage timings, enabled by --profile or MELISSAE_PROFILE
+PROFILER = StageProfiler('logParser')
+
+# re.compile() deferred to the first use, so a run only compiles the patterns of sources that have logs
+class LazyPattern:
+    def __init__(self, pattern, flags: int = 0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __getattr__(self, name):
+        # Only reached for names not cached yet, the bound method is kept so the next calls skip this
+        compiled = self.__dict__.get('compiled')
+        if compiled is None:
+            compiled = self.compiled = re.compile(self.pattern, self.flags)
+        value = getattr(compiled, name)
+        setattr(self, name, value)
+        return value
 
 # Patterns (If you want to create a module, you need to add your patterns here)
 PATTERNS = {
     'ssh_auth': {
         'source': 'modules/ssh/logs/sshd.log',
         'patterns': {
-            'date': re.compile(r'(?P<date>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}\+\d{2}:\d{2})'),
-            'ip': re.compile(r'from\s+(?P<ip>\d+\.\d+\.\d+\.\d+)'),
-            'action': re.compile(r'(?P<action>Failed password|Accepted password|Accepted publickey|Accepted keyboard-interactive|Invalid user|Connection closed)'),
-            'user': re.compile(r'(?:for|user)\s+(?P<user>\S+)')
+            'date': LazyPattern(r'(?P<date>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}\+\d{2}:\d{2})'),
+            'ip': LazyPattern(r'from\s+(?P<ip>\d+\.\d+\.\d+\.\d+)'),
+            'action': LazyPattern(r'(?P<action>Failed password|Accepted password|Accepted publickey|Accepted keyboard-interactive|Invalid user|Connection closed)'),
+            'user': LazyPattern(r'(?:for|user)\s+(?P<user>\S+)')
         }
     },
     'ssh_commands': {
         'source': 'modules/ssh/logs/commands.log',
-        'pattern': re.compile(r'(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| (?P<ip>\d+\.\d+\.\d+\.\d+) \| (?P<command>.+)')
+        'pattern': LazyPattern(r'(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| (?P<ip>\d+\.\d+\.\d+\.\d+) \| (?P<command>.+)'),
+        'reader': 'mmap',
+        'bytes_pattern': LazyPattern(rb'^[ \t]*(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| (?P<ip>\d+\.\d+\.\d+\.\d+) \| (?P<command>.*\S)', re.MULTILINE)
     },
     'ftp': {
         'source': 'modules/ftp/logs/vsftpd.log',
         'patterns': {
-            'connect': re.compile(r'(\w{3} \w{3} \s?\d{1,2} \d{2}:\d{2}:\d{2} \d{4}) \[pid \d+\] CONNECT: Client "(?P<ip>\d+\.\d+\.\d+\.\d+)"'),
-            'login': re.compile(r'(\w{3} \w{3} \s?\d{1,2} \d{2}:\d{2}:\d{2} \d{4}) \[pid \d+\] \[(?P<user>[^\]]+)\] (?P<status>OK|FAIL) LOGIN: Client "(?P<ip>\d+\.\d+\.\d+\.\d+)"'),
-            'transfer': re.compile(r'(\w{3} \w{3} \s?\d{1,2} \d{2}:\d{2}:\d{2} \d{4}) \[pid \d+\] \[(?P<user>[^\]]+)\] OK (?P<type>UPLOAD|DOWNLOAD): Client "(?P<ip>\d+\.\d+\.\d+\.\d+)", "(?P<file>.+?)", (?P<size>\d+) bytes')
+            'connect': LazyPattern(r'(\w{3} \w{3} \s?\d{1,2} \d{2}:\d{2}:\d{2} \d{4}) \[pid \d+\] CONNECT: Client "(?P<ip>\d+\.\d+\.\d+\.\d+)"'),
+            'login': LazyPattern(r'(\w{3} \w{3} \s?\d{1,2} \d{2}:\d{2}:\d{2} \d{4}) \[pid \d+\] \[(?P<user>[^\]]+)\] (?P<status>OK|FAIL) LOGIN: Client "(?P<ip>\d+\.\d+\.\d+\.\d+)"'),
+            'transfer': LazyPattern(r'(\w{3} \w{3} \s?\d{1,2} \d{2}:\d{2}:\d{2} \d{4}) \[pid \d+\] \[(?P<user>[^\]]+)\] OK (?P<type>UPLOAD|DOWNLOAD): Client "(?P<ip>\d+\.\d+\.\d+\.\d+)", "(?P<file>.+?)", (?P<size>\d+) bytes')
         }
     },
+    # nginx combined format plus the upstream, split on its fixed delimiters by parse_http_line instead of a regex
     'http': {
         'source': 'modules/web/logs/access.log',
-        'pattern': re.compile(r'^(\S+) - - \[(.*?)\] "(GET|POST|PUT|DELETE|HEAD|OPTIONS|PROPFIND|EWYM) (\S+) HTTP/\d\.\d" (\d+) \d+ ".*?" "(.*?)"$')
+        'methods': frozenset(('GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS', 'PROPFIND', 'EWYM'))
     },
     'modbus': {
         'source': 'modules/modbus/logs/modbus.log',
-        'pattern': re.compile(r'(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| (?P<ip>\d+\.\d+\.\d+\.\d+) \| (?P<action>.+?)(?:\s\|\s(?P<details>\{.*\}))?$')
+        'pattern': LazyPattern(r'(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| (?P<ip>\d+\.\d+\.\d+\.\d+) \| (?P<action>.+?)(?:\s\|\s(?P<details>\{.*\}))?$'),
+        'reader': 'mmap',
+        'bytes_pattern': LazyPattern(rb'^[ \t]*(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| (?P<ip>\d+\.\d+\.\d+\.\d+) \| (?P<action>.+?)(?:[ \t]\|[ \t](?P<details>\{.*\}))?[ \t\r]*$', re.MULTILINE)
+    },
+    # Structured sources (NDJSON events written by modules we control, no regex needed)
+    'modbus_events': {
+        'source': 'modules/modbus/logs/modbus.ndjson',
+        'protocol': 'modbus',
+        'version': 1
+    },
+    # One history file per SSH session, written by modules/ssh/conf/session.sh
+    'ssh_sessions': {
+        'source': 'modules/ssh/logs/sessions',
+        'protocol': 'ssh',
+        'version': 1
     }
 }
 
 # Create log entries (Should be modified in case of adding new modules)
 def create_entry(protocol: str, dt: datetime, ip: str, action: str, path: str = None, user_agent: str = None, user: Optional[str] = None) -> Dict:
+    return create_entry_at(protocol, dt.strftime('%Y-%m-%d'), dt.strftime('%H:%M:%S'), ip, action, path, user_agent, user)
+
+def create_entry_at(protocol: str, date: str, hour: str, ip: str, action: str, path: str = None, user_agent: str = None, user: Optional[str] = None) -> Dict:
     entry = {
         "protocol": protocol,
-        "date": dt.strftime('%Y-%m-%d'),
-        "hour": dt.strftime('%H:%M:%S'),
+        "date": date,
+        "hour": hour,
         "ip": ip,
         "action": action,
     }
@@ -58,6 +124,58 @@ def create_entry(protocol: str, dt: datetime, ip: str, action: str, path: str =
         entry["user"] = user
     return entry
 
+# Read a source file, counting what the parser could not use
+def read_source(name: str, parse_line: Callable[[str], Optional[Dict]], parse_match: Callable[[re.Match], Optional[Dict]] = None) -> List[Dict]:
+    logs = []
+    spec = PATTERNS[name]
+    source = os.path.join(WORKING_DIR, spec['source'])
+    if not os.path.exists(source):
+        return logs
+    start = time.perf_counter()
+    stamp = file_stamp(source)
+    if parse_match and (READER or spec.get('reader', 'text')) == 'mmap':
+        lines = read_mapped(source, spec['bytes_pattern'], parse_match, logs)
+    else:
+        lines = 0
+        with open(source, 'r', encoding='utf-8') as f:
+            for lines, line in enumerate(f, 1):
+                entry = parse_line(line)
+                if entry:
+                    logs.append(entry)
+    record_source(name, lines, len(logs), time.perf_counter() - start)
+    SOURCE_READS[spec['source']] = (stamp, logs)
+    return logs
+
+def record_source(name: str, lines: int, parsed: int, seconds: float) -> None:
+    PARSE_LATENCY.observe(seconds, name)
+    LINES_READ.inc(name, amount=lines)
+    LINES_MISSED.inc(name, amount=lines - parsed)
+
+# Bytes reader: the mapped file is matched in one pass, only the captured fields are decoded
+def read_mapped(source: str, pattern: re.Pattern, parse_match: Callable[[re.Match], Optional[Dict]], logs: List[Dict]) -> int:
+    with open(source, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for match in pattern.finditer(buf):
+                entry = parse_match(match)
+                if entry:
+                    logs.append(entry)
+            lines = sum(buf[i:i + MMAP_COUNT_CHUNK].count(b'\n') for i in range(0, size, MMAP_COUNT_CHUNK))
+            return lines + (buf[size - 1] != ord('\n'))
+
+def text(value: bytes) -> str:
+    return value.decode('utf-8', 'replace')
+
+# The bytes patterns capture fixed-width timestamps, date and hour are sliced instead of going through strptime
+MONTHS = {name: f"{i:02d}" for i, name in enumerate([b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec'], 1)}
+
+def stamp_date_hour(stamp: bytes) -> tuple:
+    # "YYYY-MM-DD HH:MM:SS"
+    stamp = stamp.decode('ascii')
+    return stamp[:10], stamp[11:]
+
 # SSH Module parsing & processing
 def parse_ssh_auth_line(line: str) -> Optional[Dict]:
     date_match = PATTERNS['ssh_auth']['patterns']['date'].search(line)
@@ -85,30 +203,67 @@ def parse_ssh_auth_line(line: str) -> Optional[Dict]:
     return create_entry('ssh', dt, ip, action_desc, user=user)
 
 def process_ssh_auth() -> List[Dict]:
+    return read_source('ssh_auth', parse_ssh_auth_line)
+
+def parse_ssh_command_line(line: str) -> Optional[Dict]:
+    match = PATTERNS['ssh_commands']['pattern'].match(line.strip())
+    if not match:
+        return None
+    dt = datetime.strptime(match.group('date'), "%Y-%m-%d %H:%M:%S")
+    raw_command = match.group('command').strip()
+    cleaned_command = re.sub(r'^\d+\s+', '', raw_command)
+    return create_entry('ssh', dt, match.group('ip'), cleaned_command)
+
+def parse_ssh_command_match(match: re.Match) -> Dict:
+    date, hour = stamp_date_hour(match.group('date'))
+    cleaned_command = re.sub(r'^\d+\s+', '', text(match.group('command')).strip())
+    return create_entry_at('ssh', date, hour, text(match.group('ip')), cleaned_command)
+
+def process_ssh_commands() -> List[Dict]:
+    return read_source('ssh_commands', parse_ssh_command_line, parse_ssh_command_match)
+
+# Session files: "#melissae <version> <session> <ip> <port> <start>" header, then "#<epoch>" and command line pairs
+def parse_session_file(path: str, protocol: str, version: int) -> tuple:
     logs = []
-    source = os.path.join(WORKING_DIR, PATTERNS['ssh_auth']['source'])
-    if not os.path.exists(source):
-        return logs
-    with open(source, 'r', encoding='utf-8') as f:
+    lines = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        header = f.readline().split()
+        if len(header) < 4 or header[0] != '#melissae' or header[1] != str(version):
+            return logs, lines
+        session, ip = header[2], header[3]
+        stamp = None
         for line in f:
-            entry = parse_ssh_auth_line(line)
-            if entry:
-                logs.append(entry)
-    return logs
+            if line[:1] == '#' and line[1:].rstrip().isdigit():
+                stamp = int(line[1:])
+                continue
+            lines += 1
+            command = line.strip()
+            if stamp is None or not command:
+                continue
+            date, hour = epoch_date_hour(stamp)
+            entry = create_entry_at(protocol, date, hour, ip, command)
+            entry["session"] = session
+            logs.append(entry)
+    return logs, lines
 
-def process_ssh_commands() -> List[Dict]:
+def process_ssh_sessions() -> List[Dict]:
     logs = []
-    source = os.path.join(WORKING_DIR, PATTERNS['ssh_commands']['source'])
-    if not os.path.exists(source):
+    spec = PATTERNS['ssh_sessions']
+    directory = os.path.join(WORKING_DIR, spec['source'])
+    if not os.path.isdir(directory):
         return logs
-    with open(source, 'r', encoding='utf-8') as f:
-        for line in f:
-            match = PATTERNS['ssh_commands']['pattern'].match(line.strip())
-            if match:
-                dt = datetime.strptime(match.group('date'), "%Y-%m-%d %H:%M:%S")
-                raw_command = match.group('command').strip()
-                cleaned_command = re.sub(r'^\d+\s+', '', raw_command)
-                logs.append(create_entry('ssh', dt, match.group('ip'), cleaned_command))
+    start = time.perf_counter()
+    lines = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.log') or not entry.is_file():
+                continue
+            stamp = file_stamp(entry.path)
+            session_logs, session_lines = parse_session_file(entry.path, spec['protocol'], spec['version'])
+            SOURCE_READS[os.path.join(spec['source'], entry.name)] = (stamp, session_logs)
+            logs.extend(session_logs)
+            lines += session_lines
+    record_source('ssh_sessions', lines, len(logs), time.perf_counter() - start)
     return logs
 
 # FTP Module parsing & processing
@@ -128,40 +283,88 @@ def parse_ftp_line(line: str) -> Optional[Dict]:
     return None
 
 def process_ftp() -> List[Dict]:
-    logs = []
-    source = os.path.join(WORKING_DIR, PATTERNS['ftp']['source'])
-    if not os.path.exists(source):
-        return logs
-    with open(source, 'r', encoding='utf-8') as f:
-        for line in f:
-            entry = parse_ftp_line(line)
-            if entry:
-                logs.append(entry)
-    return logs
+    return read_source('ftp', parse_ftp_line)
 
 # Web Module parsing & processing
+HTTP_METHODS = PATTERNS['http']['methods']
+HTTP_MONTHS = {name.decode('ascii'): number for name, number in MONTHS.items()}
+# First and last tokens of a request line split on spaces, quotes included
+HTTP_QUOTED_METHODS = {f'"{method}': method for method in HTTP_METHODS}
+HTTP_QUOTED_PROTOCOLS = frozenset(f'HTTP/{major}.{minor}"' for major in range(10) for minor in range(10))
+
+@lru_cache(maxsize=65536)
+def http_date_hour(stamp: str) -> Optional[tuple]:
+    # "[DD/Mon/YYYY:HH:MM:SS" without the offset, kept in the proxy's local time like the other sources
+    month = HTTP_MONTHS.get(stamp[4:7])
+    if month is None or len(stamp) != 21 or stamp[0] != '[' or stamp[3] != '/' or stamp[7] != '/' or stamp[12] != ':':
+        return None
+    return f"{stamp[8:12]}-{month}-{stamp[1:3]}", stamp[13:21]
+
+def split_quoted(text: str) -> List[str]:
+    """Split on double quotes (odd fields are the quoted ones), a quote escaped by a backslash stays in its field"""
+    fields = text.split('"')
+    # nginx writes quotes as \x22, only other writers (Apache) escape them with a backslash
+    if '\\"' not in text:
+        return fields
+    merged = [fields[0]]
+    for field in fields[1:]:
+        previous = merged[-1]
+        if (len(previous) - len(previous.rstrip('\\'))) % 2:
+            merged[-1] = f'{previous}"{field}'
+        else:
+            merged.append(field)
+    return merged
+
+# ip - user [time zone] "method path protocol" status size "referer" "user-agent" "upstream", older lines have no upstream
 def parse_http_line(line: str) -> Optional[Dict]:
-    match = PATTERNS['http']['pattern'].match(line.strip())
-    if not match:
+    parts = line.split(' ', 10)
+    method = HTTP_QUOTED_METHODS.get(parts[5]) if len(parts) == 11 else None
+    if method and parts[7] in HTTP_QUOTED_PROTOCOLS:
+        # Usual line: only the quoted fields at the end can hold spaces
+        ip, stamp, path, status, size = parts[0], parts[3], parts[6], parts[8], parts[9]
+        quoted = split_quoted(parts[10])
+        if len(quoted) < 5:
+            return None
+        referer, user_agent, upstream = quoted[1], quoted[3], quoted[5] if len(quoted) > 6 else ''
+    else:
+        # Leading blanks, a user with spaces, quotes escaped in the request (a path with spaces is still refused)
+        fields = split_quoted(line)
+        if len(fields) < 7:
+            return None
+        head = fields[0].lstrip()
+        bracket = head.find(' [')
+        request = fields[1].split(' ')
+        status_size = fields[2].split()
+        if bracket < 0 or len(request) != 3 or request[0] not in HTTP_METHODS or f'{request[2]}"' not in HTTP_QUOTED_PROTOCOLS or len(status_size) != 2:
+            return None
+        ip, stamp, method, path = head[:head.find(' ')], head[bracket + 1:bracket + 22], request[0], request[1]
+        status, size = status_size
+        referer, user_agent, upstream = fields[3], fields[5], fields[7] if len(fields) > 8 else ''
+
+    date_hour = http_date_hour(stamp)
+    if date_hour is None or not status.isdigit():
         return None
-    ip = match.group(1)
-    dt = datetime.strptime(match.group(2), "%d/%b/%Y:%H:%M:%S %z")
-    action = match.group(3)
-    path = match.group(4)
-    user_agent = match.group(6)
-    return create_entry('http', dt, ip, action, path, user_agent)
+    entry = {
+        "protocol": "http",
+        "date": date_hour[0],
+        "hour": date_hour[1],
+        "ip": ip,
+        "action": method,
+        "path": path,
+    }
+    if user_agent:
+        entry["user-agent"] = user_agent
+    entry["status"] = int(status)
+    if size.isdigit():
+        entry["size"] = int(size)
+    if referer != '-':
+        entry["referer"] = referer
+    if upstream and upstream != '-':
+        entry["upstream"] = upstream
+    return entry
 
 def process_http() -> List[Dict]:
-    logs = []
-    source = os.path.join(WORKING_DIR, PATTERNS['http']['source'])
-    if not os.path.exists(source):
-        return logs
-    with open(source, 'r', encoding='utf-8') as f:
-        for line in f:
-            entry = parse_http_line(line)
-            if entry:
-                logs.append(entry)
-    return logs
+    return read_source('http', parse_http_line)
 
 # Modbus Module parsing & processing
 def parse_modbus_line(line: str) -> Optional[Dict]:
@@ -171,51 +374,120 @@ def parse_modbus_line(line: str) -> Optional[Dict]:
     
     dt = datetime.strptime(match.group('date'), "%Y-%m-%d %H:%M:%S")
     ip = match.group('ip')
-    action = match.group('action')
-    details = match.group('details')
-    
+    action = modbus_action(match.group('action'), match.group('details'))
+    return create_entry('modbus', dt, ip, action)
+
+def parse_modbus_match(match: re.Match) -> Dict:
+    date, hour = stamp_date_hour(match.group('date'))
+    action = modbus_action(text(match.group('action')), match.group('details'))
+    return create_entry_at('modbus', date, hour, text(match.group('ip')), action)
+
+def modbus_action(action: str, details) -> str:
     if details:
         try:
-            details_json = json.loads(details)
+            details_json = loads(details)
             if 'function' in details_json:
                 action = f"{action} - {details_json['function']}"
         except json.JSONDecodeError:
             pass
-    
-    return create_entry('modbus', dt, ip, action)
+    return action
 
 def process_modbus() -> List[Dict]:
-    logs = []
-    source = os.path.join(WORKING_DIR, PATTERNS['modbus']['source'])
-    if not os.path.exists(source):
-        return logs
-    with open(source, 'r', encoding='utf-8') as f:
-        for line in f:
-            entry = parse_modbus_line(line)
-            if entry:
-                logs.append(entry)
-    return logs
+    return read_source('modbus', parse_modbus_line, parse_modbus_match)
+
+# NDJSON event sources
+@lru_cache(maxsize=4096)
+def epoch_date_hour(second: int) -> tuple:
+    t = time.gmtime(second)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}", f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+def parse_event_line(line: str, protocol: str, version: int) -> Optional[Dict]:
+    try:
+        event = loads(line)
+    except json.JSONDecodeError:
+        return None
+    # Housekeeping events (dropped records...) carry no ip/action
+    if not isinstance(event, dict) or event.get('v') != version or 'action' not in event or 'ip' not in event:
+        return None
+    try:
+        date, hour = epoch_date_hour(int(event['ts']))
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        # Missing, non-numeric or out of range timestamp: the line is skipped, not the run
+        return None
+    return {
+        "protocol": protocol,
+        "date": date,
+        "hour": hour,
+        "ip": event['ip'],
+        "action": event['action'],
+    }
+
+def process_events(name: str) -> List[Dict]:
+    spec = PATTERNS[name]
+    protocol, version = spec['protocol'], spec['version']
+    return read_source(name, lambda line: parse_event_line(line, protocol, version))
+
+def process_modbus_events() -> List[Dict]:
+    return process_events('modbus_events')
 
 # Merging logs
 def merge_and_save(all_logs: List[Dict]) -> None:
-    seen = set()
-    unique_logs = []
-    for log in all_logs:
-        log_hash = hash(frozenset(log.items()))
-        if log_hash not in seen:
-            seen.add(log_hash)
-            unique_logs.append(log)
-    unique_logs.sort(key=lambda x: datetime.strptime(f"{x['date']} {x['hour']}", '%Y-%m-%d %H:%M:%S'))
-    os.makedirs(os.path.dirname(FINAL_OUTPUT), exist_ok=True)
-    with open(FINAL_OUTPUT, 'w', encoding='utf-8') as f:
-        json.dump(unique_logs, f, indent=2, ensure_ascii=False)
+    sources = dict(SOURCE_READS)
+    SOURCE_READS.clear()
+    with PROFILER.stage('dedup'):
+        seen = set()
+        unique_logs = []
+        for log in all_logs:
+            log_hash = hash(frozenset(log.items()))
+            if log_hash not in seen:
+                seen.add(log_hash)
+                unique_logs.append(log)
+    MERGED_LOGS.inc(amount=len(all_logs))
+    MERGED_DUPLICATES.inc(amount=len(all_logs) - len(unique_logs))
+    with PROFILER.stage('sort'):
+        unique_logs.sort(key=lambda x: datetime.strptime(f"{x['date']} {x['hour']}", '%Y-%m-%d %H:%M:%S'))
+    with PROFILER.stage('json_dump'):
+        dump_file(unique_logs, FINAL_OUTPUT)
+    with PROFILER.stage('update_rollup'):
+        new_logs = update_rollup(unique_logs, sources)
+    with PROFILER.stage('update_sessions'):
+        update_sessions(unique_logs, sources)
+    with PROFILER.stage('append_new_logs'):
+        append_new_logs(new_logs)
+
+def append_new_logs(new_logs: List[Dict]) -> None:
+    """Append the entries past the source cursors to NEW_LOGS_OUTPUT, in time order"""
+    if not new_logs:
+        return
+    try:
+        if os.path.getsize(NEW_LOGS_OUTPUT) > NEW_LOGS_MAX_BYTES:
+            # The collector finishes reading the .1 file before moving to the new one
+            os.replace(NEW_LOGS_OUTPUT, f"{NEW_LOGS_OUTPUT}.1")
+    except FileNotFoundError:
+        pass
+    with open(NEW_LOGS_OUTPUT, 'ab') as f:
+        f.write(b''.join(dumps(log) + b'\n' for log in new_logs))
 
 # Main
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None) -> None:
+    global READER
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Melissae log parser')
+    parser.add_argument('--reader', choices=['text', 'mmap'], help="Read every source that supports it this way instead of its configured 'reader'")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    READER = args.reader
+    PROFILER.start(profile_mode(args.profile))
+
     all_logs: List[Dict] = []
-    all_logs.extend(process_ssh_auth())
-    all_logs.extend(process_ssh_commands())
-    all_logs.extend(process_ftp())
-    all_logs.extend(process_http())
-    all_logs.extend(process_modbus())
-    merge_and_save(all_logs)
\ No newline at end of file
+    for process in (process_ssh_auth, process_ssh_commands, process_ssh_sessions, process_ftp, process_http, process_modbus, process_modbus_events):
+        with PROFILER.stage(process.__name__):
+            all_logs.extend(process())
+    with PROFILER.stage('merge_and_save'):
+        merge_and_save(all_logs)
+    PROFILER.finish()
+    flush_to_file(METRICS, "logParser")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import importlib
+from typing import List, Optional, Tuple
+
+# Single entry point for the scripts run from cron or as services
+# A subcommand only imports its own module, its options are parsed by that module's main()
+COMMANDS = {
+    'parse': ('logParser', 'Parse the module logs into dashboard/json/logs.json'),
+    'score': ('threatIntel', 'Score the parsed logs into dashboard/json/threats.json'),
+    'aggregate': ('multiAggregator', 'Merge the local and agent data (multi-instance server)'),
+    'agent': ('multiInstance', 'Send this instance data to a multi-instance server'),
+    'server': ('multiServer', 'Run the multi-instance server')
+}
+
+# Steps of the collector cron job, run one after the other in the same interpreter
+CYCLE = ('parse', 'score')
+
+# Modules listed by "startup", ordered by their own import time
+STARTUP_TOP = 10
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def usage() -> str:
+    lines = ["usage: melissae.py <command> [options]", "", "commands:"]
+    for name, (module, description) in COMMANDS.items():
+        lines.append(f"  {name:<10} {description} ({module}.py)")
+    lines.append(f"  {'cycle':<10} Run {' then '.join(CYCLE)} in one process, [--profile] is passed to each step")
+    lines.append(f"  {'startup':<10} Report the import time of each command, or of the commands given")
+    lines.append("")
+    lines.append("Run 'melissae.py <command> --help' for the options of a command.")
+    return '\n'.join(lines)
+
+def run_command(name: str, argv: List[str]) -> None:
+    module = importlib.import_module(COMMANDS[name][0])
+    module.main(argv)
+
+# Collector cron job
+def run_cycle(argv: List[str]) -> int:
+    import argparse
+    from profiling import add_profile_argument
+
+    parser = argparse.ArgumentParser(prog='melissae.py cycle', description=f"Run {' then '.join(CYCLE)}")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    forwarded = ['--profile', args.profile] if args.profile else []
+
+    # A failed step does not keep the next one from working on the previous output
+    status = 0
+    for name in CYCLE:
+        try:
+            run_command(name, forwarded)
+        except SystemExit as e:
+            if e.code:
+                status = 1
+        except Exception as e:
+            print(f"[ERROR] {name} failed: {e}")
+            status = 1
+    return status
+
+# Startup cost
+def import_times(module: str) -> Tuple[int, List[Tuple[int, int, str]]]:
+    """Microseconds to import module in a fresh interpreter, and (self, cumulative, name) of every module it loaded"""
+    import subprocess
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    if result.returncode:
+        raise ImportError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"Failed to import {module}")
+    total = 0
+    loaded = []
+    for line in result.stderr.splitlines():
+        # "import time: <self> | <cumulative> | <indented name>"
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        own, cumulative, name = int(fields[0]), int(fields[1]), fields[2].strip()
+        loaded.append((own, cumulative, name))
+        if name == module:
+            total = cumulative
+    return total, loaded
+
+def report_startup(names: List[str]) -> int:
+    status = 0
+    for name in names or list(COMMANDS):
+        if name not in COMMANDS:
+            print(f"[ERROR] Unknown command: {name}")
+            status = 1
+            continue
+        module = COMMANDS[name][0]
+        try:
+            total, loaded = import_times(module)
+        except ImportError as e:
+            print(f"[ERROR] {name} ({module}): {e}")
+            status = 1
+            continue
+        print(f"[INFO] {name} ({module}): {total / 1000:.1f} ms to import, {len(loaded)} modules loaded")
+        for own, cumulative, loaded_name in sorted(loaded, reverse=True)[:STARTUP_TOP]:
+            print(f"         {own / 1000:>7.1f} ms self {cumulative / 1000:>7.1f} ms cumulative  {loaded_name}")
+    return status
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+    command, rest = argv[0], argv[1:]
+    if command == 'cycle':
+        return run_cycle(rest)
+    if command == 'startup':
+        return report_startup(rest)
+    if command not in COMMANDS:
+        print(f"[ERROR] Unknown command: {command}\n\n{usage()}")
+        return 2
+    run_command(command, rest)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import os
+import json
+import glob
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# Paths
+WORKING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_DIR = os.path.join(WORKING_DIR, 'metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds and bytes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2)
+
+# Metric types, recording is a dict update under a lock, label values are passed positionally
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            values = [[list(key), value if not isinstance(value, list) else list(value)] for key, value in self.values.items()]
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labels), "values": values}
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, *labels) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self) -> Dict:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def snapshot(self) -> Dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+# Prometheus text format
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(names: List[str], values: List[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def render_snapshot(snapshot: Dict) -> str:
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labels = metric['labels']
+        for label_values, value in metric['values']:
+            if metric['kind'] != 'histogram':
+                lines.append(f"{name}{_label_text(labels, label_values)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-2]):
+                cumulative += count
+                le = 'le="{}"'.format(bound if bound == '+Inf' else _number(float(bound)))
+                lines.append(f"{name}_bucket{_label_text(labels, label_values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels, label_values)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_label_text(labels, label_values)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+# Snapshot files, so cron scripts keep counting across runs
+def merge_snapshots(previous: Dict, current: Dict) -> Dict:
+    merged = dict(previous)
+    for name, metric in current.items():
+        old = previous.get(name)
+        if not old or old['kind'] != metric['kind'] or old.get('buckets') != metric.get('buckets'):
+            merged[name] = metric
+            continue
+        values = {tuple(labels): value for labels, value in old['values']}
+        for labels, value in metric['values']:
+            key = tuple(labels)
+            if metric['kind'] == 'gauge' or key not in values:
+                values[key] = value
+            elif metric['kind'] == 'counter':
+                values[key] = values[key] + value
+            else:
+                values[key] = [a + b for a, b in zip(values[key], value)]
+        merged[name] = dict(metric, values=[[list(key), value] for key, value in values.items()])
+    return merged
+
+def flush_to_file(registry: MetricsRegistry, name: str, metrics_dir: str = METRICS_DIR) -> None:
+    """Add this run's metrics to metrics/<name>.json, served by the collector on /metrics"""
+    path = os.path.join(metrics_dir, f"{name}.json")
+    previous = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (IOError, json.JSONDecodeError):
+        previous = {}
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(merge_snapshots(previous, registry.snapshot()), f, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except IOError as e:
+        print(f"[WARN] Failed to write metrics {path}: {e}")
+
+def render_directory(metrics_dir: str = METRICS_DIR) -> str:
+    snapshot = {}
+    for path in sorted(glob.glob(os.path.join(metrics_dir, '*.json'))):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot.update(json.load(f))
+        except (IOError, json.JSONDecodeError):
+            continue
+    return render_snapshot(snapshot) if snapshot else ''
@@ -2,13 +2,27 @@
 
 import os
 import json
+import time
 import hashlib
-import requests
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional
 from collections import defaultdict
-import pytz
+from statsRollup import build_rollup, save_stats
+from sessions import SessionTracker, STATE_VERSION as SESSIONS_STATE_VERSION, save_sessions, event_time
+from sourceCursors import LogWindow
+from ipEnrich import IPEnricher, load_enricher
+from threatIntel import IPSignals
+from metrics import MetricsRegistry, flush_to_file
+from jsonIO import loads, load_file, dump_file
+from blocklist import update_feeds
+from profiling import StageProfiler, add_profile_argument, profile_mode
+
+# Metrics, added to metrics/multiAggregator.json after each run
+METRICS = MetricsRegistry()
+AGGREGATE_LATENCY = METRICS.histogram('melissae_aggregator_run_seconds', 'Duration of an aggregation run')
+AGGREGATE_LOGS = METRICS.gauge('melissae_aggregator_logs', 'Logs in the last aggregation')
+AGGREGATE_THREATS = METRICS.gauge('melissae_aggregator_threats', 'Unique IPs in the last aggregation')
 
 class MultiInstanceAggregator:
     def __init__(self, config_path: str = None):
@@ -16,6 +30,12 @@ class MultiInstanceAggregator:
         self.config_path = config_path or os.path.join(self.working_dir, 'multi-instance.json')
         self.config = self._load_config()
         self.output_dir = os.path.join(self.working_dir, 'dashboard/json')
+        self.profiler = StageProfiler('multiAggregator')
+        self.enricher: Optional[IPEnricher] = None
+        # Instance id -> timezone its logs are written in, aggregated logs do not carry it
+        self.timezones = {self.config.get('instance_id', 'local'): self.config.get('timezone', 'UTC')}
+        # (date, hour, timezone) -> epoch seconds on the UTC timeline
+        self.utc_seconds = {}
         
     def _load_config(self) -> Dict:
         if os.path.exists(self.config_path):
@@ -33,14 +53,16 @@ class MultiInstanceAggregator:
             # Apply source timezone
             if source_timezone and source_timezone != 'UTC':
                 try:
+                    # Only instances outside UTC need pytz, imported here to keep it off the startup path
+                    import pytz
                     tz = pytz.timezone(source_timezone)
                     dt = tz.localize(dt)
-                    dt = dt.astimezone(pytz.UTC)
+                    dt = dt.astimezone(timezone.utc)
                 except:
                     # If timezone parsing fails, assume UTC
-                    dt = dt.replace(tzinfo=pytz.UTC)
+                    dt = dt.replace(tzinfo=timezone.utc)
             else:
-                dt = dt.replace(tzinfo=pytz.UTC)
+                dt = dt.replace(tzinfo=timezone.utc)
             
             return dt.strftime('%Y-%m-%d'), dt.strftime('%H:%M:%S')
         except:
@@ -49,6 +71,7 @@ class MultiInstanceAggregator:
     
     def _fetch_aggregated_data(self) -> tuple:
         """Fetch aggregated data from the multi-instance server"""
+        import requests
         server_config = self.config.get('server', {})
         api_key = server_config.get('api_key')
         port = server_config.get('port', 8888)
@@ -67,7 +90,7 @@ class MultiInstanceAggregator:
             response = requests.get(url, headers=headers, timeout=30)
             response.raise_for_status()
             
-            data = response.json()
+            data = loads(response.content)
             return data.get('logs', []), data.get('threats', [])
             
         except requests.exceptions.RequestException as e:
@@ -79,6 +102,7 @@ class MultiInstanceAggregator:
     
     def _fetch_instances_data(self) -> List[Dict]:
         """Fetch instance information from the multi-instance server"""
+        import requests
         server_config = self.config.get('server', {})
         api_key = server_config.get('api_key')
         port = server_config.get('port', 8888)
@@ -172,9 +196,8 @@ class MultiInstanceAggregator:
         logs_path = os.path.join(self.output_dir, 'logs.json')
         if os.path.exists(logs_path):
             try:
-                with open(logs_path, 'r') as f:
-                    data = json.load(f)
-                    return data if isinstance(data, list) else []
+                data = load_file(logs_path)
+                return data if isinstance(data, list) else []
             except (json.JSONDecodeError, IOError):
                 pass
         return []
@@ -184,20 +207,33 @@ class MultiInstanceAggregator:
         threats_path = os.path.join(self.output_dir, 'threats.json')
         if os.path.exists(threats_path):
             try:
-                with open(threats_path, 'r') as f:
-                    data = json.load(f)
-                    return data if isinstance(data, list) else []
+                data = load_file(threats_path)
+                return data if isinstance(data, list) else []
             except (json.JSONDecodeError, IOError):
                 pass
         return []
     
+    def _log_timezone(self, log: Dict) -> str:
+        return log.get('timezone') or self.timezones.get(log.get('instance_id', ''), 'UTC')
+    
+    def _utc_second(self, log: Dict) -> Optional[int]:
+        """Epoch seconds of a log on the UTC timeline, None when it is logged in UTC and its own date and hour apply"""
+        instance_tz = self._log_timezone(log)
+        if not instance_tz or instance_tz == 'UTC':
+            return None
+        key = (log.get('date', ''), log.get('hour', ''), instance_tz)
+        second = self.utc_seconds.get(key)
+        if second is None:
+            second = self.utc_seconds[key] = event_time(*self._normalize_timezone(*key))
+        return second
+    
     def _sort_logs_by_timestamp(self, logs: List[Dict]) -> List[Dict]:
         """Sort logs by normalized timestamp"""
         def sort_key(log):
             try:
                 date_str = log.get('date', '')
                 hour_str = log.get('hour', '')
-                instance_tz = log.get('timezone', 'UTC')
+                instance_tz = self._log_timezone(log)
                 
                 # Normalize to UTC for sorting
                 norm_date, norm_hour = self._normalize_timezone(date_str, hour_str, instance_tz)
@@ -207,6 +243,31 @@ class MultiInstanceAggregator:
         
         return sorted(logs, key=sort_key)
     
+    def _load_session_state(self, state_path: str) -> tuple:
+        """(tracker, window of the logs it already folded), both empty when there is no usable state"""
+        if os.path.exists(state_path):
+            try:
+                state = load_file(state_path)
+                if state['tracker'].get('version') == SESSIONS_STATE_VERSION:
+                    return SessionTracker.from_state(state['tracker']), LogWindow.from_state(state['window'])
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError, IOError):
+                pass
+        return SessionTracker(), LogWindow()
+    
+    def _update_sessions(self, sorted_logs: List[Dict]) -> SessionTracker:
+        """Fold the aggregated logs earlier runs did not see into the persisted sessions, on normalized timestamps"""
+        state_path = os.path.join(self.output_dir, 'sessions-aggregated-state.json')
+        tracker, window = self._load_session_state(state_path)
+        # The server sends the whole history on each run, new logs are told apart by their hash (see LogWindow)
+        for entry in window.unseen(sorted_logs):
+            try:
+                tracker.add(entry, self._utc_second(entry))
+            except ValueError:
+                continue
+        os.makedirs(self.output_dir, exist_ok=True)
+        dump_file({"tracker": tracker.to_state(), "window": window.to_state()}, state_path)
+        return tracker
+    
     def _recalculate_threats(self, logs: List[Dict]) -> List[Dict]:
         """Recalculate threat scores based on aggregated logs"""
         # Group logs by IP across all instances
@@ -217,11 +278,13 @@ class MultiInstanceAggregator:
                 ip_data[ip].append(log)
         
         threats = []
+        now = time.time()
         for ip, entries in ip_data.items():
             if not ip:
                 continue
             
-            score = self._calculate_protocol_score(entries)
+            signals = self._collect_signals(entries)
+            score = signals.score()
             verdict = self._get_verdict(score)
             
             # Get instance information for this IP
@@ -237,57 +300,27 @@ class MultiInstanceAggregator:
                 "hostnames": hostnames,
                 "activity_count": len(entries)
             }
+            threat.update(signals.threat_fields(score, now))
+            if self.enricher:
+                self.enricher.enrich(threat)
             threats.append(threat)
         
         return threats
     
     def _calculate_protocol_score(self, ip_data: List[Dict]) -> int:
-        """Calculate protocol score (from threatIntel.py logic)"""
-        http_count = 0
-        ssh_failed = False
-        ssh_success = False
-        ftp_failed = False
-        ftp_success = False
-        modbus_write = False
-        modbus_read = False
-
+        """Calculate protocol score (threatIntel.py scoring engine)"""
+        return self._collect_signals(ip_data).score()
+    
+    def _collect_signals(self, ip_data: List[Dict]) -> IPSignals:
+        # Velocity windows and last_seen on the UTC timeline, whatever timezone each instance logs in
+        signals = IPSignals()
         for entry in ip_data:
-            protocol = entry.get('protocol', '').upper()
-            action = entry.get('action', '').lower()
-
-            if protocol == 'HTTP':
-                http_count += 1
-            elif protocol == 'SSH':
-                if 'failed' in action:
-                    ssh_failed = True
-                elif 'successful' in action:
-                    ssh_success = True
-            elif protocol == 'FTP':
-                if 'failed' in action:
-                    ftp_failed = True
-                elif 'successful' in action:
-                    ftp_success = True
-            elif protocol == 'MODBUS':
-                if 'write' in action:
-                    modbus_write = True
-                elif 'read' in action:
-                    modbus_read = True
-
-        # Nefarious - Multiple successful compromises or Modbus writes and one successful compromise
-        if (ssh_success and ftp_success) or (modbus_write and (ssh_success or ftp_success)):
-            return 5
-
-        # Malicious - Single successful compromise or multiple protocols failed with Modbus writes
-        elif (ssh_success or ftp_success) or (modbus_write and (ssh_failed or ftp_failed)):
-            return 4
-
-        # Suspicious - Failed attempts or excessive HTTP or Modbus reconnaissance
-        elif http_count > 50 or ssh_failed or ftp_failed or modbus_read:
-            return 2
-
-        # Benign
-        else:
-            return 1
+            try:
+                second = self._utc_second(entry)
+            except ValueError:
+                second = None
+            signals.add(entry, second)
+        return signals
     
     def _get_verdict(self, score: int) -> str:
         """Get verdict from score"""
@@ -299,70 +332,101 @@ class MultiInstanceAggregator:
         }
         return verdicts.get(score, "unknown")
     
-    def _save_aggregated_data(self, logs: List[Dict], threats: List[Dict], instances: List[Dict] = None):
+    def _save_aggregated_data(self, logs: List[Dict], threats: List[Dict], instances: List[Dict] = None, sessions: SessionTracker = None):
         """Save aggregated data to JSON files"""
         os.makedirs(self.output_dir, exist_ok=True)
         
         # Save aggregated logs
-        logs_path = os.path.join(self.output_dir, 'logs-aggregated.json')
-        with open(logs_path, 'w') as f:
-            json.dump(logs, f, indent=2, ensure_ascii=False)
+        dump_file(logs, os.path.join(self.output_dir, 'logs-aggregated.json'))
         
         # Save aggregated threats
-        threats_path = os.path.join(self.output_dir, 'threats-aggregated.json')
-        with open(threats_path, 'w') as f:
-            json.dump(threats, f, indent=2, ensure_ascii=False)
+        dump_file(threats, os.path.join(self.output_dir, 'threats-aggregated.json'))
+        
+        # Blocklist feeds of every instance
+        update_feeds(threats, 'aggregated')
+        
+        # Save pre-aggregated dashboard statistics
+        save_stats(build_rollup(logs), os.path.join(self.output_dir, 'stats-aggregated.json'))
+        
+        # Save attacker sessions
+        if sessions is not None:
+            save_sessions(sessions, os.path.join(self.output_dir, 'sessions-aggregated.json'))
         
         # Save instance data if available
         if instances is not None:
-            instances_path = os.path.join(self.output_dir, 'multi-instance.json')
-            with open(instances_path, 'w') as f:
-                json.dump({'instances': instances}, f, indent=2, ensure_ascii=False)
+            dump_file({'instances': instances}, os.path.join(self.output_dir, 'multi-instance.json'))
         
         print(f"[INFO] Saved {len(logs)} aggregated logs and {len(threats)} threats")
     
     def aggregate(self):
         """Main aggregation function"""
         print("[INFO] Starting multi-instance aggregation...")
+        start = time.perf_counter()
         
         instances = None
         
         # Check if we're in server mode
         if self.config.get('mode') == 'server':
             # Fetch data from the multi-instance server
-            remote_logs, remote_threats = self._fetch_aggregated_data()
+            with self.profiler.stage('_fetch_aggregated_data'):
+                remote_logs, remote_threats = self._fetch_aggregated_data()
             
             # Fetch instance information
-            instances = self._fetch_instances_data()
+            with self.profiler.stage('_fetch_instances_data'):
+                instances = self._fetch_instances_data()
+                for instance in instances:
+                    self.timezones.setdefault(instance.get('instance_id', ''), instance.get('timezone', 'UTC'))
             
             # Merge with local data
-            all_logs, all_threats = self._merge_local_and_remote_data(remote_logs, remote_threats)
+            with self.profiler.stage('_merge_local_and_remote_data'):
+                all_logs, all_threats = self._merge_local_and_remote_data(remote_logs, remote_threats)
         else:
             # Standalone mode - just use local data
-            all_logs = self._load_local_logs()
-            all_threats = self._load_local_threats()
+            with self.profiler.stage('_load_local_data'):
+                all_logs = self._load_local_logs()
+                all_threats = self._load_local_threats()
         
         # Sort logs by timestamp
-        all_logs = self._sort_logs_by_timestamp(all_logs)
+        with self.profiler.stage('_sort_logs_by_timestamp'):
+            all_logs = self._sort_logs_by_timestamp(all_logs)
+        
+        # Local IP datasets, attached to the recalculated threats
+        with self.profiler.stage('load_enricher'):
+            self.enricher = load_enricher()
         
         # Recalculate threats based on aggregated data
-        recalculated_threats = self._recalculate_threats(all_logs)
+        with self.profiler.stage('_recalculate_threats'):
+            recalculated_threats = self._recalculate_threats(all_logs)
+        
+        # Group new logs into sessions, and count them per threat
+        with self.profiler.stage('_update_sessions'):
+            sessions = self._update_sessions(all_logs)
+            for threat in recalculated_threats:
+                threat["session_count"] = sessions.ip_sessions.get(threat["ip"], 0)
         
         # Save aggregated data
-        self._save_aggregated_data(all_logs, recalculated_threats, instances)
+        with self.profiler.stage('_save_aggregated_data'):
+            self._save_aggregated_data(all_logs, recalculated_threats, instances, sessions)
         
+        AGGREGATE_LATENCY.observe(time.perf_counter() - start)
+        AGGREGATE_LOGS.set(len(all_logs))
+        AGGREGATE_THREATS.set(len(recalculated_threats))
         print(f"[INFO] Aggregation complete: {len(all_logs)} logs, {len(recalculated_threats)} unique IPs")
 
-def main():
+def main(argv: Optional[List[str]] = None):
     import argparse
     
     parser = argparse.ArgumentParser(description='Melissae Multi-Instance Data Aggregator')
     parser.add_argument('--config', help='Config file path')
+    add_profile_argument(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     aggregator = MultiInstanceAggregator(args.config)
+    aggregator.profiler.start(profile_mode(args.profile))
     aggregator.aggregate()
+    aggregator.profiler.finish()
+    flush_to_file(METRICS, "multiAggregator")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,15 +4,26 @@ import os
 import json
 import time
 import uuid
+import zlib
 import socket
 import hashlib
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, List, Optional
 import urllib.request
 import urllib.parse
 import ssl
+from jsonIO import loads, dumps, load_file, iter_records
+from spool import Spool, SEGMENT_BYTES, MAX_SPOOL_BYTES
+from sourceCursors import LogWindow, pack_hashes, unpack_hashes
+
+UPLOAD_CONCURRENCY = 4
+
+# Seconds an uploaded batch may stay queued on the server before the agent gives up and keeps its segment (agent.ingest_timeout)
+INGEST_TIMEOUT = 120
 
 class MelissaeConfig:
     def __init__(self, config_path: str = None):
@@ -38,7 +49,11 @@ class MelissaeConfig:
                 "server_url": "",
                 "api_key": "",
                 "sync_interval": 60,
-                "timeout": 30
+                "timeout": 30,
+                "spool": True,
+                "spool_max_mb": MAX_SPOOL_BYTES // (1024 * 1024),
+                "batch_kb": SEGMENT_BYTES // 1024,
+                "upload_concurrency": UPLOAD_CONCURRENCY
             },
             "timezone": "UTC"
         }
@@ -70,14 +85,14 @@ class MelissaeAgent:
         self.working_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.logs_path = os.path.join(self.working_dir, 'dashboard/json/logs.json')
         self.threats_path = os.path.join(self.working_dir, 'dashboard/json/threats.json')
+        self.spool = None
         
     def _read_json_file(self, file_path: str) -> List[Dict]:
         if not os.path.exists(file_path):
             return []
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
+            data = load_file(file_path)
+            return data if isinstance(data, list) else []
         except (json.JSONDecodeError, IOError):
             return []
     
@@ -101,7 +116,11 @@ class MelissaeAgent:
         
         return instance_data
     
-    def _send_data(self, data: Dict, retry_count: int = 0) -> bool:
+    def _send_data(self, data: Dict) -> bool:
+        return self._post_data(data) is not None
+    
+    def _post_data(self, data: Dict, retry_count: int = 0) -> Optional[Dict]:
+        """POST an upload to /api/data, return the server's answer once accepted, None on failure"""
         server_url = self.config.get('agent.server_url')
         api_key = self.config.get('agent.api_key')
         timeout = self.config.get('agent.timeout', 30)
@@ -109,17 +128,17 @@ class MelissaeAgent:
         
         if not server_url or not api_key:
             print(f"[ERROR] Missing server configuration")
-            return False
+            return None
         
         # Validate data size before sending
         try:
-            json_data = json.dumps(data).encode('utf-8')
+            json_data = dumps(data)
             if len(json_data) > 10 * 1024 * 1024:  # 10MB limit
                 print(f"[ERROR] Data too large ({len(json_data)} bytes)")
-                return False
+                return None
         except Exception as e:
             print(f"[ERROR] Failed to serialize data: {e}")
-            return False
+            return None
         
         try:
             # Prepare request with additional security headers
@@ -143,74 +162,217 @@ class MelissaeAgent:
             with urllib.request.urlopen(req, timeout=timeout, context=ssl_context) as response:
                 response_data = response.read().decode('utf-8')
                 
-                if response.getcode() == 200:
+                if response.getcode() in (200, 202):
                     try:
-                        response_json = json.loads(response_data)
-                        if response_json.get('status') == 'success':
+                        response_json = loads(response_data)
+                        if response_json.get('status') in ('success', 'accepted'):
                             print(f"[INFO] Data sent successfully to server")
-                            return True
+                            return response_json
                         else:
                             print(f"[ERROR] Server rejected data: {response_json.get('error', 'unknown')}")
-                            return False
+                            return None
                     except json.JSONDecodeError:
                         print(f"[ERROR] Invalid response from server")
-                        return False
+                        return None
                 elif response.getcode() == 429:  # Rate limited
                     if retry_count < max_retries:
                         wait_time = min(60, 2 ** retry_count)  # Exponential backoff, max 60s
                         print(f"[WARN] Rate limited, waiting {wait_time}s before retry")
                         time.sleep(wait_time)
-                        return self._send_data(data, retry_count + 1)
+                        return self._post_data(data, retry_count + 1)
                     else:
                         print(f"[ERROR] Rate limited after {max_retries} retries")
-                        return False
+                        return None
                 else:
                     print(f"[ERROR] Server returned status {response.getcode()}: {response_data}")
-                    return False
+                    return None
                     
         except urllib.error.HTTPError as e:
             error_msg = e.read().decode('utf-8') if e.fp else str(e)
             if e.code == 401:
                 print(f"[ERROR] Authentication failed - check API key")
-            elif e.code == 429 and retry_count < max_retries:
-                wait_time = min(60, 2 ** retry_count)
-                print(f"[WARN] Rate limited (HTTP {e.code}), waiting {wait_time}s before retry")
+            elif e.code in (429, 503) and retry_count < max_retries:
+                # A full ingest queue says when to come back
+                retry_after = e.headers.get('Retry-After', '')
+                wait_time = min(60, int(retry_after) if retry_after.isdigit() else 2 ** retry_count)
+                print(f"[WARN] {'Rate limited' if e.code == 429 else 'Server busy'} (HTTP {e.code}), waiting {wait_time}s before retry")
                 time.sleep(wait_time)
-                return self._send_data(data, retry_count + 1)
+                return self._post_data(data, retry_count + 1)
             else:
                 print(f"[ERROR] HTTP error {e.code}: {error_msg}")
-            return False
+            return None
         except urllib.error.URLError as e:
             if retry_count < max_retries:
                 wait_time = min(30, 5 * (retry_count + 1))  # Linear backoff for network errors
                 print(f"[WARN] Network error: {e.reason}, retrying in {wait_time}s")
                 time.sleep(wait_time)
-                return self._send_data(data, retry_count + 1)
+                return self._post_data(data, retry_count + 1)
             else:
                 print(f"[ERROR] Network error after {max_retries} retries: {e.reason}")
-                return False
+                return None
         except socket.timeout:
             if retry_count < max_retries:
                 print(f"[WARN] Request timeout, retrying ({retry_count + 1}/{max_retries})")
-                return self._send_data(data, retry_count + 1)
+                return self._post_data(data, retry_count + 1)
             else:
                 print(f"[ERROR] Request timeout after {max_retries} retries")
-                return False
+                return None
         except Exception as e:
             print(f"[ERROR] Unexpected error sending data: {e}")
-            return False
+            return None
+    
+    def _wait_stored(self, ingest_id: str) -> bool:
+        """Poll /api/ingest until the server stored an accepted upload, False if it failed, was lost or is still queued"""
+        # 202 only means the body is queued in the server's memory, a crash or a failed job would lose it
+        url = f"{self.config.get('agent.server_url', '').rstrip('/')}/api/ingest?id={urllib.parse.quote(ingest_id)}"
+        headers = {
+            'Authorization': f"Bearer {self.config.get('agent.api_key')}",
+            'User-Agent': 'Melissae-Agent/1.0'
+        }
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        
+        deadline = time.monotonic() + float(self.config.get('agent.ingest_timeout', INGEST_TIMEOUT))
+        delay = 0.1
+        while True:
+            try:
+                req = urllib.request.Request(url, headers=headers)
+                with urllib.request.urlopen(req, timeout=self.config.get('agent.timeout', 30), context=ssl_context) as response:
+                    status = loads(response.read())
+            except urllib.error.HTTPError as e:
+                # 404: the server restarted before storing it
+                print(f"[WARN] Upload {ingest_id[:8]} status unavailable (HTTP {e.code}), its batch will be sent again")
+                return False
+            except (urllib.error.URLError, socket.timeout, ValueError) as e:
+                print(f"[WARN] Failed to check upload {ingest_id[:8]}: {e}")
+                return False
+            
+            if status.get('status') == 'stored':
+                return True
+            if status.get('status') == 'failed':
+                print(f"[ERROR] Server failed to store upload {ingest_id[:8]}: {status.get('error', 'unknown')}")
+                return False
+            if time.monotonic() + delay > deadline:
+                print(f"[WARN] Upload {ingest_id[:8]} still {status.get('status')}, its batch will be sent again")
+                return False
+            time.sleep(delay)
+            delay = min(2.0, delay * 2)
+    
+    def _get_spool(self) -> Spool:
+        if self.spool is None:
+            spool_dir = self.config.get('agent.spool_dir') or os.path.join(self.working_dir, 'multi-instance-spool')
+            self.spool = Spool(
+                spool_dir,
+                segment_bytes=int(self.config.get('agent.batch_kb', SEGMENT_BYTES // 1024)) * 1024,
+                max_bytes=int(self.config.get('agent.spool_max_mb', MAX_SPOOL_BYTES // (1024 * 1024))) * 1024 * 1024
+            )
+        return self.spool
+    
+    def _spool_new_data(self) -> int:
+        """Append logs not spooled yet and changed threats to the spool, return how many records were added"""
+        spool = self._get_spool()
+        cursor = spool.cursor
+        digests = spool.state.setdefault('threats', {})
+        
+        # Logs inside the window are told apart by their hash (see LogWindow)
+        # (a cursor from before the window only knows its watermark, the logs at it are sent again and deduplicated by the server)
+        window = LogWindow(cursor.get('window_start', cursor.get('watermark', '')), unpack_hashes(cursor.get('hashes', '')))
+        state = {'total': cursor.get('total', 0)}
+        
+        def new_records():
+            if os.path.exists(self.logs_path):
+                for log in window.unseen(iter_records(self.logs_path)):
+                    state['total'] += 1
+                    yield {"log": log}
+            
+            # Threats are re-sent when any of their fields changed
+            if os.path.exists(self.threats_path):
+                for threat in iter_records(self.threats_path):
+                    ip = threat.get('ip')
+                    digest = zlib.crc32(dumps(threat))
+                    if ip and digests.get(ip) != digest:
+                        digests[ip] = digest
+                        yield {"threat": threat}
+        
+        added = spool.append(new_records())
+        spool.seal()
+        # The cursor only moves once the records it covers are synced to disk
+        cursor.clear()
+        cursor.update({
+            'window_start': window.start,
+            'hashes': pack_hashes(window.hashes),
+            'total': state['total']
+        })
+        spool.save_state()
+        spool.enforce_cap()
+        return added
+    
+    def _batch_payload(self, seq: int, records: List[Dict]) -> Dict:
+        spool = self._get_spool()
+        return {
+            "instance_id": self.config.get('instance_id'),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timezone": self.config.get('timezone', 'UTC'),
+            "hostname": socket.gethostname(),
+            "batch": {"spool": spool.state['id'], "seq": seq},
+            "logs": [record["log"] for record in records if "log" in record],
+            "threats": [record["threat"] for record in records if "threat" in record],
+            "stats": {
+                "log_count": spool.cursor.get('total', 0),
+                "threat_count": len(spool.state.get('threats', {}))
+            }
+        }
+    
+    def _flush_spool(self) -> bool:
+        """Upload sealed segments, several in flight, each one deleted once the server stored it"""
+        spool = self._get_spool()
+        segments = spool.segments()
+        if not segments:
+            return True
+        
+        failed = threading.Event()
+        
+        def upload(segment) -> bool:
+            seq, path = segment
+            # After a failure the remaining segments wait for the next run, in order
+            if failed.is_set():
+                return False
+            records = spool.read_segment(path)
+            if records:
+                response = self._post_data(self._batch_payload(seq, records))
+                # The segment is only deleted once the batch is on the server's disk, a resent batch is deduplicated by its seq
+                if response is None or (response.get('ingest_id') and not self._wait_stored(response['ingest_id'])):
+                    failed.set()
+                    return False
+            spool.ack(path)
+            return True
+        
+        concurrency = max(1, int(self.config.get('agent.upload_concurrency', UPLOAD_CONCURRENCY)))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            sent = sum(pool.map(upload, segments))
+        
+        if sent < len(segments):
+            print(f"[WARN] Uploaded {sent}/{len(segments)} spooled batches, the rest is kept for the next run")
+        elif len(segments) > 1:
+            print(f"[INFO] Uploaded {sent} spooled batches")
+        return sent == len(segments)
     
     def run_once(self) -> bool:
         print(f"[INFO] Collecting data from instance {self.config.get('instance_id')[:8]}...")
-        data = self._prepare_data()
-        return self._send_data(data)
+        if not self.config.get('agent.spool', True):
+            data = self._prepare_data()
+            return self._send_data(data)
+        
+        self._spool_new_data()
+        return self._flush_spool()
     
     def run_daemon(self):
         interval = self.config.get('agent.sync_interval', 60)
         print(f"[INFO] Starting Melissae Agent (sync every {interval}s)")
         
+        # Failures never stop the agent, new data keeps being spooled until the server is back
         consecutive_failures = 0
-        max_failures = 10
         
         while True:
             try:
@@ -225,11 +387,6 @@ class MelissaeAgent:
                     backoff_multiplier = min(consecutive_failures, 5)  # Cap at 5x
                     sleep_time = interval * backoff_multiplier
                     print(f"[WARN] {consecutive_failures} consecutive failures, waiting {sleep_time}s")
-                    
-                    if consecutive_failures >= max_failures:
-                        print(f"[ERROR] {max_failures} consecutive failures, stopping agent")
-                        break
-                        
                     time.sleep(sleep_time)
                 else:
                     time.sleep(interval)
@@ -241,22 +398,18 @@ class MelissaeAgent:
                 consecutive_failures += 1
                 print(f"[ERROR] Agent error: {e}")
                 
-                if consecutive_failures >= max_failures:
-                    print(f"[ERROR] Too many errors, stopping agent")
-                    break
-                    
                 # Sleep with exponential backoff
                 backoff_time = min(300, 30 * consecutive_failures)  # Max 5 minutes
                 print(f"[INFO] Waiting {backoff_time}s before retry")
                 time.sleep(backoff_time)
 
-def main():
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(description='Melissae Multi-Instance Agent')
     parser.add_argument('--config', help='Config file path')
     parser.add_argument('--once', action='store_true', help='Run once and exit')
     parser.add_argument('--daemon', action='store_true', help='Run as daemon')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     config = MelissaeConfig(args.config)
     agent = MelissaeAgent(config)
@@ -1,18 +1,60 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import sys
 import json
 import time
+import signal
+import socket
 import hashlib
 import hmac
 from datetime import datetime, timezone, timedelta
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 import threading
 import ipaddress
 import logging
+from eventStream import EventBroadcaster, IngestTracker, StreamFilter
+from metrics import MetricsRegistry, SIZE_BUCKETS, CONTENT_TYPE
+from jsonIO import loads, dumps, load_file, dump_file, iter_records
+from ipIndex import IPIndex, DEFAULT_LIMIT
+from ingestQueue import IngestQueue, IngestError, INGEST_WORKERS, INGEST_QUEUE, RETRY_AFTER
+from sharedState import FileLock, SharedEventLog, WorkerMetrics
+from blocklist import FeedReader, FORMATS, FEEDS_DIR, SOURCES, diff, feed_formats
+
+# Metrics, served on /metrics
+METRICS = MetricsRegistry()
+HTTP_REQUESTS = METRICS.counter('melissae_http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'code'))
+RATE_LIMITED = METRICS.counter('melissae_rate_limited_total', 'Requests rejected by the rate limiter')
+POST_BYTES = METRICS.histogram('melissae_post_body_bytes', 'Size of instance uploads', buckets=SIZE_BUCKETS)
+POST_DECODE = METRICS.histogram('melissae_post_decode_seconds', 'Time to decode instance uploads')
+INGEST_LOGS = METRICS.counter('melissae_ingest_logs_total', 'Logs received in instance uploads', ('instance',))
+INGEST_EVENTS = METRICS.counter('melissae_ingest_events_total', 'New logs and verdict changes ingested', ('instance',))
+AGGREGATED_LATENCY = METRICS.histogram('melissae_aggregated_seconds', 'Time to build /api/aggregated')
+AGGREGATED_LOGS = METRICS.counter('melissae_aggregated_logs_total', 'Logs read while aggregating instances')
+AGGREGATED_DUPLICATES = METRICS.counter('melissae_aggregated_duplicates_total', 'Logs dropped as duplicates while aggregating')
+IP_INDEX_BUILD = METRICS.histogram('melissae_ip_index_build_seconds', 'Time to rebuild the IP index after new uploads')
+INGEST_QUEUED = METRICS.gauge('melissae_ingest_queued', 'Uploads accepted and waiting for a worker')
+INGEST_REJECTED = METRICS.counter('melissae_ingest_rejected_total', 'Uploads refused because the ingest queue was full')
+INGEST_LATENCY = METRICS.histogram('melissae_ingest_seconds', 'Time from accepting an upload to storing it')
+# Spooled batches remembered per instance, a batch acked again after a lost response is not stored twice
+ACKED_BATCHES = 1000
+
+# Batch logs kept per instance by default (server.max_instance_logs), the oldest go first
+MAX_INSTANCE_LOGS = 1000000
+# <instance>.ndjson is compacted each time it doubled since the last compaction, and never below this size
+COMPACT_MIN_BYTES = 16 * 1024 * 1024
+
+# Seconds a stream token is accepted, EventSource cannot send the API key in a header
+STREAM_TOKEN_TTL = 300
+
+# Query strings are left out of the request log, they may carry tokens
+QUERY_STRING = re.compile(r'\?[^\s"]*')
+
+ROUTES = {'/api/status', '/api/instances', '/api/aggregated', '/api/threats', '/api/logs', '/api/stream', '/api/stream/token', '/api/data', '/api/ingest', '/api/feeds', '/metrics'}
 
 class MelissaeServerHandler(BaseHTTPRequestHandler):
     def __init__(self, *args, server_instance=None, **kwargs):
@@ -22,9 +64,12 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         client_ip = self.client_address[0]
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{timestamp}] {client_ip} - {format % args}")
+        print(f"[{timestamp}] {client_ip} - {QUERY_STRING.sub('', format % args)}")
     
-    def _send_response(self, code: int, data: Dict = None, content_type: str = 'application/json'):
+    def _send_response(self, code: int, data: Dict = None, content_type: str = 'application/json', body: bytes = None, headers: Dict = None):
+        route = urlparse(self.path).path
+        HTTP_REQUESTS.inc(self.command, route if route in ROUTES else 'other', str(code))
+        
         # Security headers
         self.send_response(code)
         self.send_header('Content-Type', content_type)
@@ -32,6 +77,8 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
         self.send_header('X-Frame-Options', 'DENY')
         self.send_header('X-XSS-Protection', '1; mode=block')
         self.send_header('Server', 'Melissae-MultiInstance/1.0')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         
         # CORS headers (restrictive)
         allowed_origins = self.server_instance.config.get('server.allowed_origins', ['http://localhost:9999'])
@@ -45,52 +92,140 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
         self.end_headers()
         
         if data:
-            response_data = json.dumps(data).encode('utf-8')
-            self.wfile.write(response_data)
+            self.wfile.write(dumps(data))
+        elif body:
+            self.wfile.write(body)
     
     def _rate_limit_check(self) -> bool:
         """Simple rate limiting based on client IP"""
         client_ip = self.client_address[0]
         current_time = time.time()
         
-        # Clean old entries (older than 1 minute)
-        cutoff_time = current_time - 60
-        self.server_instance.rate_limits = {
-            ip: times for ip, times in self.server_instance.rate_limits.items()
-            if any(t > cutoff_time for t in times)
-        }
-        
-        # Update rate limit for current IP
-        if client_ip not in self.server_instance.rate_limits:
-            self.server_instance.rate_limits[client_ip] = []
-        
-        # Remove old timestamps for this IP
-        self.server_instance.rate_limits[client_ip] = [
-            t for t in self.server_instance.rate_limits[client_ip] if t > cutoff_time
-        ]
-        
-        # Check if rate limit exceeded (max 60 requests per minute)
-        if len(self.server_instance.rate_limits[client_ip]) >= 60:
-            return False
-        
-        # Add current timestamp
-        self.server_instance.rate_limits[client_ip].append(current_time)
-        return True
+        with self.server_instance.rate_limit_lock:
+            # Clean old entries (older than 1 minute)
+            cutoff_time = current_time - 60
+            self.server_instance.rate_limits = {
+                ip: times for ip, times in self.server_instance.rate_limits.items()
+                if any(t > cutoff_time for t in times)
+            }
+            
+            # Update rate limit for current IP
+            if client_ip not in self.server_instance.rate_limits:
+                self.server_instance.rate_limits[client_ip] = []
+            
+            # Remove old timestamps for this IP
+            self.server_instance.rate_limits[client_ip] = [
+                t for t in self.server_instance.rate_limits[client_ip] if t > cutoff_time
+            ]
+            
+            # Check if rate limit exceeded (max 60 requests per minute by default)
+            # Pre-forked workers each see a share of a client's connections, so each enforces a share of the limit
+            max_requests = self.server_instance.config.get('server', {}).get('rate_limit', 60)
+            max_requests = -(-max_requests // self.server_instance.workers)
+            if len(self.server_instance.rate_limits[client_ip]) >= max_requests:
+                RATE_LIMITED.inc()
+                return False
+            
+            # Add current timestamp
+            self.server_instance.rate_limits[client_ip].append(current_time)
+            return True
     
     def _authenticate(self) -> bool:
         """Enhanced authentication with timing attack protection"""
         auth_header = self.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
+        if auth_header.startswith('Bearer '):
+            token = auth_header[7:]
+        else:
             # Use constant time comparison to prevent timing attacks
             hmac.compare_digest("dummy", "dummy")
             return False
         
-        token = auth_header[7:]
         expected_token = self.server_instance.config.get('server', {}).get('api_key', '')
         
         # Constant time comparison
         return hmac.compare_digest(token, expected_token)
     
+    def _authenticate_feeds(self) -> bool:
+        """API key, or the read-only server.feeds_key given to enforcement points"""
+        if self._authenticate():
+            return True
+        feeds_key = self.server_instance.config.get('server', {}).get('feeds_key', '')
+        auth_header = self.headers.get('Authorization', '')
+        if not feeds_key or not auth_header.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(auth_header[7:].encode('utf-8'), feeds_key.encode('utf-8'))
+    
+    def _not_modified(self, etag: str) -> bool:
+        # If-None-Match may list several tags, weak ones included
+        header = self.headers.get('If-None-Match', '')
+        tags = [tag.strip() for tag in header.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        return '*' in tags or etag in tags
+
+    def _send_feed(self, query: Dict):
+        """Blocklist feed index, full body or changes since a version, with ETags"""
+        source = query.get('source', ['aggregated'])[0]
+        if source not in SOURCES:
+            self._send_response(400, {"error": "Invalid source"})
+            return
+        reader = self.server_instance.feeds[source]
+        name = query.get('name', [''])[0]
+        if not name:
+            self._send_response(200, reader.index())
+            return
+        feed = reader.feed(name)
+        if feed is None:
+            self._send_response(404, {"error": "Unknown feed"})
+            return
+        headers = {'Cache-Control': 'no-cache'}
+
+        since = query.get('since', [''])[0]
+        if since:
+            try:
+                since = int(since)
+            except ValueError:
+                self._send_response(400, {"error": "Invalid since"})
+                return
+            # The id the client got with version since, a client of a reset state gets the full feed
+            feed_id = query.get('id', [''])[0]
+            stale = '-full' if feed_id and feed_id != feed['id'] else ''
+            headers['ETag'] = f'"{feed["id"]}-{name}-{feed["version"]}-since-{since}{stale}"'
+            if self._not_modified(headers['ETag']):
+                self._send_response(304, headers=headers)
+                return
+            self._send_response(200, diff(feed, since, feed_id), headers=headers)
+            return
+
+        fmt = query.get('format', ['txt'])[0]
+        if fmt not in feed_formats(name):
+            self._send_response(400, {"error": "Invalid format"})
+            return
+        headers['ETag'] = f'"{feed["id"]}-{name}-{fmt}-{feed["version"]}"'
+        if self._not_modified(headers['ETag']):
+            self._send_response(304, headers=headers)
+            return
+        # The version may have moved on since feed(), the body carries its own
+        feed, body = reader.body(name, fmt)
+        headers['ETag'] = f'"{feed["id"]}-{name}-{fmt}-{feed["version"]}"'
+        self._send_response(200, content_type=FORMATS[fmt][1], body=body, headers=headers)
+
+    def _send_stream(self, query: Dict):
+        """Server-sent events stream of newly ingested logs and verdict changes"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('X-Content-Type-Options', 'nosniff')
+        self.send_header('Server', 'Melissae-MultiInstance/1.0')
+        allowed_origins = self.server_instance.config.get('server.allowed_origins', ['http://localhost:9999'])
+        origin = self.headers.get('Origin', '')
+        if origin in allowed_origins:
+            self.send_header('Access-Control-Allow-Origin', origin)
+        self.end_headers()
+        
+        stream_filter = StreamFilter.from_query(query)
+        self.server_instance.broadcaster.stream_to(self.wfile, stream_filter, self.headers.get('Last-Event-ID', ''))
+    
     def _validate_request_size(self, max_size: int = 10 * 1024 * 1024) -> bool:
         """Validate request size to prevent DoS attacks"""
         content_length = self.headers.get('Content-Length')
@@ -116,6 +251,7 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
                 return
             
             parsed_path = urlparse(self.path)
+            self.server_instance.refresh_instances()
             
             if parsed_path.path == '/api/status':
                 self._send_response(200, {
@@ -135,6 +271,7 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
                         "instance_id": instance_id,
                         "hostname": data.get('hostname', ''),
                         "last_seen": last_seen,
+                        "timezone": data.get('timezone', 'UTC'),
                         "stats": data.get('stats', {})
                     })
                 
@@ -145,7 +282,9 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
                     return
                 
                 try:
+                    start = time.perf_counter()
                     logs, threats = self.server_instance.get_aggregated_data()
+                    AGGREGATED_LATENCY.observe(time.perf_counter() - start)
                     self._send_response(200, {
                         "logs": logs,
                         "threats": threats,
@@ -158,6 +297,64 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
                 except Exception as e:
                     print(f"[ERROR] Failed to get aggregated data: {e}")
                     self._send_response(500, {"error": "Internal server error"})
+            elif parsed_path.path in ('/api/threats', '/api/logs'):
+                if not self._authenticate():
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                
+                query = parse_qs(parsed_path.query)
+                cidr = query.get('cidr', [''])[0]
+                if not cidr:
+                    self._send_response(400, {"error": "Missing cidr parameter"})
+                    return
+                try:
+                    limit = int(query.get('limit', [DEFAULT_LIMIT])[0])
+                    result = self.server_instance.get_ip_index().query(cidr, parsed_path.path[5:], limit)
+                except ValueError:
+                    self._send_response(400, {"error": "Invalid cidr or limit"})
+                    return
+                self._send_response(200, result)
+            elif parsed_path.path == '/api/ingest':
+                if not self._authenticate():
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                
+                ingest_id = parse_qs(parsed_path.query).get('id', [''])[0]
+                if not ingest_id:
+                    self._send_response(200, self.server_instance.ingest.stats())
+                    return
+                status = self.server_instance.ingest.status(ingest_id)
+                if status is None:
+                    self._send_response(404, {"error": "Unknown ingest id"})
+                    return
+                self._send_response(200, status)
+            elif parsed_path.path == '/api/stream/token':
+                if not self._authenticate():
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                
+                token, expires = self.server_instance.issue_token('stream', STREAM_TOKEN_TTL)
+                self._send_response(200, {"token": token, "expires": expires}, headers={'Cache-Control': 'no-store'})
+            elif parsed_path.path == '/api/stream':
+                # EventSource cannot send headers: a short-lived token that only opens the stream, never the API key
+                query = parse_qs(parsed_path.query)
+                if not self.server_instance.check_token('stream', query.get('token', [''])[0]):
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                
+                self._send_stream(query)
+            elif parsed_path.path == '/api/feeds':
+                if not self._authenticate_feeds():
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                
+                self._send_feed(parse_qs(parsed_path.query))
+            elif parsed_path.path == '/metrics':
+                if not self._authenticate():
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                
+                self._send_response(200, content_type=CONTENT_TYPE, body=self.server_instance.render_metrics().encode('utf-8'))
             else:
                 self._send_response(404, {"error": "Not found"})
                 
@@ -191,24 +388,21 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
                         return
                     
                     post_data = self.rfile.read(content_length)
-                    
-                    # Validate JSON format
-                    try:
-                        data = json.loads(post_data.decode('utf-8'))
-                    except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                        print(f"[ERROR] Invalid JSON data: {e}")
-                        self._send_response(400, {"error": "Invalid JSON format"})
+                    if len(post_data) < content_length:
+                        self._send_response(400, {"error": "Truncated request"})
                         return
+                    POST_BYTES.observe(len(post_data))
                     
-                    # Validate required fields
-                    if not isinstance(data, dict) or 'instance_id' not in data:
-                        self._send_response(400, {"error": "Missing required fields"})
+                    # Decoding and storing happen on the ingest workers, the agent only waits for the body to be queued
+                    ingest = self.server_instance.ingest
+                    job, duplicate = ingest.submit(post_data, self.headers.get('X-Instance-ID', ''))
+                    INGEST_QUEUED.set(ingest.depth())
+                    if job is None:
+                        INGEST_REJECTED.inc()
+                        self._send_response(503, {"error": "Ingest queue full"}, headers={'Retry-After': str(RETRY_AFTER)})
                         return
                     
-                    if self.server_instance.store_instance_data(data):
-                        self._send_response(200, {"status": "success"})
-                    else:
-                        self._send_response(400, {"error": "Invalid data"})
+                    self._send_response(202, {"status": "accepted", "ingest_id": job.id, "checksum": job.checksum, "duplicate": duplicate})
                         
                 except Exception as e:
                     print(f"[ERROR] Processing POST data: {e}")
@@ -220,19 +414,57 @@ class MelissaeServerHandler(BaseHTTPRequestHandler):
             print(f"[ERROR] POST request error: {e}")
             self._send_response(500, {"error": "Internal server error"})
 
+# Listening socket shared by the pre-forked workers, the kernel spreads incoming connections between them
+class ReusePortHTTPServer(ThreadingHTTPServer):
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
 class MelissaeServer:
-    def __init__(self, config_path: str = None):
+    def __init__(self, config_path: str = None, data_dir: str = None, worker: int = None, epoch: str = ''):
         self.config_path = config_path or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'multi-instance.json')
         self.working_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.data_dir = os.path.join(self.working_dir, 'multi-instance-data')
+        self.data_dir = data_dir or os.path.join(self.working_dir, 'multi-instance-data')
         self.config = self._load_config()
-        self.instances = {}
-        self.rate_limits = {}  # For rate limiting
-        self._load_instance_data()
         
         # Create data directory with secure permissions
         os.makedirs(self.data_dir, exist_ok=True)
         os.chmod(self.data_dir, 0o750)  # rwxr-x---
+        
+        # Worker slot when running as one of several pre-forked processes, None for a single process
+        self.worker = worker
+        self.workers = max(1, int(self.config.get('server', {}).get('workers', 1))) if worker is not None else 1
+        self.instances = {}
+        self.instances_stamp = None
+        # Stamp of each instance file when the ingest tracker last matched it (pre-forked workers)
+        self.instance_stamps = {}
+        self.rate_limits = {}  # For rate limiting
+        self.rate_limit_lock = threading.Lock()
+        self.broadcaster = EventBroadcaster(epoch=epoch)
+        self.ingest_tracker = IngestTracker()
+        # IP index over the aggregated data, rebuilt on the first query after an upload
+        self.data_version = 0
+        self.ip_index = None
+        self.index_building = False
+        self.index_lock = threading.Lock()
+        if worker is None:
+            self.store_lock = threading.Lock()
+            self.events = self.broadcaster
+            self.worker_metrics = None
+        else:
+            # Stores are serialized across workers, events and metrics go through the data directory
+            self.store_lock = FileLock(os.path.join(self.data_dir, '.store.lock'))
+            self.events = SharedEventLog(os.path.join(self.data_dir, 'events.ndjson'), self.broadcaster)
+            self.worker_metrics = WorkerMetrics(METRICS, os.path.join(self.data_dir, 'metrics'), f'worker-{worker}')
+        self.ingest = IngestQueue(
+            self.ingest_upload,
+            workers=int(self.config.get('server', {}).get('ingest_workers', INGEST_WORKERS)),
+            capacity=int(self.config.get('server', {}).get('ingest_queue', INGEST_QUEUE)),
+            status_dir=os.path.join(self.data_dir, 'ingest') if worker is not None else ''
+        )
+        # Blocklist feeds written by threatIntel.py and multiAggregator.py
+        self.feeds = {source: FeedReader(os.path.join(FEEDS_DIR, source)) for source in SOURCES}
+        self._load_instance_data()
     
     def _load_config(self) -> Dict:
         if os.path.exists(self.config_path):
@@ -240,23 +472,80 @@ class MelissaeServer:
                 return json.load(f)
         return {}
     
+    @staticmethod
+    def _file_stamp(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def _instances_stamp(self):
+        return self._file_stamp(os.path.join(self.data_dir, 'instances.json'))
+    
     def _load_instance_data(self):
         instances_file = os.path.join(self.data_dir, 'instances.json')
+        self.instances_stamp = self._instances_stamp()
         if os.path.exists(instances_file):
             try:
-                with open(instances_file, 'r') as f:
-                    self.instances = json.load(f)
+                self.instances = load_file(instances_file)
             except (json.JSONDecodeError, IOError):
                 self.instances = {}
     
     def _save_instance_data(self):
         instances_file = os.path.join(self.data_dir, 'instances.json')
         try:
-            with open(instances_file, 'w') as f:
-                json.dump(self.instances, f, indent=2)
+            dump_file(self.instances, instances_file)
+            self.instances_stamp = self._instances_stamp()
         except IOError as e:
             print(f"[ERROR] Failed to save instance data: {e}")
     
+    def refresh_instances(self):
+        """Pick up uploads stored by the other workers, instances.json is rewritten on each one"""
+        if self.worker is None or self._instances_stamp() == self.instances_stamp:
+            return
+        self._load_instance_data()
+        self.data_version += 1
+    
+    def issue_token(self, scope: str, ttl: int) -> tuple:
+        """(token, expiry) granting one scope only, signed with the API key so every worker can check it"""
+        expires = int(time.time()) + ttl
+        return f"{expires}.{self._token_signature(scope, expires)}", expires
+    
+    def check_token(self, scope: str, token: str) -> bool:
+        expires, _, signature = token.partition('.')
+        if not expires.isdigit() or int(expires) < time.time() or not self.config.get('server', {}).get('api_key'):
+            return False
+        return hmac.compare_digest(signature.encode('utf-8'), self._token_signature(scope, int(expires)).encode('ascii'))
+    
+    def _token_signature(self, scope: str, expires: int) -> str:
+        api_key = self.config.get('server', {}).get('api_key', '')
+        return hmac.new(api_key.encode('utf-8'), f"{scope}:{expires}".encode('utf-8'), hashlib.sha256).hexdigest()
+    
+    def render_metrics(self) -> str:
+        return self.worker_metrics.render() if self.worker_metrics else METRICS.render()
+    
+    def ingest_upload(self, job) -> None:
+        """Decode, validate and store one queued upload, run by the ingest workers"""
+        try:
+            start = time.perf_counter()
+            data = loads(job.body)
+            POST_DECODE.observe(time.perf_counter() - start)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"[ERROR] Invalid JSON data: {e}")
+            raise IngestError("Invalid JSON format")
+        
+        # Validate required fields
+        if not isinstance(data, dict) or 'instance_id' not in data:
+            raise IngestError("Missing required fields")
+        
+        try:
+            if not self.store_instance_data(data):
+                raise IngestError("Invalid data")
+        finally:
+            INGEST_QUEUED.set(self.ingest.depth())
+            INGEST_LATENCY.observe(time.time() - job.received)
+    
     def store_instance_data(self, data: Dict) -> bool:
         try:
             instance_id = data.get('instance_id')
@@ -265,22 +554,60 @@ class MelissaeServer:
             
             # Store current timestamp
             data['last_seen'] = datetime.now(timezone.utc).isoformat()
-            
-            # Update instances registry
-            self.instances[instance_id] = {
-                'hostname': data.get('hostname', ''),
-                'last_seen': data['last_seen'],
-                'timezone': data.get('timezone', 'UTC'),
-                'stats': data.get('stats', {})
-            }
-            
-            # Save individual instance data
             instance_file = os.path.join(self.data_dir, f'{instance_id}.json')
-            with open(instance_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            batch = data.get('batch')
+            if batch is not None and not (isinstance(batch, dict) and isinstance(batch.get('seq'), int) and isinstance(batch.get('spool'), str)):
+                return False
             
-            self._save_instance_data()
-            print(f"[INFO] Stored data from instance {instance_id[:8]}...")
+            with self.store_lock:
+                if self.worker is not None:
+                    # Another worker may have stored uploads since, start from what is on disk when it changed
+                    self.refresh_instances()
+                    stamp = self._file_stamp(instance_file)
+                    if stamp is None or stamp != self.instance_stamps.get(instance_id) or not self.ingest_tracker.is_tracked(instance_id):
+                        self._seed_ingest_tracker(instance_id, instance_file)
+                        self.instance_stamps[instance_id] = stamp
+                    # Uploads of one agent can reach different workers, an older full upload must not replace a newer one
+                    stored_at = self.instances.get(instance_id, {}).get('timestamp', '')
+                    if batch is None and stored_at and data.get('timestamp', '') < stored_at:
+                        print(f"[INFO] Skipped an upload from instance {instance_id[:8]}... older than the stored one")
+                        return True
+                elif not self.ingest_tracker.is_tracked(instance_id):
+                    # First upload since start: what is already on disk is not new
+                    self._seed_ingest_tracker(instance_id, instance_file)
+                
+                if batch is not None:
+                    if not self._merge_batch(instance_id, data, instance_file):
+                        print(f"[INFO] Batch {batch['seq']} from instance {instance_id[:8]}... already stored")
+                        return True
+                else:
+                    # Save individual instance data, a full upload replaces any spooled logs
+                    dump_file(data, instance_file)
+                    if os.path.exists(self._batch_logs_file(instance_id)):
+                        os.remove(self._batch_logs_file(instance_id))
+                
+                # Update instances registry
+                self.instances[instance_id] = {
+                    'hostname': data.get('hostname', ''),
+                    'timestamp': data.get('timestamp', ''),
+                    'last_seen': data['last_seen'],
+                    'timezone': data.get('timezone', 'UTC'),
+                    'stats': data.get('stats', {})
+                }
+                
+                self._save_instance_data()
+                self.data_version += 1
+                if self.worker is not None:
+                    # This upload is published to the tracker below, only another worker's write needs a re-seed
+                    self.instance_stamps[instance_id] = self._file_stamp(instance_file)
+            
+            published = self.ingest_tracker.publish(
+                self.events, instance_id, data.get('hostname', ''),
+                data.get('logs', []), data.get('threats', []), fresh=batch is not None
+            )
+            INGEST_LOGS.inc(instance_id, amount=len(data.get('logs', [])))
+            INGEST_EVENTS.inc(instance_id, amount=published)
+            print(f"[INFO] Stored data from instance {instance_id[:8]}... ({published} new events)")
             
             return True
             
@@ -288,22 +615,112 @@ class MelissaeServer:
             print(f"[ERROR] Failed to store instance data: {e}")
             return False
     
+    def _batch_logs_file(self, instance_id: str) -> str:
+        return os.path.join(self.data_dir, f'{instance_id}.ndjson')
+    
+    def _merge_batch(self, instance_id: str, data: Dict, instance_file: str) -> bool:
+        """Store a spooled batch, False when it was already stored"""
+        stored = {}
+        if os.path.exists(instance_file):
+            try:
+                stored = load_file(instance_file)
+            except (json.JSONDecodeError, IOError):
+                stored = {}
+        batch_id = f"{data['batch']['spool']}:{data['batch']['seq']}"
+        acked = stored.get('batches', [])
+        if batch_id in acked:
+            return False
+        
+        # Logs are appended to <instance>.ndjson, logs of an earlier full upload are moved there once
+        logs_file = self._batch_logs_file(instance_id)
+        with open(logs_file, 'ab') as f:
+            for log in stored.pop('logs', []) + data.get('logs', []):
+                f.write(dumps(log) + b'\n')
+            size = f.tell()
+        # A new agent spool sends its logs again, duplicates and the oldest logs are dropped once the file doubled
+        if size > max(COMPACT_MIN_BYTES, 2 * stored.get('logs_compacted', 0)):
+            stored['logs_compacted'] = self._compact_batch_logs(instance_id, logs_file)
+        
+        # Batches may arrive out of order, a threat only replaces one from an older batch of the same spool
+        threats = {threat.get('ip'): threat for threat in stored.get('threats', [])}
+        threat_batches = stored.get('threat_batches', {})
+        spool, seq = data['batch']['spool'], data['batch']['seq']
+        for threat in data.get('threats', []):
+            ip = threat.get('ip')
+            previous = threat_batches.get(ip)
+            if previous and previous[0] == spool and previous[1] > seq:
+                continue
+            threats[ip] = threat
+            threat_batches[ip] = [spool, seq]
+        
+        stored.update({
+            'instance_id': instance_id,
+            'hostname': data.get('hostname', ''),
+            'timezone': data.get('timezone', 'UTC'),
+            'timestamp': data.get('timestamp', ''),
+            'last_seen': data['last_seen'],
+            'stats': data.get('stats', {}),
+            'threats': list(threats.values()),
+            'threat_batches': threat_batches,
+            'batches': (acked + [batch_id])[-ACKED_BATCHES:]
+        })
+        dump_file(stored, instance_file)
+        return True
+    
+    def _compact_batch_logs(self, instance_id: str, logs_file: str) -> int:
+        """Rewrite batch logs without duplicates, keeping the newest server.max_instance_logs, return the new size"""
+        max_logs = int(self.config.get('server', {}).get('max_instance_logs', MAX_INSTANCE_LOGS))
+        lines = {}
+        total = 0
+        with open(logs_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    continue
+                total += 1
+                try:
+                    log = loads(line)
+                except json.JSONDecodeError:
+                    continue
+                lines[line] = (log.get('date', ''), log.get('hour', ''))
+        kept = sorted(lines, key=lines.get)[-max_logs:] if max_logs > 0 else []
+        temp_path = f"{logs_file}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.writelines(kept)
+            size = f.tell()
+        os.replace(temp_path, logs_file)
+        print(f"[INFO] Compacted logs of instance {instance_id[:8]}...: {total} -> {len(kept)}")
+        return size
+    
+    def _seed_ingest_tracker(self, instance_id: str, instance_file: str):
+        previous = {}
+        if os.path.exists(instance_file):
+            try:
+                previous = load_file(instance_file)
+            except (json.JSONDecodeError, IOError):
+                previous = {}
+        self.ingest_tracker.seed(instance_id, previous.get('logs', []), previous.get('threats', []))
+    
     def get_aggregated_data(self) -> tuple:
         all_logs = []
         all_threats = []
         seen_logs = set()
         seen_threats = set()
+        log_count = 0
         
         # Load data from all instances
-        for instance_id in self.instances.keys():
+        for instance_id in list(self.instances):
             instance_file = os.path.join(self.data_dir, f'{instance_id}.json')
             if os.path.exists(instance_file):
                 try:
-                    with open(instance_file, 'r') as f:
-                        data = json.load(f)
+                    data = load_file(instance_file)
+                    logs = data.get('logs', [])
+                    logs_file = self._batch_logs_file(instance_id)
+                    if os.path.exists(logs_file):
+                        logs = logs + list(iter_records(logs_file))
                     
                     # Process logs
-                    for log in data.get('logs', []):
+                    log_count += len(logs)
+                    for log in logs:
                         # Add instance metadata
                         log_with_instance = log.copy()
                         log_with_instance['instance_id'] = instance_id
@@ -337,35 +754,156 @@ class MelissaeServer:
                 except (json.JSONDecodeError, IOError) as e:
                     print(f"[ERROR] Failed to load data for instance {instance_id}: {e}")
         
+        AGGREGATED_LOGS.inc(amount=log_count)
+        AGGREGATED_DUPLICATES.inc(amount=log_count - len(all_logs))
+        
         # Sort by timestamp
         all_logs.sort(key=lambda x: f"{x.get('date', '')} {x.get('hour', '')}")
         
         return all_logs, all_threats
     
+    def get_ip_index(self) -> IPIndex:
+        """Current IP index, queries keep the previous one while a newer one is built in the background"""
+        with self.index_lock:
+            if self.ip_index is None:
+                # Nothing to serve yet, the first query waits for the build
+                self.ip_index = self._build_ip_index()
+            elif self.ip_index.version != self.data_version and not self.index_building:
+                self.index_building = True
+                threading.Thread(target=self._rebuild_ip_index, daemon=True).start()
+            return self.ip_index
+    
+    def _build_ip_index(self) -> IPIndex:
+        version = self.data_version
+        start = time.perf_counter()
+        logs, threats = self.get_aggregated_data()
+        timezones = {instance_id: data.get('timezone', 'UTC') for instance_id, data in list(self.instances.items())}
+        index = IPIndex(logs, threats, version, timezones)
+        IP_INDEX_BUILD.observe(time.perf_counter() - start)
+        return index
+    
+    def _rebuild_ip_index(self):
+        # Uploads landing during the build leave the index behind, the next query starts another one
+        try:
+            index = self._build_ip_index()
+            with self.index_lock:
+                self.ip_index = index
+        except Exception as e:
+            print(f"[ERROR] Failed to rebuild the IP index: {e}")
+        finally:
+            with self.index_lock:
+                self.index_building = False
+    
+    def create_http_server(self, host: str, port: int, reuse_port: bool = False) -> ThreadingHTTPServer:
+        def handler(*args, **kwargs):
+            return MelissaeServerHandler(*args, server_instance=self, **kwargs)
+        
+        server = (ReusePortHTTPServer if reuse_port else ThreadingHTTPServer)((host, port), handler)
+        server.daemon_threads = True
+        return server
+    
     def start_server(self):
         host = self.config.get('server', {}).get('host', '0.0.0.0')
         port = self.config.get('server', {}).get('port', 8888)
+        workers = int(self.config.get('server', {}).get('workers', 1))
+        if workers > 1:
+            run_workers(self.config_path, self.data_dir, host, port, workers)
+            return
         
-        def handler(*args, **kwargs):
-            return MelissaeServerHandler(*args, server_instance=self, **kwargs)
-        
+        # Stopped by systemd or docker with SIGTERM, queued uploads are stored before exiting as on Ctrl-C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
         try:
-            server = HTTPServer((host, port), handler)
+            server = self.create_http_server(host, port)
             print(f"[INFO] Melissae Multi-Instance Server starting on {host}:{port}")
             print(f"[INFO] API Key: {self.config.get('server', {}).get('api_key', 'NOT_SET')}")
             server.serve_forever()
         except KeyboardInterrupt:
-            print("\n[INFO] Server stopped by user")
+            print("\n[INFO] Server stopped")
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            if self.ingest.depth():
+                print(f"[INFO] Storing {self.ingest.depth()} queued uploads")
+            self.ingest.drain()
         except Exception as e:
             print(f"[ERROR] Server error: {e}")
 
-def main():
+# Seconds a worker must stay up before a crash restarts it right away
+WORKER_MIN_UPTIME = 5
+
+def _serve_worker(config_path: str, data_dir: str, host: str, port: int, slot: int, epoch: str) -> None:
+    # The supervisor stops workers with SIGTERM, queued uploads are stored before exiting
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server = MelissaeServer(config_path, data_dir, worker=slot, epoch=epoch)
+    httpd = server.create_http_server(host, port, reuse_port=True)
+    print(f"[INFO] Worker {slot} (pid {os.getpid()}) serving on {host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        server.ingest.drain()
+        if server.worker_metrics:
+            server.worker_metrics.flush()
+
+def run_workers(config_path: str, data_dir: str, host: str, port: int, workers: int) -> None:
+    """Pre-fork workers sharing the port through SO_REUSEPORT, and restart the ones that crash"""
+    # One epoch for every worker, so stream cursors stay valid whichever worker a client reconnects to
+    epoch = format(int(time.time()), 'x')
+    SharedEventLog.reset(os.path.join(data_dir, 'events.ndjson'))
+    children = {}
+    
+    def spawn(slot: int) -> None:
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _serve_worker(config_path, data_dir, host, port, slot, epoch)
+            except BaseException as e:
+                print(f"[ERROR] Worker {slot} failed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        children[pid] = (slot, time.monotonic())
+    
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"[INFO] Melissae Multi-Instance Server starting {workers} workers on {host}:{port}")
+    try:
+        for slot in range(workers):
+            spawn(slot)
+        while True:
+            pid, status = os.wait()
+            slot, started = children.pop(pid, (None, 0))
+            if slot is None:
+                continue
+            print(f"[WARN] Worker {slot} (pid {pid}) exited with status {status}, restarting")
+            # A worker crashing on start would otherwise be restarted in a tight loop
+            if time.monotonic() - started < WORKER_MIN_UPTIME:
+                time.sleep(WORKER_MIN_UPTIME)
+            spawn(slot)
+    except KeyboardInterrupt:
+        print("\n[INFO] Server stopped, waiting for workers to store queued uploads")
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                continue
+
+def main(argv: Optional[List[str]] = None):
     import argparse
     
     parser = argparse.ArgumentParser(description='Melissae Multi-Instance Server')
     parser.add_argument('--config', help='Config file path')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     server = MelissaeServer(args.config)
     server.start_server()
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from metrics import METRICS_DIR
+
+# Paths
+PROFILE_LOG = os.path.join(METRICS_DIR, 'profile.ndjson')
+PROFILE_DIR = os.path.join(METRICS_DIR, 'profiles')
+
+PROFILE_ENV = 'MELISSAE_PROFILE'
+PROFILE_MODES = ('timing', 'cprofile')
+
+def profile_mode(flag: Optional[str] = None) -> str:
+    """--profile wins over MELISSAE_PROFILE, empty when profiling is off"""
+    value = (flag if flag is not None else os.environ.get(PROFILE_ENV, '')).strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return ''
+    return 'cprofile' if value == 'cprofile' else 'timing'
+
+def add_profile_argument(parser) -> None:
+    parser.add_argument('--profile', nargs='?', const='timing', choices=PROFILE_MODES,
+                        help=f'Time each stage (and dump cProfile stats with "cprofile"), also enabled by {PROFILE_ENV}')
+
+# Wall time, CPU time and peak traced memory per named stage, stages can be nested
+class StageProfiler:
+    def __init__(self, script: str):
+        self.script = script
+        self.mode = ''
+        self.stages = {}
+        self.stack = []
+        self.profile = None
+        # Imported by start(), a run without profiling does not pay for them
+        self.tracemalloc = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.mode)
+
+    def start(self, mode: str) -> None:
+        if not mode:
+            return
+        self.mode = mode
+        self.started = datetime.now(timezone.utc)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.peak = 0
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        tracemalloc.start()
+        if mode == 'cprofile':
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def _fold_peak(self) -> int:
+        # The peak since the last reset belongs to every running stage
+        current, peak = self.tracemalloc.get_traced_memory()
+        for frame in self.stack:
+            frame['peak'] = max(frame['peak'], peak)
+        self.peak = max(self.peak, peak)
+        self.tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.mode:
+            yield
+            return
+        current = self._fold_peak()
+        frame = {'name': '/'.join([f['name'] for f in self.stack] + [name]), 'peak': current, 'current': current}
+        self.stack.append(frame)
+        stats = self.stages.setdefault(frame['name'], {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_bytes': 0, 'net_bytes': 0})
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            current = self._fold_peak()
+            self.stack.pop()
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+            stats['peak_bytes'] = max(stats['peak_bytes'], frame['peak'])
+            stats['net_bytes'] += current - frame['current']
+
+    def finish(self) -> Optional[Dict]:
+        """Stop profiling and append this run to metrics/profile.ndjson"""
+        if not self.mode:
+            return None
+        if self.profile:
+            self.profile.disable()
+        self._fold_peak()
+        self.tracemalloc.stop()
+
+        record = {
+            "script": self.script,
+            "started": self.started.isoformat(),
+            "mode": self.mode,
+            "wall": round(time.perf_counter() - self.wall, 6),
+            "cpu": round(time.process_time() - self.cpu, 6),
+            "peak_bytes": self.peak,
+            "stages": [
+                dict(name=name, calls=stats['calls'], wall=round(stats['wall'], 6), cpu=round(stats['cpu'], 6),
+                     peak_bytes=stats['peak_bytes'], net_bytes=stats['net_bytes'])
+                for name, stats in self.stages.items()
+            ]
+        }
+        try:
+            if self.profile:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                record["cprofile"] = os.path.join(PROFILE_DIR, f"{self.script}-{self.started.strftime('%Y%m%dT%H%M%S')}.prof")
+                self.profile.dump_stats(record["cprofile"])
+            os.makedirs(os.path.dirname(PROFILE_LOG), exist_ok=True)
+            with open(PROFILE_LOG, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        except IOError as e:
+            print(f"[WARN] Failed to write profile {PROFILE_LOG}: {e}")
+
+        print(f"[PROFILE] {self.script}: {record['wall']:.3f}s wall, {record['cpu']:.3f}s cpu, peak {record['peak_bytes'] / 1024 ** 2:.1f} MiB")
+        for stage in record["stages"]:
+            print(f"[PROFILE]   {stage['name']:<40} {stage['wall']:>9.3f}s {stage['cpu']:>9.3f}s {stage['peak_bytes'] / 1024 ** 2:>8.1f} MiB")
+        self.mode = ''
+        return record
@@ -0,0 +1,309 @@
+import os
+import re
+import json
+import time
+import heapq
+import hashlib
+import calendar
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+from jsonIO import load_file, dump_file
+from sourceCursors import SourceCursors
+
+# Paths
+WORKING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSIONS_OUTPUT = os.path.join(WORKING_DIR, 'dashboard/json/sessions.json')
+SESSIONS_STATE = os.path.join(WORKING_DIR, 'dashboard/json/sessions-state.json')
+
+STATE_VERSION = 3
+
+# A session ends after this many seconds without events from the same (ip, protocol, instance)
+SESSION_GAP = 30 * 60
+
+# Closed sessions kept, and items kept per list in a session (counts are never capped)
+MAX_CLOSED = 50000
+MAX_ITEMS = 100
+
+LOCAL_INSTANCE = 'local'
+
+# Actions written by logParser.py that are not SSH commands
+SSH_NON_COMMANDS = ('Login successful', 'Login failed', 'Connection closed')
+FTP_TRANSFER = re.compile(r"^(?P<type>Upload|Download) of '(?P<file>.*)' \((?P<size>\d+) bytes\)$")
+
+# Timestamps
+@lru_cache(maxsize=4096)
+def _day_epoch(date: str) -> int:
+    return calendar.timegm((int(date[:4]), int(date[5:7]), int(date[8:10]), 0, 0, 0))
+
+@lru_cache(maxsize=65536)
+def event_time(date: str, hour: str) -> int:
+    """Epoch seconds of a "YYYY-MM-DD" "HH:MM:SS" pair, without strptime"""
+    return _day_epoch(date) + int(hour[:2]) * 3600 + int(hour[3:5]) * 60 + int(hour[6:8])
+
+@lru_cache(maxsize=65536)
+def utc_event_time(date: str, hour: str, timezone_name: str = 'UTC') -> int:
+    """Epoch seconds of a "YYYY-MM-DD" "HH:MM:SS" pair logged in a named timezone, UTC when it is unknown"""
+    second = event_time(date, hour)
+    if not timezone_name or timezone_name == 'UTC':
+        return second
+    try:
+        # Only instances outside UTC need pytz, imported here to keep it off the startup path
+        import pytz
+        offset = pytz.timezone(timezone_name).utcoffset(datetime(*time.gmtime(second)[:6]))
+    except (ImportError, KeyError):
+        return second
+    return second - int(offset.total_seconds())
+
+def format_time(second: int) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(second))
+
+# One attacker session, updated one event at a time
+class Session:
+    __slots__ = ('ip', 'protocol', 'instance', 'first', 'last', 'events', 'counts', 'credentials', 'commands', 'files', 'paths', 'shells')
+
+    def __init__(self, ip: str, protocol: str, instance: str, first: int):
+        self.ip = ip
+        self.protocol = protocol
+        self.instance = instance
+        self.first = first
+        self.last = first
+        self.events = 0
+        self.counts = {}
+        # user -> [failed, successful]
+        self.credentials = {}
+        self.commands = []
+        self.files = []
+        self.paths = []
+        # Shell session ids written by modules/ssh/conf/session.sh
+        self.shells = []
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self.ip, self.protocol, self.instance
+
+    @property
+    def session_id(self) -> str:
+        raw = f"{self.ip}|{self.protocol}|{self.instance}|{self.first}"
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+    def _count(self, name: str) -> None:
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def add(self, entry: Dict, second: int) -> None:
+        self.events += 1
+        if second > self.last:
+            self.last = second
+        elif second < self.first:
+            self.first = second
+
+        action = entry.get('action', '')
+        user = entry.get('user')
+        if action == 'Login successful' or action == 'Login failed':
+            success = action == 'Login successful'
+            self._count('logins_success' if success else 'logins_failed')
+            if user:
+                tried = self.credentials.get(user)
+                if tried is None and len(self.credentials) < MAX_ITEMS:
+                    tried = self.credentials[user] = [0, 0]
+                if tried is not None:
+                    tried[success] += 1
+            return
+
+        if self.protocol == 'ssh':
+            shell = entry.get('session')
+            if shell and shell not in self.shells and len(self.shells) < MAX_ITEMS:
+                self.shells.append(shell)
+            if action in SSH_NON_COMMANDS:
+                self._count('disconnects')
+                return
+            self._count('commands')
+            if len(self.commands) < MAX_ITEMS:
+                self.commands.append(action)
+        elif self.protocol == 'ftp':
+            match = FTP_TRANSFER.match(action)
+            if not match:
+                self._count('connections')
+                return
+            self._count('uploads' if match.group('type') == 'Upload' else 'downloads')
+            if len(self.files) < MAX_ITEMS:
+                self.files.append({"type": match.group('type').lower(), "file": match.group('file'), "size": int(match.group('size'))})
+        elif self.protocol == 'http':
+            self._count('requests')
+            path = entry.get('path')
+            if path and path not in self.paths and len(self.paths) < MAX_ITEMS:
+                self.paths.append(path)
+        elif self.protocol == 'modbus':
+            lowered = action.lower()
+            self._count('writes' if 'write' in lowered else 'reads' if 'read' in lowered else 'other')
+        else:
+            self._count('other')
+
+    def to_record(self, is_open: bool = False) -> Dict:
+        """Compact record for the dashboard, lists are only present when not empty"""
+        record = {
+            "id": self.session_id,
+            "ip": self.ip,
+            "protocol": self.protocol,
+            "instance": self.instance,
+            "start": format_time(self.first),
+            "end": format_time(self.last),
+            "duration": self.last - self.first,
+            "events": self.events,
+            "counts": self.counts,
+            "open": is_open
+        }
+        if self.credentials:
+            record["credentials"] = [{"user": user, "failed": tried[0], "successful": tried[1]} for user, tried in self.credentials.items()]
+        if self.commands:
+            record["commands"] = self.commands
+        if self.files:
+            record["files"] = self.files
+        if self.paths:
+            record["paths"] = self.paths
+        if self.shells:
+            record["shells"] = self.shells
+        return record
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Session':
+        session = cls(data['ip'], data['protocol'], data['instance'], data['first'])
+        for slot in cls.__slots__:
+            setattr(session, slot, data[slot])
+        return session
+
+# Incremental sessionization: open sessions by key, an expiry heap ordered by deadline, closed sessions in end order
+class SessionTracker:
+    def __init__(self, gap: int = SESSION_GAP):
+        self.gap = gap
+        self.open = {}
+        self.heap = []
+        self.closed = []
+        self.total = 0
+        # Latest event time seen, sessions expire against it rather than against the wall clock
+        self.clock = 0
+        # Entries already folded from each source file
+        self.cursors = SourceCursors()
+        # ip -> sessions started, still counting the closed sessions trimmed past MAX_CLOSED
+        self.ip_sessions = {}
+
+    def expire(self, now: int) -> int:
+        """Close every open session idle for more than the gap at time now"""
+        closed = 0
+        heap = self.heap
+        while heap and heap[0][0] < now:
+            deadline, key = heapq.heappop(heap)
+            session = self.open.get(key)
+            if session is None:
+                continue
+            # Heap entries are not updated on each event, a stale deadline is pushed back once
+            if session.last + self.gap >= now:
+                heapq.heappush(heap, (session.last + self.gap, key))
+                continue
+            del self.open[key]
+            self.closed.append(session)
+            closed += 1
+        if len(self.closed) > MAX_CLOSED:
+            del self.closed[:len(self.closed) - MAX_CLOSED]
+        return closed
+
+    def add(self, entry: Dict, second: Optional[int] = None) -> None:
+        ip = entry.get('ip')
+        if not ip:
+            return
+        if second is None:
+            second = event_time(entry.get('date', ''), entry.get('hour', ''))
+        if second > self.clock:
+            self.clock = second
+            self.expire(second)
+
+        key = (ip, entry.get('protocol', ''), entry.get('instance_id', LOCAL_INSTANCE))
+        session = self.open.get(key)
+        if session is None:
+            session = self.open[key] = Session(key[0], key[1], key[2], second)
+            heapq.heappush(self.heap, (second + self.gap, key))
+            self.ip_sessions[ip] = self.ip_sessions.get(ip, 0) + 1
+        session.add(entry, second)
+        self.total += 1
+
+    def update(self, sorted_logs: List[Dict]) -> int:
+        """Fold new entries in time order, return how many were added"""
+        # An entry older than the clock still joins its session while that one is open
+        added = 0
+        for entry in sorted_logs:
+            try:
+                self.add(entry, event_time(entry.get('date', ''), entry.get('hour', '')))
+            except ValueError:
+                continue
+            added += 1
+        return added
+
+    def records(self) -> List[Dict]:
+        """Closed then open sessions, ordered by start"""
+        records = [session.to_record() for session in self.closed]
+        records.extend(session.to_record(True) for session in self.open.values())
+        records.sort(key=lambda record: record['start'])
+        return records
+
+    def to_sessions(self) -> Dict:
+        """Render the document consumed by the dashboard"""
+        return {
+            "version": STATE_VERSION,
+            "gap": self.gap,
+            "total_events": self.total,
+            "open": len(self.open),
+            "sessions": self.records()
+        }
+
+    def to_state(self) -> Dict:
+        return {
+            "version": STATE_VERSION,
+            "gap": self.gap,
+            "total": self.total,
+            "clock": self.clock,
+            "open": [session.to_dict() for session in self.open.values()],
+            "closed": [session.to_dict() for session in self.closed],
+            "ip_sessions": self.ip_sessions,
+            "sources": self.cursors.cursors
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict, gap: int = SESSION_GAP) -> 'SessionTracker':
+        tracker = cls(gap)
+        if state.get('version') != STATE_VERSION or state.get('gap') != gap:
+            return tracker
+        tracker.total = state['total']
+        tracker.clock = state['clock']
+        for data in state['open']:
+            session = Session.from_dict(data)
+            tracker.open[session.key] = session
+        tracker.heap = [(session.last + gap, key) for key, session in tracker.open.items()]
+        heapq.heapify(tracker.heap)
+        tracker.closed = [Session.from_dict(data) for data in state['closed']]
+        tracker.ip_sessions = state['ip_sessions']
+        tracker.cursors = SourceCursors(state['sources'])
+        return tracker
+
+# Sessions persistence
+def load_tracker(state_path: str = SESSIONS_STATE) -> SessionTracker:
+    if not os.path.exists(state_path):
+        return SessionTracker()
+    try:
+        return SessionTracker.from_state(load_file(state_path))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, IOError):
+        return SessionTracker()
+
+def save_sessions(tracker: SessionTracker, sessions_path: str = SESSIONS_OUTPUT) -> None:
+    dump_file(tracker.to_sessions(), sessions_path)
+
+def update_sessions(sorted_logs: List[Dict], sources: Dict, sessions_path: str = SESSIONS_OUTPUT, state_path: str = SESSIONS_STATE) -> SessionTracker:
+    """Fold the entries of a time-sorted log list read past the tracker's source cursors (see SourceCursors.advance)"""
+    tracker = load_tracker(state_path)
+    new = tracker.cursors.advance(sources)
+    tracker.update([entry for entry in sorted_logs if id(entry) in new])
+    dump_file(tracker.to_state(), state_path)
+    save_sessions(tracker, sessions_path)
+    return tracker
@@ -0,0 +1,169 @@
+import os
+import json
+import glob
+import time
+import fcntl
+import threading
+from typing import Dict, List, Tuple
+from eventStream import EventBroadcaster
+from metrics import MetricsRegistry, merge_snapshots, render_snapshot
+from jsonIO import loads, dumps
+
+# State shared by the pre-forked server workers, kept in the data directory
+
+# Event log rotated past this size, the previous file is kept as <log>.1
+EVENT_LOG_BYTES = 16 * 1024 * 1024
+# Seconds between two reads of the events published by the other workers
+FOLLOW_INTERVAL = 0.25
+# Seconds between two metrics snapshots of a worker
+METRICS_INTERVAL = 10
+
+# Lock held by one thread of one process at a time: a thread lock, then flock on a file shared by the workers
+class FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o640)
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except OSError:
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+# Events of every worker in one append-only file, each worker replays it into its own broadcaster
+# Sequence numbers are assigned under the file lock, so "<epoch>-<seq>" ids mean the same event on every worker
+class SharedEventLog:
+    def __init__(self, path: str, broadcaster: EventBroadcaster, max_bytes: int = EVENT_LOG_BYTES):
+        self.path = path
+        self.broadcaster = broadcaster
+        self.max_bytes = max_bytes
+        self.lock = FileLock(f"{path}.lock")
+        self.read_lock = threading.Lock()
+        self.file = None
+        self.pending = b''
+        self.last_seq = 0
+        self.follow()
+        threading.Thread(target=self._follow_loop, daemon=True).start()
+
+    @staticmethod
+    def reset(path: str) -> None:
+        """Start a new log, done by the supervisor before forking workers with a new epoch"""
+        for stale in (path, f"{path}.1"):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    def _read(self) -> bytes:
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return b''
+            self.file = open(self.path, 'rb')
+        data = self.file.read()
+        # Rotated by another worker: finish the old file, then continue with the new one
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            data += self.file.read()
+            self.file.close()
+            self.file = open(self.path, 'rb')
+            data += self.file.read()
+        return data
+
+    def follow(self) -> None:
+        """Replay the events appended since the last read into the local broadcaster"""
+        with self.read_lock:
+            lines = (self.pending + self._read()).split(b'\n')
+            self.pending = lines.pop()
+            events = []
+            for line in lines:
+                header, _, payload = line.partition(b'\t')
+                try:
+                    seq, event_type, protocol, instance, verdict = loads(header)
+                except (ValueError, TypeError):
+                    continue
+                if seq <= self.last_seq:
+                    continue
+                self.last_seq = seq
+                # The first line of a rotated log only carries the sequence reached
+                if event_type:
+                    events.append((seq, event_type, payload, protocol, instance, verdict))
+            if events:
+                self.broadcaster.append_frames(events)
+
+    def _follow_loop(self) -> None:
+        while True:
+            time.sleep(FOLLOW_INTERVAL)
+            try:
+                self.follow()
+            except OSError as e:
+                print(f"[WARN] Failed to read shared events: {e}")
+
+    def publish_many(self, batch: List[Tuple[str, Dict, str, str, str]]) -> None:
+        """Same interface as EventBroadcaster.publish_many, events reach every worker"""
+        if not batch:
+            return
+        payloads = [dumps(data) for _, data, _, _, _ in batch]
+        with self.lock:
+            self.follow()
+            with self.read_lock:
+                seq = self.last_seq
+                lines = []
+                events = []
+                for (event_type, _, protocol, instance, verdict), payload in zip(batch, payloads):
+                    seq += 1
+                    lines.append(dumps([seq, event_type, protocol, instance, verdict]) + b'\t' + payload + b'\n')
+                    events.append((seq, event_type, payload, protocol, instance, verdict))
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+                    lines.insert(0, dumps([self.last_seq, '', '', '', '']) + b'\t{}\n')
+                with open(self.path, 'ab') as f:
+                    f.write(b''.join(lines))
+                # Our own lines are skipped rather than parsed back
+                self._read()
+                self.last_seq = seq
+                self.broadcaster.append_frames(events)
+
+# Metrics of a worker are written to <dir>/<name>.json, /metrics on any worker sums them all
+class WorkerMetrics:
+    def __init__(self, registry: MetricsRegistry, metrics_dir: str, name: str):
+        self.registry = registry
+        self.metrics_dir = metrics_dir
+        self.path = os.path.join(metrics_dir, f"{name}.json")
+        os.makedirs(metrics_dir, exist_ok=True)
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def flush(self) -> None:
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(METRICS_INTERVAL)
+            try:
+                self.flush()
+            except IOError as e:
+                print(f"[WARN] Failed to write metrics {self.path}: {e}")
+
+    def render(self) -> str:
+        # Counters and histograms add up, gauges keep the last worker read
+        total = {}
+        for path in sorted(glob.glob(os.path.join(self.metrics_dir, '*.json'))):
+            if path == self.path:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    total = merge_snapshots(total, json.load(f))
+            except (IOError, json.JSONDecodeError):
+                continue
+        return render_snapshot(merge_snapshots(total, self.registry.snapshot()))
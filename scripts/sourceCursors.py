@@ -0,0 +1,106 @@
+import os
+import zlib
+import base64
+import hashlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from jsonIO import dumps
+
+# Bytes read to fingerprint a source by its first line
+HEAD_BYTES = 4096
+
+def file_stamp(path: str) -> Dict:
+    """Identity of a source file: inode, size and checksum of its first line, taken before the file is read"""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        head = f.read(HEAD_BYTES)
+    newline = head.find(b'\n')
+    return {
+        "inode": stat.st_ino,
+        "size": stat.st_size,
+        # None until the first line is complete
+        "head": zlib.crc32(head[:newline + 1]) if newline >= 0 else None
+    }
+
+def same_file(cursor: Dict, stamp: Dict) -> bool:
+    # Rotated (new inode), truncated (smaller), or truncated then written past its old size (another first line)
+    if cursor.get('inode') != stamp['inode'] or cursor.get('size', 0) > stamp['size']:
+        return False
+    return cursor.get('head') is None or cursor['head'] == stamp['head']
+
+# How many entries of each source file were already folded, sources are append-only so the next ones are new
+# Unlike a time watermark, an entry written late or with an older timestamp is still picked up
+class SourceCursors:
+    def __init__(self, cursors: Optional[Dict[str, Dict]] = None):
+        self.cursors = cursors if cursors is not None else {}
+
+    def advance(self, sources: Dict[str, Tuple[Dict, List[Dict]]]) -> Set[int]:
+        """ids of the entries past each source's cursor, the cursors move to the end of the sources read"""
+        # sources: name -> (file_stamp() taken before reading, entries parsed in file order)
+        # A source not read this time is forgotten, it is new again if it comes back
+        new = set()
+        cursors = {}
+        for name, (stamp, entries) in sources.items():
+            cursor = self.cursors.get(name)
+            start = min(cursor['entries'], len(entries)) if cursor and same_file(cursor, stamp) else 0
+            new.update(id(entry) for entry in entries[start:])
+            cursors[name] = dict(stamp, entries=len(entries))
+        self.cursors = cursors
+        return new
+
+# Logs less than this many seconds older than the newest one seen are told apart by their hash
+# Lists rewritten in time order on each run (logs.json, full uploads) get late lines and local-time sources inside the window
+LOG_WINDOW = 24 * 3600
+
+def log_hash(log: Dict) -> int:
+    return int.from_bytes(hashlib.blake2b(dumps(log), digest_size=8).digest(), 'big')
+
+def pack_hashes(hashes: Iterable[int]) -> str:
+    return base64.b64encode(array('Q', sorted(hashes)).tobytes()).decode('ascii')
+
+def unpack_hashes(packed: str) -> array:
+    hashes = array('Q')
+    hashes.frombytes(base64.b64decode(packed))
+    return hashes
+
+def window_start(newest: str) -> str:
+    """First "date hour" key of the window ending at the newest one"""
+    try:
+        return (datetime.strptime(newest, '%Y-%m-%d %H:%M:%S') - timedelta(seconds=LOG_WINDOW)).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return ''
+
+# Hashes of the logs seen over a trailing window, for whole log lists that are read again on every run
+# Unlike a time watermark, a log that shows up later with an older timestamp is still new, as long as it is inside the window
+class LogWindow:
+    def __init__(self, start: str = '', hashes: Iterable[int] = ()):
+        self.start = start
+        self.hashes = set(hashes)
+
+    def unseen(self, logs: Iterable[Dict]) -> Iterator[Dict]:
+        """Logs not seen yet, the window moves to the newest log once they are all consumed"""
+        # ("date hour", hash) of every log inside the window, what the next list is matched against
+        window = []
+        for log in logs:
+            key = f"{log.get('date', '')} {log.get('hour', '')}"
+            # Older logs were seen by earlier runs
+            if key < self.start:
+                continue
+            digest = log_hash(log)
+            window.append((key, digest))
+            if digest in self.hashes:
+                continue
+            self.hashes.add(digest)
+            yield log
+        # An empty list leaves the window as is
+        if window:
+            self.start = max(self.start, window_start(max(key for key, _ in window)))
+            self.hashes = {digest for key, digest in window if key >= self.start}
+
+    def to_state(self) -> Dict:
+        return {"start": self.start, "hashes": pack_hashes(self.hashes)}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'LogWindow':
+        return cls(state['start'], unpack_hashes(state['hashes']))
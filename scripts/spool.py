@@ -0,0 +1,159 @@
+import os
+import glob
+import json
+import uuid
+from typing import Dict, Iterable, List, Tuple
+from jsonIO import loads, dumps, load_file, dump_file
+
+# Defaults, overridden by the agent configuration
+SEGMENT_BYTES = 1024 * 1024
+MAX_SPOOL_BYTES = 256 * 1024 * 1024
+
+STATE_VERSION = 1
+STATE_FILE = 'state.json'
+OPEN_SUFFIX = '.open'
+SEGMENT_SUFFIX = '.ndjson'
+
+# Write-ahead spool: records are appended to an open segment, sealed segments are uploaded then deleted (acked)
+class Spool:
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES, max_bytes: int = MAX_SPOOL_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.state_path = os.path.join(directory, STATE_FILE)
+        os.makedirs(directory, exist_ok=True)
+        self.state = self._load_state()
+        self.open_file = None
+
+    def _load_state(self) -> Dict:
+        state = {}
+        if os.path.exists(self.state_path):
+            try:
+                state = load_file(self.state_path)
+            except (json.JSONDecodeError, IOError):
+                state = {}
+        if state.get('version') != STATE_VERSION:
+            # A new id tells the server that segment numbers start over
+            state = {"version": STATE_VERSION, "id": uuid.uuid4().hex, "next_seq": 1, "cursor": {}}
+        # Segment numbers keep growing even when the state file was lost
+        for seq, _ in self.segments(include_open=True):
+            state['next_seq'] = max(state['next_seq'], seq + 1)
+        return state
+
+    def save_state(self) -> None:
+        """Persist the cursor, only after the records it covers were synced to a segment"""
+        dump_file(self.state, self.state_path)
+
+    @property
+    def cursor(self) -> Dict:
+        return self.state['cursor']
+
+    def _segment_path(self, seq: int, sealed: bool = True) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{'' if sealed else OPEN_SUFFIX}{SEGMENT_SUFFIX}")
+
+    def segments(self, include_open: bool = False) -> List[Tuple[int, str]]:
+        """(seq, path) of the sealed segments, oldest first"""
+        found = []
+        for path in glob.glob(os.path.join(self.directory, f"*{SEGMENT_SUFFIX}")):
+            name = os.path.basename(path)[:-len(SEGMENT_SUFFIX)]
+            is_open = name.endswith(OPEN_SUFFIX)
+            if is_open and not include_open:
+                continue
+            seq = name[:-len(OPEN_SUFFIX)] if is_open else name
+            if seq.isdigit():
+                found.append((int(seq), path))
+        return sorted(found)
+
+    # Writing
+    def append(self, records: Iterable[Dict]) -> int:
+        """Append records to the open segment, sealing it each time it reaches the segment size"""
+        count = 0
+        for record in records:
+            if self.open_file is None:
+                self._open_segment()
+            self.open_file.write(dumps(record) + b'\n')
+            count += 1
+            if self.open_file.tell() >= self.segment_bytes:
+                self.seal()
+        return count
+
+    def _open_segment(self) -> None:
+        # A segment left open by a crash is reused, its complete lines are still valid
+        existing = [path for _, path in self.segments(include_open=True) if path.endswith(OPEN_SUFFIX + SEGMENT_SUFFIX)]
+        if existing:
+            path = existing[0]
+            with open(path, 'r+b') as f:
+                data = f.read()
+                f.truncate(data.rfind(b'\n') + 1)
+        else:
+            path = self._segment_path(self.state['next_seq'], sealed=False)
+            self.state['next_seq'] += 1
+        self.open_file = open(path, 'ab')
+
+    def seal(self) -> None:
+        """Sync the open segment and make it uploadable"""
+        if self.open_file is None:
+            for _, path in self.segments(include_open=True):
+                if path.endswith(OPEN_SUFFIX + SEGMENT_SUFFIX):
+                    os.replace(path, path.replace(OPEN_SUFFIX + SEGMENT_SUFFIX, SEGMENT_SUFFIX))
+            return
+        path = self.open_file.name
+        self.open_file.flush()
+        os.fsync(self.open_file.fileno())
+        empty = self.open_file.tell() == 0
+        self.open_file.close()
+        self.open_file = None
+        if empty:
+            os.remove(path)
+        else:
+            os.replace(path, path.replace(OPEN_SUFFIX + SEGMENT_SUFFIX, SEGMENT_SUFFIX))
+
+    # Reading and acking
+    def read_segment(self, path: str) -> List[Dict]:
+        records = []
+        with open(path, 'rb') as f:
+            for line in f:
+                # A torn last line (crash while appending) is dropped
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    records.append(loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def ack(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> int:
+        total = 0
+        for _, path in self.segments(include_open=True):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                continue
+        return total
+
+    def enforce_cap(self) -> int:
+        """Drop the oldest sealed segments while the spool is over max_bytes, return how many were dropped"""
+        total = self.size()
+        dropped = 0
+        for _, path in self.segments():
+            if total <= self.max_bytes:
+                break
+            try:
+                total -= os.path.getsize(path)
+                os.remove(path)
+                dropped += 1
+            except OSError:
+                continue
+        if dropped:
+            print(f"[WARN] Spool over {self.max_bytes // (1024 * 1024)} MiB, dropped the {dropped} oldest segments")
+        return dropped
+
+    def close(self) -> None:
+        if self.open_file is not None:
+            self.seal()
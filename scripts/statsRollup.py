@@ -0,0 +1,235 @@
+import os
+import json
+import base64
+import hashlib
+import math
+from datetime import datetime, timezone
+from typing import List, Dict, Optional
+from jsonIO import load_file, dump_file
+from sourceCursors import SourceCursors
+
+# Paths
+WORKING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATS_OUTPUT = os.path.join(WORKING_DIR, 'dashboard/json/stats.json')
+STATS_STATE = os.path.join(WORKING_DIR, 'dashboard/json/stats-state.json')
+
+STATE_VERSION = 2
+
+# Retention per timeline granularity (number of buckets kept)
+RETENTION = {
+    'minute': 24 * 60,
+    'hour': 30 * 24,
+    'day': 3650
+}
+
+# Heavy-hitter fields and sketch capacity (top-N reported is smaller than capacity)
+TOP_FIELDS = ['ip', 'action', 'path', 'user-agent']
+TOP_CAPACITY = 200
+TOP_REPORTED = 10
+
+PROTOCOLS = ['ssh', 'ftp', 'http', 'modbus']
+
+# Unique IP cardinality estimation
+class HyperLogLog:
+    def __init__(self, precision: int = 12, registers: Optional[bytearray] = None):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        h = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        remainder = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        total = sum(2.0 ** -r for r in self.registers)
+        estimate = alpha * self.m * self.m / total
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict:
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HyperLogLog':
+        return cls(data['p'], bytearray(base64.b64decode(data['registers'])))
+
+# Top-N heavy hitters (Space-Saving)
+class SpaceSaving:
+    def __init__(self, capacity: int = TOP_CAPACITY, counters: Optional[Dict[str, List[int]]] = None):
+        self.capacity = capacity
+        self.counters = counters if counters is not None else {}
+
+    def add(self, item: str, count: int = 1) -> None:
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            return
+        # Evict the smallest counter, new item inherits its count as error
+        victim = min(self.counters, key=lambda k: self.counters[k][0])
+        floor = self.counters.pop(victim)[0]
+        self.counters[item] = [floor + count, floor]
+
+    def top(self, n: int = TOP_REPORTED) -> List[List]:
+        ranked = sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)
+        return [[item, counter[0]] for item, counter in ranked[:n]]
+
+    def to_dict(self) -> Dict:
+        return {"capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SpaceSaving':
+        return cls(data['capacity'], data['counters'])
+
+# Incremental rollup of parsed logs
+class StatsRollup:
+    def __init__(self):
+        self.total = 0
+        self.protocols = {p: 0 for p in PROTOCOLS}
+        self.counters = {
+            "ssh_login_success": 0,
+            "ssh_login_failed": 0,
+            "ftp_login_success": 0,
+            "ftp_login_failed": 0,
+            "modbus_reads": 0,
+            "modbus_writes": 0
+        }
+        self.hour_of_day = [0] * 24
+        self.timeline = {granularity: {} for granularity in RETENTION}
+        self.top = {field: SpaceSaving() for field in TOP_FIELDS}
+        self.unique_ips = HyperLogLog()
+        # Entries already folded from each source file
+        self.cursors = SourceCursors()
+
+    def add(self, entry: Dict) -> None:
+        protocol = entry.get('protocol', '')
+        action = entry.get('action', '')
+        date = entry.get('date', '')
+        hour = entry.get('hour', '')
+
+        self.total += 1
+        self.protocols[protocol] = self.protocols.get(protocol, 0) + 1
+
+        if protocol in ('ssh', 'ftp'):
+            if action == 'Login successful':
+                self.counters[f"{protocol}_login_success"] += 1
+            elif 'Login failed' in action:
+                self.counters[f"{protocol}_login_failed"] += 1
+        elif protocol == 'modbus':
+            if 'Read request' in action:
+                self.counters["modbus_reads"] += 1
+            if 'Write' in action:
+                self.counters["modbus_writes"] += 1
+
+        if len(hour) >= 5:
+            self.hour_of_day[int(hour[:2]) % 24] += 1
+            for granularity, key in (('minute', f"{date} {hour[:5]}"), ('hour', f"{date} {hour[:2]}"), ('day', date)):
+                bucket = self.timeline[granularity].setdefault(key, {})
+                bucket[protocol] = bucket.get(protocol, 0) + 1
+
+        for field in TOP_FIELDS:
+            value = entry.get(field)
+            if value:
+                self.top[field].add(value)
+
+        ip = entry.get('ip')
+        if ip:
+            self.unique_ips.add(ip)
+
+    def update(self, logs: List[Dict]) -> int:
+        """Fold new entries, whatever their time, return how many were added"""
+        for entry in logs:
+            self.add(entry)
+        self._trim()
+        return len(logs)
+
+    def _trim(self) -> None:
+        for granularity, keep in RETENTION.items():
+            buckets = self.timeline[granularity]
+            if len(buckets) > keep:
+                for key in sorted(buckets)[:len(buckets) - keep]:
+                    del buckets[key]
+
+    def to_stats(self) -> Dict:
+        """Render the small document consumed by the dashboard"""
+        return {
+            "version": STATE_VERSION,
+            "generated": datetime.now(timezone.utc).isoformat(),
+            "total": self.total,
+            "unique_ips": self.unique_ips.estimate(),
+            "protocols": self.protocols,
+            "counters": self.counters,
+            "hour_of_day": self.hour_of_day,
+            "timeline": self.timeline,
+            "top": {field: sketch.top() for field, sketch in self.top.items()}
+        }
+
+    def to_state(self) -> Dict:
+        return {
+            "version": STATE_VERSION,
+            "total": self.total,
+            "protocols": self.protocols,
+            "counters": self.counters,
+            "hour_of_day": self.hour_of_day,
+            "timeline": self.timeline,
+            "top": {field: sketch.to_dict() for field, sketch in self.top.items()},
+            "unique_ips": self.unique_ips.to_dict(),
+            "sources": self.cursors.cursors
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'StatsRollup':
+        rollup = cls()
+        if state.get('version') != STATE_VERSION:
+            return rollup
+        rollup.total = state['total']
+        rollup.protocols = state['protocols']
+        rollup.counters = state['counters']
+        rollup.hour_of_day = state['hour_of_day']
+        rollup.timeline = state['timeline']
+        rollup.top = {field: SpaceSaving.from_dict(data) for field, data in state['top'].items()}
+        rollup.unique_ips = HyperLogLog.from_dict(state['unique_ips'])
+        rollup.cursors = SourceCursors(state['sources'])
+        return rollup
+
+# Rollup persistence
+def load_rollup(state_path: str = STATS_STATE) -> StatsRollup:
+    if not os.path.exists(state_path):
+        return StatsRollup()
+    try:
+        return StatsRollup.from_state(load_file(state_path))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, IOError):
+        return StatsRollup()
+
+def save_stats(rollup: StatsRollup, stats_path: str = STATS_OUTPUT) -> None:
+    dump_file(rollup.to_stats(), stats_path)
+
+def save_rollup(rollup: StatsRollup, stats_path: str = STATS_OUTPUT, state_path: str = STATS_STATE) -> None:
+    dump_file(rollup.to_state(), state_path)
+    save_stats(rollup, stats_path)
+
+def update_rollup(logs: List[Dict], sources: Dict, stats_path: str = STATS_OUTPUT, state_path: str = STATS_STATE) -> List[Dict]:
+    """Fold the entries of logs read past the rollup's source cursors (see SourceCursors.advance) into the persisted rollup, return them"""
+    rollup = load_rollup(state_path)
+    new = rollup.cursors.advance(sources)
+    new_logs = [entry for entry in logs if id(entry) in new]
+    rollup.update(new_logs)
+    save_rollup(rollup, stats_path, state_path)
+    return new_logs
+
+def build_rollup(logs: List[Dict]) -> StatsRollup:
+    """One-shot rollup of a full log list, order does not matter"""
+    rollup = StatsRollup()
+    for entry in logs:
+        rollup.add(entry)
+    rollup._trim()
+    return rollup
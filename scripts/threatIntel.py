@@ -1,56 +1,170 @@
-import json
-from collections import defaultdict
+import time
 from pathlib import Path
-
-# Scoring rules by IP
-def calculate_protocol_score(ip_data):
-    http_count = 0
-    ssh_failed = False
-    ssh_success = False
-    ftp_failed = False
-    ftp_success = False
-    modbus_write = False
-    modbus_read = False
-
-    for entry in ip_data:
+from jsonIO import iter_records, dump_file
+from profiling import StageProfiler, add_profile_argument, profile_mode
+from ipEnrich import load_enricher
+from sessions import event_time, format_time
+from blocklist import update_feeds
+
+# Stage timings, enabled by --profile or MELISSAE_PROFILE
+PROFILER = StageProfiler('threatIntel')
+
+# Activity counts halve every DECAY_HALF_LIFE seconds
+DECAY_HALF_LIFE = 7 * 24 * 3600
+
+# Sliding windows in seconds, reported as peak events per window
+HTTP_WINDOW = 1
+AUTH_WINDOW = 60
+MODBUS_WINDOW = 60
+
+# Thresholds
+HTTP_DECAYED_LIMIT = 50
+HTTP_BURST = 10
+
+# Per-kind velocity: a two-bucket ring for the sliding window rate and an exponentially decayed count, O(1) per event
+class Velocity:
+    __slots__ = ('window', 'bucket', 'current', 'previous', 'peak', 'decayed', 'last')
+
+    def __init__(self, window):
+        self.window = window
+        self.bucket = -1
+        self.current = 0
+        self.previous = 0
+        self.peak = 0.0
+        self.decayed = 0.0
+        self.last = 0
+
+    def add(self, second):
+        bucket = second // self.window
+        if bucket > self.bucket:
+            self.previous = self.current if bucket == self.bucket + 1 else 0
+            self.current = 0
+            self.bucket = bucket
+        if bucket == self.bucket:
+            self.current += 1
+            # Events of the previous bucket still inside the sliding window, weighted by their overlap
+            rate = self.current + self.previous * (1 - (second % self.window + 1) / self.window) if self.previous else self.current
+            if rate > self.peak:
+                self.peak = rate
+
+        if second == self.last:
+            self.decayed += 1
+        elif second > self.last:
+            self.decayed = self.decayed * 2 ** ((self.last - second) / DECAY_HALF_LIFE) + 1
+            self.last = second
+        else:
+            # Late event: added with the decay it would have had by now
+            self.decayed += 2 ** ((second - self.last) / DECAY_HALF_LIFE)
+
+# Scoring signals by IP, updated one entry at a time so logs never need to be grouped in memory
+class IPSignals:
+    __slots__ = ('http', 'auth_failed', 'modbus', 'last_seen', 'ssh_failed', 'ssh_success', 'ftp_failed', 'ftp_success', 'modbus_write', 'modbus_read')
+
+    def __init__(self):
+        # Created on the first event of their kind, most IPs only ever use one protocol
+        self.http = None
+        self.auth_failed = None
+        self.modbus = None
+        self.last_seen = 0
+        self.ssh_failed = False
+        self.ssh_success = False
+        self.ftp_failed = False
+        self.ftp_success = False
+        self.modbus_write = False
+        self.modbus_read = False
+
+    @property
+    def http_count(self):
+        # HTTP requests, decayed to the last request: a slow crawl never adds up, a burst does
+        return self.http.decayed if self.http else 0
+
+    def add(self, entry, second=None):
         protocol = entry.get('protocol', '').upper()
         action = entry.get('action', '').lower()
+        if second is None:
+            try:
+                second = event_time(entry.get('date', ''), entry.get('hour', ''))
+            except ValueError:
+                second = self.last_seen
+        if second > self.last_seen:
+            self.last_seen = second
 
         if protocol == 'HTTP':
-            http_count += 1
+            if self.http is None:
+                self.http = Velocity(HTTP_WINDOW)
+            self.http.add(second)
         elif protocol == 'SSH':
             if 'failed' in action:
-                ssh_failed = True
+                self.ssh_failed = True
+                self._auth_failed(second)
             elif 'successful' in action:
-                ssh_success = True
+                self.ssh_success = True
         elif protocol == 'FTP':
             if 'failed' in action:
-                ftp_failed = True
+                self.ftp_failed = True
+                self._auth_failed(second)
             elif 'successful' in action:
-                ftp_success = True
+                self.ftp_success = True
         elif protocol == 'MODBUS':
+            if self.modbus is None:
+                self.modbus = Velocity(MODBUS_WINDOW)
+            self.modbus.add(second)
             if 'write' in action:
-                modbus_write = True
+                self.modbus_write = True
             elif 'read' in action:
-                modbus_read = True
+                self.modbus_read = True
 
-    # Nefarious - Multiple successful compromises or Modbus writes and one successful compromise
-    if (ssh_success and ftp_success) or (modbus_write and (ssh_success or ftp_success)):
-        return 5
+    def _auth_failed(self, second):
+        if self.auth_failed is None:
+            self.auth_failed = Velocity(AUTH_WINDOW)
+        self.auth_failed.add(second)
 
-    # Malicious - Single successful compromise or multiple protocols failed with Modbus writes
-    elif (ssh_success or ftp_success) or (modbus_write and (ssh_failed or ftp_failed)):
-        return 4
+    # Scoring rules
+    def score(self):
+        # Nefarious - Multiple successful compromises or Modbus writes and one successful compromise
+        if (self.ssh_success and self.ftp_success) or (self.modbus_write and (self.ssh_success or self.ftp_success)):
+            return 5
 
-    # Suspicious - Failed attempts or excessive HTTP or Modbus reconnaissance
-    elif http_count > 50 or ssh_failed or ftp_failed or modbus_read:
-        return 2
+        # Malicious - Single successful compromise or multiple protocols failed with Modbus writes
+        elif (self.ssh_success or self.ftp_success) or (self.modbus_write and (self.ssh_failed or self.ftp_failed)):
+            return 4
 
-    # Benign
-    else:
-        return 1
+        # Suspicious - Failed attempts or excessive HTTP or Modbus reconnaissance
+        elif self.http_count > HTTP_DECAYED_LIMIT or (self.http and self.http.peak >= HTTP_BURST) or self.ssh_failed or self.ftp_failed or self.modbus_read:
+            return 2
 
-    return 0
+        # Benign
+        else:
+            return 1
+
+    def current_score(self, score, now):
+        """Score cooled down by one verdict level per half-life since the IP was last seen"""
+        levels = (1, 2, 4, 5)
+        steps = int(max(0, now - self.last_seen) // DECAY_HALF_LIFE)
+        return levels[max(0, levels.index(score) - steps)] if score in levels else score
+
+    def threat_fields(self, score, now=None):
+        """Velocity and decay fields added to the threat entries"""
+        now = time.time() if now is None else now
+        current = self.current_score(score, now)
+        fields = {
+            "last_seen": format_time(self.last_seen),
+            "current-score": current,
+            "current-verdict": get_verdict(current)
+        }
+        velocity = {}
+        for name, counter in (('http_per_second', self.http), ('auth_failed_per_minute', self.auth_failed), ('modbus_per_minute', self.modbus)):
+            if counter:
+                velocity[name] = round(counter.peak, 2)
+        if velocity:
+            fields["velocity"] = velocity
+        return fields
+
+def calculate_protocol_score(ip_data):
+    signals = IPSignals()
+    for entry in ip_data:
+        signals.add(entry)
+    return signals.score()
 
 def get_verdict(score):
     verdicts = {
@@ -69,41 +183,55 @@ def validate_path(base_dir, relative_path):
     return full_path
 
 # Logs processing
-def process_logs(input_path, output_path):
+def process_logs(input_path, output_path, enricher=None):
     if input_path.suffix.lower() != '.json' or output_path.suffix.lower() != '.json':
         raise ValueError("Files must be in JSON format")
 
-    with input_path.open('r', encoding='utf-8') as f:
-        content = f.read().strip()
-        if not content:
-            logs = []
-        else:
-            logs = json.loads(content)
-
-    ip_data = defaultdict(list)
-    for entry in logs:
-        if not isinstance(entry, dict):
-            continue
-        ip_data[entry.get('ip', '')].append(entry)
-
-    threats = []
-    for ip, entries in ip_data.items():
-        if not ip:
-            continue
-        score = calculate_protocol_score(entries)
-        threats.append({
-            "type": "ip",
-            "ip": ip,
-            "protocol-score": score,
-            "verdict": get_verdict(score)
-        })
-
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open('w', encoding='utf-8') as f:
-        json.dump(threats, f, indent=2, ensure_ascii=False)
+    # Logs are streamed, memory only grows with the number of distinct IPs
+    signals = {}
+    with PROFILER.stage('score'):
+        for entry in iter_records(str(input_path)):
+            if not isinstance(entry, dict):
+                continue
+            ip = entry.get('ip', '')
+            if not ip:
+                continue
+            ip_signals = signals.get(ip)
+            if ip_signals is None:
+                ip_signals = signals[ip] = IPSignals()
+            ip_signals.add(entry)
+
+        threats = []
+        now = time.time()
+        for ip, ip_signals in signals.items():
+            score = ip_signals.score()
+            threat = {
+                "type": "ip",
+                "ip": ip,
+                "protocol-score": score,
+                "verdict": get_verdict(score)
+            }
+            threat.update(ip_signals.threat_fields(score, now))
+            # ASN, country and hosting provider from the local datasets
+            if enricher:
+                enricher.enrich(threat)
+            threats.append(threat)
+
+    with PROFILER.stage('json_dump'):
+        dump_file(threats, str(output_path))
+
+    with PROFILER.stage('update_feeds'):
+        update_feeds(threats, 'local')
 
 # Main
-if __name__ == "__main__":
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Melissae threat scoring')
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    PROFILER.start(profile_mode(args.profile))
+
     script_dir = Path(__file__).parent.resolve()
     base_dir = script_dir.parent
 
@@ -113,4 +241,10 @@ if __name__ == "__main__":
     input_path = validate_path(base_dir, input_rel)
     output_path = validate_path(base_dir, output_rel)
 
-    process_logs(input_path, output_path)
+    with PROFILER.stage('load_enrichment'):
+        enricher = load_enricher()
+    process_logs(input_path, output_path, enricher)
+    PROFILER.finish()
+
+if __name__ == "__main__":
+    main()